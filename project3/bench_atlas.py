@@ -0,0 +1,110 @@
+#!/bin/env python3
+"""
+Module         : bench_atlas.py
+Author         : Patrick Long
+Email          : pllong@wpi.edu
+Course         : CS 4732
+
+Description    : Compare texture atlas page counts and occupancy of the
+                 pyglet strip allocator and the MaxRects allocator
+
+Date           : 2017/04/14
+"""
+
+import argparse
+import functools
+import random
+from time import perf_counter
+
+import pyglet
+pyglet.options['shadow_window'] = False
+from pyglet.image import atlas
+
+allocators = {
+    'strip': atlas.Allocator,
+    'maxrects': atlas.MaxRectsAllocator,
+    'rotate': functools.partial(atlas.MaxRectsAllocator, rotate=True),
+}
+
+def make_sizes(count, dist, rand):
+    """ Sprite sizes, as resource.image would put in one texture bin """
+    sizes = []
+    for _ in range(count):
+        if dist == 'tiles':
+            # Mostly square tiles of a few sizes
+            side = rand.choice([16, 16, 32, 32, 32, 64])
+            sizes.append((side, side))
+        elif dist == 'mixed':
+            sizes.append((rand.randint(4, 128), rand.randint(4, 128)))
+        else:
+            # Long thin pieces: bars, ropes, text
+            if rand.random() < 0.5:
+                sizes.append((rand.randint(32, 128), rand.randint(4, 16)))
+            else:
+                sizes.append((rand.randint(4, 16), rand.randint(32, 128)))
+    return sizes
+
+def pack(allocator_class, sizes, page, offline):
+    """ Pack `sizes` into the first page with room, like TextureBin, but
+    without textures.
+
+    Returns the number of pages and the seconds spent.
+    """
+    if offline:
+        # Same order as TextureBin.pack_all
+        sizes = sorted(sizes, key=lambda size: (max(size), size[0] * size[1]),
+                       reverse=True)
+    pages = []
+    start = perf_counter()
+    for width, height in sizes:
+        for allocator in pages:
+            try:
+                if getattr(allocator, 'rotate', False):
+                    allocator.alloc_rotated(width, height)
+                else:
+                    allocator.alloc(width, height)
+                break
+            except atlas.AllocatorException:
+                pass
+        else:
+            allocator = allocator_class(page, page)
+            pages.append(allocator)
+            if getattr(allocator, 'rotate', False):
+                allocator.alloc_rotated(width, height)
+            else:
+                allocator.alloc(width, height)
+    return len(pages), perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare texture atlas allocators.')
+    parser.add_argument('-n', '--counts', type=int, nargs='+',
+        default=[200, 1000],
+        help='sprite counts to try (default: %(default)s)')
+    parser.add_argument('--dist', nargs='+', default=['tiles', 'mixed', 'thin'],
+        choices=['tiles', 'mixed', 'thin'],
+        help='sprite size distributions (default: %(default)s)')
+    parser.add_argument('--page', type=int, default=256,
+        help='atlas texture size (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+        help='random seed (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    print('%6s %6s %9s %8s %6s %10s %8s' % ('count', 'dist', 'allocator',
+        'order', 'pages', 'occupancy', 'ms'))
+    for count in args.counts:
+        for dist in args.dist:
+            sizes = make_sizes(count, dist, random.Random(args.seed))
+            area = sum(width * height for width, height in sizes)
+            for name in ('strip', 'maxrects', 'rotate'):
+                for offline in (False, True):
+                    pages, seconds = pack(allocators[name], sizes, args.page,
+                                          offline)
+                    occupancy = area / float(pages * args.page * args.page)
+                    print('%6d %6s %9s %8s %6d %9.1f%% %8.1f' % (count, dist,
+                        name, ('online', 'pack_all')[offline], pages,
+                        100 * occupancy, 1000 * seconds))
+
+# Only run as script if run directly
+if __name__ == '__main__':
+    main()
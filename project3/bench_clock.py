@@ -0,0 +1,117 @@
+#!/bin/env python3
+"""
+Module         : bench_clock.py
+Author         : Patrick Long
+Email          : pllong@wpi.edu
+Course         : CS 4732
+
+Description    : Time the pyglet clock scheduler with many scheduled
+                 callbacks (what every cocos schedule_interval lands on)
+
+Date           : 2017/04/14
+"""
+
+import argparse
+import random
+from time import perf_counter
+
+import pyglet.clock
+
+# Frame length of the simulated ticks
+frame = 1 / 60
+
+class FakeTime(object):
+    """ Time function the benchmark advances by hand """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class Callback(object):
+    """ Something scheduled, counts its calls """
+    __slots__ = ('clock', 'calls', 'rearm')
+
+    def __init__(self, clock, rearm=None):
+        self.clock = clock
+        self.calls = 0
+        self.rearm = rearm
+
+    def __call__(self, dt):
+        self.calls += 1
+        if self.rearm is not None:
+            # One-shot that schedules itself again, like a chain of actions
+            self.clock.schedule_once(self, self.rearm)
+
+def run(count, frames, soft, rand):
+    """ Schedule `count` callbacks, tick `frames` times and unschedule them.
+
+    Returns the seconds spent in each phase and the number of calls.
+    """
+    times = dict.fromkeys(('schedule', 'soft', 'tick', 'unschedule'), 0.0)
+    now = FakeTime()
+    clock = pyglet.clock.Clock(time_function=now)
+    clock.tick(poll=True)
+
+    callbacks = []
+    start = perf_counter()
+    for k in range(count - soft):
+        if k % 10 == 0:
+            callback = Callback(clock, rand.uniform(0.05, 1))
+            clock.schedule_once(callback, callback.rearm)
+        else:
+            callback = Callback(clock)
+            clock.schedule_interval(callback, rand.uniform(0.05, 2))
+        callbacks.append(callback)
+    times['schedule'] = perf_counter() - start
+
+    start = perf_counter()
+    for _ in range(soft):
+        callback = Callback(clock)
+        clock.schedule_interval_soft(callback, rand.uniform(0.05, 2))
+        callbacks.append(callback)
+    times['soft'] = perf_counter() - start
+
+    start = perf_counter()
+    for _ in range(frames):
+        now.now += frame
+        clock.tick(poll=True)
+    times['tick'] = perf_counter() - start
+
+    rand.shuffle(callbacks)
+    start = perf_counter()
+    for callback in callbacks:
+        clock.unschedule(callback)
+    times['unschedule'] = perf_counter() - start
+    return times, sum(callback.calls for callback in callbacks)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time the pyglet clock scheduler.')
+    parser.add_argument('-n', '--counts', type=int, nargs='+',
+        default=[10000, 30000, 100000],
+        help='scheduled callback counts to try (default: %(default)s)')
+    parser.add_argument('--frames', type=int, default=300,
+        help='ticks per run, at 60 per second (default: %(default)s)')
+    parser.add_argument('--soft', type=float, default=0.1,
+        help='fraction scheduled with schedule_interval_soft '
+             '(default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+        help='random seed (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    print('ms in total (tick is per frame), %d frames' % args.frames)
+    print('%7s %10s %10s %9s %11s %10s' % ('count', 'schedule', 'soft',
+        'tick', 'unschedule', 'calls'))
+    for count in args.counts:
+        rand = random.Random(args.seed)
+        soft = int(count * args.soft)
+        times, calls = run(count, args.frames, soft, rand)
+        print('%7d %10.1f %10.1f %9.3f %11.1f %10d' % (count,
+            1000 * times['schedule'], 1000 * times['soft'],
+            1000 * times['tick'] / args.frames, 1000 * times['unschedule'],
+            calls))
+
+# Only run as script if run directly
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/bin/env python3
+"""
+Module         : bench_collision.py
+Author         : Patrick Long
+Email          : pllong@wpi.edu
+Course         : CS 4732
+
+Description    : Compare the cocos collision managers (brute force, grid and
+                 AABB tree) over object counts and size distributions
+
+Date           : 2017/04/14
+"""
+
+import argparse
+import math
+import os
+import random
+from time import perf_counter
+
+# Only load the collision model, not the rest of cocos (no window needed)
+os.environ.setdefault('cocos_utest', '1')
+import cocos.collision_model as cm
+import cocos.euclid as eu
+
+# Side of a cell of the grid, tuned for the small objects
+cell_size = 20.0
+# Half size of the small objects
+small = 8.0
+
+class Actor(object):
+    """ Minimal collidable """
+    __slots__ = ('cshape', 'vel')
+
+    def __init__(self, cshape, vel):
+        self.cshape = cshape
+        self.vel = vel
+
+def world_side(count, dist):
+    """ Side of the square world for `count` objects """
+    side = math.sqrt(count) * 5 * small
+    if dist == 'sparse':
+        side *= 20
+    return side
+
+def make_actors(count, dist, side, rand):
+    """ Random circles and rectangles, sized following `dist` """
+    actors = []
+    for _ in range(count):
+        if dist == 'mixed':
+            size = math.exp(rand.uniform(math.log(2), math.log(200)))
+        else:
+            size = small
+        center = eu.Vector2(rand.uniform(0, side), rand.uniform(0, side))
+        if rand.random() < 0.5:
+            shape = cm.CircleShape(center, size)
+        else:
+            shape = cm.AARectShape(center, size, size * rand.uniform(0.5, 1))
+        vel = eu.Vector2(rand.uniform(-1, 1), rand.uniform(-1, 1))
+        actors.append(Actor(shape, vel))
+    return actors
+
+def make_manager(name, side):
+    """ Build the manager called `name` for a world of side `side` """
+    if name == 'brute':
+        return cm.CollisionManagerBruteForce()
+    if name == 'grid':
+        return cm.CollisionManagerGrid(0, side, 0, side, cell_size, cell_size)
+    return cm.CollisionManagerAABBTree()
+
+def run(name, actors, side, frames, near, rand):
+    """ Time one manager, returns the seconds spent in each phase """
+    times = dict.fromkeys(('setup', 'update', 'collisions', 'near'), 0.0)
+    start = perf_counter()
+    manager = make_manager(name, side)
+    for actor in actors:
+        manager.add(actor)
+    times['setup'] = perf_counter() - start
+
+    probes = rand.sample(actors, min(100, len(actors)))
+    for _ in range(frames):
+        for actor in actors:
+            actor.cshape.center += actor.vel
+
+        start = perf_counter()
+        manager.update_many(actors)
+        times['update'] += perf_counter() - start
+
+        start = perf_counter()
+        for _ in manager.iter_all_collisions():
+            pass
+        times['collisions'] += perf_counter() - start
+
+        start = perf_counter()
+        for actor in probes:
+            manager.objs_near(actor, near)
+        times['near'] += perf_counter() - start
+    return times
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare the cocos collision managers.')
+    parser.add_argument('-n', '--counts', type=int, nargs='+',
+        default=[250, 1000, 4000],
+        help='object counts to try (default: %(default)s)')
+    parser.add_argument('--dist', choices=('uniform', 'mixed', 'sparse'),
+        nargs='+', default=['uniform', 'mixed', 'sparse'],
+        help='size distributions to try (default: all)')
+    parser.add_argument('--frames', type=int, default=10,
+        help='frames per run (default: %(default)s)')
+    parser.add_argument('--near', type=float, default=2 * small,
+        help='distance for the objs_near probes (default: %(default)s)')
+    parser.add_argument('--brute-max', type=int, default=1000,
+        help='skip brute force above this many objects (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+        help='random seed (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    print('ms per frame (setup is once), %d frames, 100 objs_near probes' %
+        args.frames)
+    print('%-8s %6s %-6s %9s %9s %11s %9s %9s' % ('dist', 'count',
+        'cm', 'setup', 'update', 'collisions', 'near', 'total'))
+    for dist in args.dist:
+        for count in args.counts:
+            for name in ('brute', 'grid', 'tree'):
+                if name == 'brute' and count > args.brute_max:
+                    continue
+                # Same actors and probes for every manager
+                rand = random.Random(args.seed)
+                side = world_side(count, dist)
+                actors = make_actors(count, dist, side, rand)
+                times = run(name, actors, side, args.frames, args.near, rand)
+                per_frame = [1000 * times[phase] / args.frames
+                             for phase in ('update', 'collisions', 'near')]
+                print('%-8s %6d %-6s %9.2f %9.2f %11.2f %9.2f %9.2f' % (
+                    dist, count, name, 1000 * times['setup'],
+                    per_frame[0], per_frame[1], per_frame[2], sum(per_frame)))
+
+# Only run as script if run directly
+if __name__ == '__main__':
+    main()
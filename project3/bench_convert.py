@@ -0,0 +1,92 @@
+#!/bin/env python3
+"""
+Module         : bench_convert.py
+Author         : Patrick Long
+Email          : pllong@wpi.edu
+Course         : CS 4732
+
+Description    : Time pyglet ImageData format and pitch conversion,
+                 regex substitution against numpy views
+
+Date           : 2017/04/14
+"""
+
+import argparse
+import os
+from time import perf_counter
+
+import pyglet
+pyglet.options['shadow_window'] = False
+from pyglet import image
+
+# name -> (format, pitch sign, new format, new pitch sign, row padding)
+conversions = {
+    'swap': ('RGBA', 1, 'BGRA', 1, 0),
+    'widen': ('RGB', 1, 'RGBA', 1, 0),
+    'grey': ('L', 1, 'RGBA', 1, 0),
+    'flip': ('RGBA', -1, 'RGBA', 1, 0),
+    'swapflip': ('BGRA', -1, 'RGBA', 1, 0),
+    'unpad': ('RGB', 1, 'RGB', 1, 3),
+    'pad': ('RGB', 1, 'RGB', 1, -3),
+}
+
+def run(size, name, repeat):
+    """ Best times of `repeat` regex and numpy conversions, in seconds.
+
+    Also checks both give the same pixels (the regex path fills added
+    row padding with '.' rather than zero bytes, so padding is skipped).
+    """
+    format, sign, new_format, new_sign, padding = conversions[name]
+    pitch = size * len(format) + max(padding, 0)
+    new_pitch = size * len(new_format) + max(-padding, 0)
+    data = os.urandom(pitch * size)
+    img = image.ImageData(size, size, format, data, sign * pitch)
+
+    times = {}
+    results = {}
+    for path in ('regex', 'array'):
+        convert = getattr(img, '_convert_' + path)
+        best = None
+        for _ in range(repeat):
+            start = perf_counter()
+            results[path] = convert(new_format, new_sign * new_pitch)
+            elapsed = perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        times[path] = best
+
+    row = size * len(new_format)
+    for y in range(size):
+        start = y * new_pitch
+        if (results['regex'][start:start + row] !=
+                results['array'][start:start + row]):
+            raise AssertionError('numpy conversion differs for %d %s'
+                                 % (size, name))
+    return times
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time ImageData conversion, regex against numpy.')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+',
+        default=[64, 256, 1024],
+        help='image sizes (square) to try (default: %(default)s)')
+    parser.add_argument('-c', '--conversions', nargs='+',
+        default=sorted(conversions), choices=sorted(conversions),
+        help='conversions to try (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='conversions per image, the best one counts '
+             '(default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    print('ms per conversion, best of %d' % args.repeat)
+    print('%6s %9s %10s %10s %8s' % ('size', 'convert', 'regex', 'numpy',
+        'speedup'))
+    for size in args.sizes:
+        for name in args.conversions:
+            times = run(size, name, args.repeat)
+            print('%6d %9s %10.2f %10.2f %7.1fx' % (size, name,
+                1000 * times['regex'], 1000 * times['array'],
+                times['regex'] / times['array']))
+
+# Only run as script if run directly
+if __name__ == '__main__':
+    main()
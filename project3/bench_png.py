@@ -0,0 +1,146 @@
+#!/bin/env python3
+"""
+Module         : bench_png.py
+Author         : Patrick Long
+Email          : pllong@wpi.edu
+Course         : CS 4732
+
+Description    : Time PNG decoding in the included pyglet, pure python
+                 rows against the numpy path, over generated images
+
+Date           : 2017/04/14
+"""
+
+import argparse
+import io
+import random
+import zlib
+from time import perf_counter
+
+import numpy
+
+from pyglet.extlibs import png
+
+# name -> (colour type, planes)
+modes = {
+    'RGBA': (6, 4),
+    'RGB': (2, 3),
+    'L': (0, 1),
+    'palette': (3, 1),
+}
+
+def make_png(width, height, mode, filters, rand):
+    """ Encode a `width` by `height` image of `mode`, each scanline
+    filtered with a type drawn from `filters`.
+
+    The pixels are a noisy gradient, so every filter has work to do.
+    """
+    colortype, planes = modes[mode]
+    y, x = numpy.mgrid[0:height, 0:width, 0:1][:2]
+    pixels = x * numpy.arange(1, planes + 1) + y * 3
+    pixels += numpy.array([rand.randrange(8) for _ in range(pixels.size)]
+                          ).reshape(pixels.shape)
+    pixels = (pixels % 256).astype(numpy.uint8).reshape(height, -1)
+
+    lines = []
+    previous = None
+    for row in pixels:
+        line = bytearray(row.tobytes())
+        lines.append(png.filter_scanline(rand.choice(filters), line,
+                                         planes, previous))
+        previous = line
+    data = zlib.compress(b''.join(bytes(line) for line in lines))
+
+    chunks = [('IHDR', png.struct.pack('!2I5B', width, height, 8,
+                                        colortype, 0, 0, 0))]
+    if mode == 'palette':
+        chunks.append(('PLTE', bytes(bytearray(
+            (i * 7) % 256 for i in range(3 * 256)))))
+    chunks.append(('IDAT', data))
+    chunks.append(('IEND', b''))
+    out = io.BytesIO()
+    png.write_chunks(out, chunks)
+    return out.getvalue()
+
+def decode_python(data):
+    """ Decode the way the codec does without numpy """
+    reader = png.Reader(bytes=data)
+    width, height, pixels, meta = reader.asDirect()
+    return numpy.array(list(pixels), numpy.uint8)
+
+def decode_numpy(data):
+    """ Decode the way the codec does with numpy """
+    reader = png.Reader(bytes=data)
+    width, height, pixels, meta = reader.asDirectArray()
+    return pixels
+
+def best(decode, data, repeat):
+    """ Best of `repeat` decodes, in seconds, and the last result """
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        pixels = decode(data)
+        times.append(perf_counter() - start)
+    return min(times), pixels
+
+def shape(text):
+    """ Parse a WIDTHxHEIGHT argument """
+    try:
+        width, height = [int(side) for side in text.split('x')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected WIDTHxHEIGHT, got %r'
+                                         % text)
+    return width, height
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time PNG decoding, pure python against numpy.')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+',
+        default=[64, 256, 1024],
+        help='image sizes (square) to try (default: %(default)s)')
+    parser.add_argument('--shapes', type=shape, nargs='*',
+        default=[(32, 16384)], metavar='WIDTHxHEIGHT',
+        help='other image shapes to try, tall narrow images take the '
+             'most memory (default: 32x16384)')
+    parser.add_argument('-m', '--modes', nargs='+', default=sorted(modes),
+        choices=sorted(modes),
+        help='colour modes to try (default: %(default)s)')
+    parser.add_argument('-f', '--filters', nargs='+',
+        default=['0', '1', '2', '3', '4', 'mixed'],
+        choices=['0', '1', '2', '3', '4', 'mixed'],
+        help='scanline filter types, mixed draws one per line '
+             '(default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='decodes per image, the best one counts (default: %(default)s)')
+    parser.add_argument('--no-python', action='store_true',
+        help='only time the numpy path')
+    parser.add_argument('--seed', type=int, default=0,
+        help='random seed (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    print('ms per decode, best of %d' % args.repeat)
+    print('%9s %8s %6s %10s %10s %8s' % ('size', 'mode', 'filter',
+        'python', 'numpy', 'speedup'))
+    shapes = [(size, size) for size in args.sizes] + args.shapes
+    for width, height in shapes:
+        size = '%dx%d' % (width, height)
+        for mode in args.modes:
+            for name in args.filters:
+                rand = random.Random(args.seed)
+                filters = range(5) if name == 'mixed' else [int(name)]
+                data = make_png(width, height, mode, filters, rand)
+                fast, pixels = best(decode_numpy, data, args.repeat)
+                if args.no_python:
+                    print('%9s %8s %6s %10s %10.2f %8s' % (size, mode, name,
+                        '-', 1000 * fast, '-'))
+                    continue
+                slow, expected = best(decode_python, data, args.repeat)
+                if not numpy.array_equal(pixels, expected):
+                    raise AssertionError('numpy decode differs for %s %s %s'
+                                         % (size, mode, name))
+                print('%9s %8s %6s %10.2f %10.2f %7.1fx' % (size, mode, name,
+                    1000 * slow, 1000 * fast, slow / fast))
+
+# Only run as script if run directly
+if __name__ == '__main__':
+    main()
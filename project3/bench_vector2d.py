@@ -0,0 +1,96 @@
+#!/bin/env python3
+"""
+Module         : bench_vector2d.py
+Author         : Patrick Long
+Email          : pllong@wpi.edu
+Course         : CS 4732
+
+Description    : Micro-benchmark of the Vector2 operators against the
+                 in-place API, using the body of the boid neighbor loop
+
+Date           : 2017/04/14
+"""
+
+import argparse
+import random
+import timeit
+
+from vector2d import Vector2, Vector2Pool
+
+# Scratch vectors for the in-place loop
+_pool = Vector2Pool()
+
+def neighbor_loop_operators(me, targets, min_dist=48):
+    """ Separation/cohesion/alignment sums written with operators """
+    sep = Vector2(0, 0)
+    coh = Vector2(0, 0)
+    aln = Vector2(0, 0)
+    for posn, v in targets:
+        diff = me - posn
+        dist = abs(diff)
+        if dist > 0:
+            diff.normalize()
+            if dist < min_dist:
+                diff /= (dist / min_dist)
+            sep += diff
+            coh += posn
+            aln += v
+    return sep * 1.5 + coh + aln
+
+def neighbor_loop_inplace(me, targets, min_dist=48):
+    """ The same sums written with the in-place API """
+    pool = _pool
+    pool.reset()
+    sep = pool.take()
+    coh = pool.take()
+    aln = pool.take()
+    diff = pool.take()
+    for posn, v in targets:
+        dist = diff.set_normalized_diff(me, posn)
+        if dist > 0:
+            if dist < min_dist:
+                diff.scale(min_dist / dist)
+            sep.add(diff)
+            coh.add(posn)
+            aln.add(v)
+    return sep.scale(1.5).add(coh).add(aln)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare Vector2 operators with the in-place API.')
+    parser.add_argument('-n', '--neighbors', type=int, default=200,
+        help='neighbors per loop (default: %(default)s)')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+        help='timing repeats, the best is reported (default: %(default)s)')
+    parser.add_argument('--number', type=int, default=200,
+        help='loops per repeat (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    rand = random.Random(0)
+    me = Vector2(450.0, 450.0)
+    targets = [
+        (Vector2(rand.uniform(200, 700), rand.uniform(200, 700)),
+         Vector2(rand.uniform(-100, 100), rand.uniform(-100, 100)))
+        for _ in range(args.neighbors)
+    ]
+
+    a = neighbor_loop_operators(me, targets)
+    b = neighbor_loop_inplace(me, targets)
+    assert abs(a - b) < 1e-6 * max(1.0, abs(a)), (a, b)
+
+    print('%d neighbors, best of %d x %d loops' % (
+        args.neighbors, args.repeat, args.number))
+    results = {}
+    for name, loop in (('operators', neighbor_loop_operators),
+                       ('in-place', neighbor_loop_inplace)):
+        best = min(timeit.repeat(lambda: loop(me, targets),
+            repeat=args.repeat, number=args.number))
+        results[name] = best
+        print('  %-10s %8.2f us/loop  %6.3f us/neighbor' % (
+            name, 1e6 * best / args.number,
+            1e6 * best / args.number / args.neighbors))
+    print('speedup: %.2fx' % (results['operators'] / results['in-place']))
+
+# Only run as script if run directly
+if __name__ == '__main__':
+    main()
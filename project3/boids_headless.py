@@ -0,0 +1,119 @@
+#!/bin/env python3
+"""
+Module         : boids_headless.py
+Author         : Patrick Long
+Email          : pllong@wpi.edu
+Course         : CS 4732
+
+Description    : Step the boids simulation at a fixed timestep without
+                 cocos (no window or GL context) and report how fast it runs
+
+Date           : 2017/04/14
+"""
+
+import argparse
+import tracemalloc
+from time import perf_counter
+
+from boidworld import BoidWorld, Snapshots, obstacle_radius, arena_size
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+# Phases of `BoidWorld.step`, in order
+phases = ('grid', 'gather', 'force', 'integrate')
+
+def make_world(num_boids, backend='numpy', size=arena_size, seed=None,
+        workers=None):
+    """ Build a world laid out like `BoidLayer` """
+    world = BoidWorld(size, size, backend, workers, seed)
+    world.add_obstacle((size / 2, size / 2), obstacle_radius)
+    world.populate(num_boids)
+    return world
+
+def run(world, steps, dt, snapshots=None):
+    """ Step `world` `steps` times, returns the wall time and phase times """
+    world.timings = dict.fromkeys(phases, 0.0)
+    start = perf_counter()
+    for _ in range(steps):
+        world.step(dt)
+        if snapshots is not None:
+            snapshots.update(world)
+    elapsed = perf_counter() - start
+    timings, world.timings = world.timings, None
+    return elapsed, timings
+
+def peak_rss():
+    """ Peak resident set size in MiB of this process and of its largest
+    finished child process, such as a worker (None if unknown) """
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux
+    return tuple(resource.getrusage(who).ru_maxrss / 1024
+        for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the boids simulation without a window and time it.')
+    parser.add_argument('-n', '--boids', type=int, default=100,
+        help='number of boids (default: %(default)s)')
+    parser.add_argument('-s', '--steps', type=int, default=300,
+        help='number of steps to run (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=None,
+        help='random seed for the initial population')
+    parser.add_argument('--dt', type=float, default=1 / 60,
+        help='fixed timestep in seconds (default: 1/60)')
+    parser.add_argument('--backend', choices=BoidWorld.backends, default='numpy',
+        help='simulation backend (default: %(default)s)')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+        help='worker processes for the parallel backend (default: one per core)')
+    parser.add_argument('--size', type=float, default=arena_size,
+        help='side length of the arena (default: %(default)s)')
+    parser.add_argument('--resume', metavar='SNAPSHOT', default=None,
+        help='start from a saved snapshot instead of spawning boids')
+    parser.add_argument('--snapshot-every', metavar='K', type=int, default=0,
+        help='save a snapshot every K steps (default: never)')
+    parser.add_argument('--snapshot-dir', default='snapshots',
+        help='directory for snapshots (default: %(default)s)')
+    parser.add_argument('--trace-memory', action='store_true',
+        help='also report peak traced allocations while stepping (slower)')
+    args = parser.parse_args(argv)
+    if args.steps < 1:
+        parser.error('--steps must be at least 1')
+
+    if args.resume is not None:
+        world = BoidWorld.load(args.resume, args.backend, args.workers, args.seed)
+    else:
+        world = make_world(args.boids, args.backend, args.size, args.seed,
+            args.workers)
+    snapshots = None
+    if args.snapshot_every > 0:
+        snapshots = Snapshots(args.snapshot_dir, args.snapshot_every)
+    if args.trace_memory:
+        tracemalloc.start()
+    try:
+        elapsed, timings = run(world, args.steps, args.dt, snapshots)
+    finally:
+        world.close()
+
+    print('boids: %d  steps: %d  backend: %s  seed: %s' % (
+        len(world), args.steps, args.backend, args.seed))
+    print('steps/sec: %.2f  (%.3f ms/step)' % (
+        args.steps / elapsed, 1000 * elapsed / args.steps))
+    for phase in phases:
+        total = timings[phase]
+        print('  %-10s %10.3f ms/step  %5.1f%%' % (
+            phase, 1000 * total / args.steps, 100 * total / elapsed))
+    if args.trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('peak traced memory: %.1f MiB' % (peak / 2 ** 20))
+    rss = peak_rss()
+    if rss is not None:
+        print('peak RSS: %.1f MiB  (largest child process: %.1f MiB)' % rss)
+
+# Only run as script if run directly
+if __name__ == '__main__':
+    main()
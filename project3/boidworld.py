@@ -0,0 +1,964 @@
+#!/bin/env python3
+"""
+Module         : boidworld.py
+Author         : Patrick Long
+Email          : pllong@wpi.edu
+Course         : CS 4732
+
+Description    : Boid simulation state and stepping, independent of cocos.
+                 `BoidWorld` keeps the whole population in NumPy arrays
+                 (structure of arrays) and steps every boid in one batch.
+
+Date           : 2017/04/14
+"""
+
+import math
+import os
+import weakref
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+import random
+from time import perf_counter
+
+import numpy as np
+
+from vector2d import Vector2 as v2d
+from vector2d import Vector2Array, Vector2Pool, limit
+
+# (COLOR, NAME, FLEE, CHASE)
+boid_info = (
+    ((255, 0, 0), 'RED', 2, 1),
+    ((0, 255, 0), 'GREEN', 0, 2),
+    ((0, 0, 255), 'BLUE', 1, 0)
+)
+
+# Relations of a boid to another, by species (see `BoidWorld._pair_sums`)
+_FLEE, _CHASE, _SAME, _OTHER = range(4)
+_RELATIONS = 4
+
+spawn_padding = 25   # Padding for spawnboxex
+obstacle_radius = 96 # Radius of obstacle
+cell_size = 64       # Size of cell
+arena_size = 900     # Size of "arena"
+
+# Spawn position for each boid is
+# (rand(b1, b2), rand(b1, b2)) * bounds[index] + center
+box_offsets = (
+    (-1, -1),
+    (1, -1),
+    (-1, 1),
+    (1, 1)
+)
+
+class BoidController(object):
+    """ Per-boid reference implementation of the boid rules
+
+    Boids think and move one at a time, so later boids see the updated
+    state of earlier ones.  This is the behavior `BoidWorld` batches.
+    """
+    _max_f = 60.0        # Maximum force applied to boid
+    _speed_cap = 100.0   # Maximum speed
+    _sensing_range = 256 # Maximum sensing range
+    _min_dist = 48       # Minimum ideal distance b/n boids
+    def __init__(self, world, _id, _type, _start, _v):
+        # World the boid lives in (spatial hash + obstacles)
+        self._world = world
+        # Window dimensions
+        self._win_w, self._win_h = world.width, world.height
+        # Starting Boid "type"
+        self._type = _type
+        # Starting position
+        self._posn = v2d(*_start)
+        # Starting velocity
+        self._v = v2d(*_v)
+        self._a = v2d(0, 0)
+        # Boid ID
+        self._id = _id
+
+    def set_type(self, _new_type):
+        """ Update type of boid """
+        # Update type
+        self._type = _new_type
+
+    def obstacle_force(self, obs_posn, obs_radius, out):
+        """ Get 'avoidance' force applied by obstacle """
+        # Look ahead proportional to velocity
+        look_ahead = self._min_dist * 2 * self._v.magnitude() / self._speed_cap
+        ahead = out.copy_from(self._v).normalize().scale(look_ahead).add(self._posn)
+        # Force is applied from obstacle in direction to future position
+        diff = ahead.sub(obs_posn)
+        # We won't collide, so it's okay
+        if abs(diff) > obs_radius * 1.2:
+            return out.set(0, 0)
+        # Magnitude of force is maximum force
+        return diff.normalize().scale(self._max_f)
+
+    def avoid_obstacles(self):
+        """ Get acceleration due to avoiding obstacles """
+        pool = self._world._pool
+        _a = pool.take()
+        _f = pool.take()
+        _count = 0
+
+        # Process all obstacles
+        for obs_posn, obs_radius in self._world._obstacles:
+            # Is it in range? (compare squared distances)
+            if 0 < self._posn.dist_sq_to(obs_posn) < self._sensing_range ** 2:
+                # Get force exherted by obstacle
+                self.obstacle_force(obs_posn, obs_radius, _f)
+                if _f.magnitude() > 1: # Is the force significant?
+                    _a.add(_f)
+                    _count += 1
+
+        if _count > 0:
+            _a.scale(self._speed_cap / _count)
+            #limit(_a, self._max_f)
+
+        return _a
+
+    def force(self, targets):
+        """ Get acceleration from `targets` (boid, dist, unit) tuples """
+        pool = self._world._pool
+        _a = pool.take()
+        heading = pool.take().copy_from(self._v).normalize()
+        _count = 0
+
+        # Process targets to determine force
+        for target, dist, unit in targets:
+            _count += 1
+            if dist < self._min_dist:
+                # If we are going to collide, "convert"
+                # target to my species
+                if dist < 16 and unit.dot(heading) < -0.6:
+                    target.set_type(self._type)
+                _a.add_scaled(unit, self._min_dist / dist)
+            else:
+                _a.add(unit)
+
+        if _count > 0:
+            _a.scale(self._speed_cap / _count)
+            limit(_a, self._max_f)
+
+        return _a
+
+    def flock(self, targets):
+        """ Get acceleration due to flocking behavior """
+        pool = self._world._pool
+        sep = pool.take() # Force to separate
+        coh = pool.take() # Force to cohere
+        aln = pool.take() # Force to align
+        count = 0
+
+        # Sum forces applied by flock
+        for target, dist, unit in targets:
+            count += 1
+
+            # Cohesion is steering towards average flock location
+            # (as seen from here, which may be across the edge)
+            coh.add(self._posn).add_scaled(unit, -dist)
+            # Separation driven by proximity of flock members,
+            # if too close, scale separation factor
+            if dist < self._min_dist:
+                sep.add_scaled(unit, self._min_dist / dist)
+            else:
+                sep.add(unit)
+            # Alignment is a force acting in average velocity
+            # of the flock
+            aln.add(target._v)
+
+        if count > 0:
+            # Calculate the average separation vector
+            sep.normalize().scale(self._speed_cap).sub(self._v)
+            limit(sep, self._max_f)
+
+            # Calculate the average velocity of the "flock"
+            aln.normalize().scale(self._speed_cap).sub(self._v)
+            limit(aln, self._max_f)
+
+            # Calculate the coherence force (flocking attractor)
+            coh.scale(1 / count)
+            self._steer(coh, True)
+
+        return sep.scale(1.5).add(coh).add(aln)
+
+    def _steer(self, dest, damp=False):
+        """ Steer towards destination (`dest` is overwritten) """
+        dist = dest.set_normalized_diff(dest, self._posn)
+        if dist > 0: # Not at target
+            # Damp coherence when it approaches min dist
+            if damp and (dist < self._min_dist):
+                dest.scale(self._speed_cap * 0.1)
+            else:
+                dest.scale(self._speed_cap)
+            # Calculate force needed to aim towards destination
+            dest.sub(self._v)
+            limit(dest, self._max_f)
+        return dest
+
+    def gather(self):
+        """ Get boids in sensing range, separated by type
+
+        Each neighbor is a (boid, dist, unit) tuple, with `unit` the
+        direction from the boid to me the short way around the donut.
+        Distances are compared squared, so only boids in range pay for
+        a square root.  The tuples are shared by flee, chase and flock.
+        """
+        # Scratch vectors are only needed until the end of think
+        pool = self._world._pool
+        pool.reset()
+        _boids = [[], [], []]
+        controllers = self._world._controllers
+        x, y = self._posn.x, self._posn.y
+        w, h = self._win_w, self._win_h
+        range_sq = self._sensing_range ** 2
+        # Check all grid cells in reach of radius
+        for cell in self._world._hash.around(x, y):
+            for k in cell.tolist():
+                target = controllers[k]
+                dx = x - target._posn.x
+                dy = y - target._posn.y
+                if dx > w / 2:
+                    dx -= w
+                elif dx < -w / 2:
+                    dx += w
+                if dy > h / 2:
+                    dy -= h
+                elif dy < -h / 2:
+                    dy += h
+                dist_sq = dx * dx + dy * dy
+                if 0 < dist_sq < range_sq: # Is it in range?
+                    dist = math.sqrt(dist_sq)
+                    unit = pool.take().set(dx / dist, dy / dist)
+                    _boids[target._type].append((target, dist, unit))
+        return _boids
+
+    def think(self, _boids=None):
+        """ Determine acceleration """
+        if _boids is None:
+            _boids = self.gather()
+        # Determine forces acting upon boid
+        _flee  = self.force(_boids[boid_info[self._type][2]])
+        _chase = self.force(_boids[boid_info[self._type][3]])
+        _flock = self.flock(_boids[self._type])
+        _obs   = self.avoid_obstacles()
+        # F = ma, mass = 1
+        self._a.sub_into(_chase, _flee).add(_flock).add(_obs)
+
+    def check_borders(self):
+        """ Wrap, we are on a donut """
+        # Go Homer!
+        # https://en.wikipedia.org/wiki/Torus#Flat_torus
+        if self._posn.x < 0:
+            self._posn.x += self._win_w
+        elif self._posn.x > self._win_w:
+            self._posn.x -= self._win_w
+        if self._posn.y < 0:
+            self._posn.y += self._win_h
+        elif self._posn.y > self._win_h:
+            self._posn.y -= self._win_h
+
+    def step(self, dt):
+        """ Update the Boid controller """
+        self.think()
+        self.move(dt)
+
+    def move(self, dt):
+        """ Apply acceleration and move """
+        # Update velocity
+        self._v.add_scaled(self._a, dt)
+        limit(self._v, self._speed_cap)
+
+        # Update position
+        self._posn.add_scaled(self._v, dt)
+        self.check_borders()
+
+class SpatialHash(object):
+    """ Uniform grid of cells over the torus, rebuilt every frame
+
+    Points are counting-sorted by cell: `order` lists point indices grouped
+    by cell and `order[start[c]:end[c]]` are the points in cell c.  Cells
+    are at least `cell_size` wide, so the block of cells within `radius`
+    wraps cleanly around the arena edges.
+    """
+    def __init__(self, width, height, cell_size, radius):
+        self.width = width
+        self.height = height
+        self.cols = max(1, int(width // cell_size))
+        self.rows = max(1, int(height // cell_size))
+        self.cell_w = width / self.cols
+        self.cell_h = height / self.rows
+        # Cell offsets that can hold points within radius, skipping
+        # cells that lie entirely outside the circle
+        self._offsets = []
+        for dx in _reach(radius / self.cell_w, self.cols):
+            gap_x = _gap(dx, self.cols) * self.cell_w
+            for dy in _reach(radius / self.cell_h, self.rows):
+                gap_y = _gap(dy, self.rows) * self.cell_h
+                if gap_x ** 2 + gap_y ** 2 < radius ** 2:
+                    self._offsets.append((dx, dy))
+        self.build(np.zeros((0, 2)))
+
+    def build(self, pos):
+        """ Sort the points in `pos` (N, 2) into cells, O(N) """
+        self._cx = (pos[:, 0] / self.cell_w).astype(np.int64) % self.cols
+        self._cy = (pos[:, 1] / self.cell_h).astype(np.int64) % self.rows
+        self.cells = self._cx * self.rows + self._cy
+        counts = np.bincount(self.cells, minlength=self.cols * self.rows)
+        self.end = np.cumsum(counts)
+        self.start = self.end - counts
+        keys = self.cells
+        if len(counts) <= 1 << 16:
+            # A stable sort of 16 bit keys is a radix sort
+            keys = keys.astype(np.uint16)
+        self.order = np.argsort(keys, kind='stable')
+        self._bounds = None
+
+    def around(self, x, y):
+        """ Index slices of every cell in reach of point (x, y) """
+        if self._bounds is None:
+            self._bounds = self.start.tolist(), self.end.tolist()
+        start, end = self._bounds
+        cx = int(x / self.cell_w)
+        cy = int(y / self.cell_h)
+        for dx, dy in self._offsets:
+            c = ((cx + dx) % self.cols) * self.rows + (cy + dy) % self.rows
+            if end[c] > start[c]:
+                yield self.order[start[c]:end[c]]
+
+    def chunks(self, limit, src=None):
+        """ Split the points in `src` (default all) into runs of about
+        `limit` candidate pairs each (at least one point per run)
+
+        Points are taken in cell order, so each run pairs up nearby points.
+        """
+        counts = (self.end - self.start).reshape(self.cols, self.rows)
+        reach = np.zeros_like(counts)
+        for dx, dy in self._offsets:
+            reach += np.roll(counts, (-dx, -dy), axis=(0, 1))
+        if src is None:
+            src = self.order
+        else:
+            src = src[np.argsort(self.cells[src], kind='stable')]
+        run = (np.cumsum(reach.reshape(-1)[self.cells[src]]) - 1) // limit
+        return np.split(src, np.flatnonzero(np.diff(run)) + 1)
+
+    def pairs(self, src=None):
+        """ Candidate pairs (i, j) for every point i in `src` (default
+        all) and each point j in the cells in reach of it """
+        if src is None:
+            src = np.arange(len(self.cells))
+        # Points in reach of each cell holding a point of src, the cell
+        # slices at every offset one after the other
+        cells, own = np.unique(self.cells[src], return_inverse=True)
+        dx, dy = np.array(self._offsets, dtype=np.int64).reshape(-1, 2).T
+        cx, cy = cells // self.rows, cells % self.rows
+        reach = ((cx[:, None] + dx) % self.cols) * self.rows + \
+            (cy[:, None] + dy) % self.rows
+        near = _expand(self.start[reach].reshape(-1),
+            (self.end[reach] - self.start[reach]).reshape(-1))
+        counts = (self.end[reach] - self.start[reach]).sum(1)
+        # Every point of src is paired with the points in reach of its cell
+        first = np.cumsum(counts) - counts
+        return np.repeat(src, counts[own]), \
+            self.order[near[_expand(first[own], counts[own])]]
+
+class BoidWorld(object):
+    """ Whole boid population stored as a structure of arrays
+
+    Positions, velocities and accelerations are (N, 2) float arrays and
+    species is an (N,) int array.  With the default 'numpy' backend every
+    force is computed for all boids at once from the same snapshot of the
+    population; the 'python' backend steps one `BoidController` per boid.
+    The 'parallel' backend computes the same batched forces for tiles of
+    the arena in a pool of `workers` processes (default: one per core).
+
+    Every pair of boids in sensing range is looked at, so the batched
+    forces cost O(N * neighbors) time.  Pairs are made for a run of boids
+    at a time, about `_max_pairs` candidates per run, which bounds the
+    memory used however crowded the world is.
+    """
+    _max_f = BoidController._max_f
+    _speed_cap = BoidController._speed_cap
+    _sensing_range = BoidController._sensing_range
+    _min_dist = BoidController._min_dist
+    _convert_dist = 16   # Distance at which a boid converts its target
+    _convert_dot = -0.6  # Target must be at least this far "ahead"
+    _max_pairs = 1 << 18 # Candidate pairs looked at in one batch
+    backends = ('numpy', 'python', 'parallel')
+    def __init__(self, width=arena_size, height=arena_size, backend='numpy',
+            workers=None, seed=None):
+        if backend not in self.backends:
+            raise ValueError('Unknown boid backend: %r' % (backend,))
+        self.width = width
+        self.height = height
+        self.backend = backend
+        # Random source for spawning, seeded for reproducible runs
+        self.rng = random.Random(seed)
+        # Number of steps taken
+        self.steps = 0
+        # Spatial index, rebuilt once per step
+        self._hash = SpatialHash(width, height, cell_size, self._sensing_range)
+        # Relation of a boid to another, indexed by both species
+        kinds = len(boid_info)
+        self._relations = np.full((kinds, kinds), _OTHER)
+        for kind, info in enumerate(boid_info):
+            self._relations[kind, kind] = _SAME
+            self._relations[kind, info[3]] = _CHASE
+            self._relations[kind, info[2]] = _FLEE
+        # Population
+        self.pos = np.zeros((0, 2))
+        self.vel = np.zeros((0, 2))
+        self.acc = np.zeros((0, 2))
+        self.species = np.zeros(0, dtype=np.int64)
+        self.heading = np.zeros(0)
+        # Obstacles
+        self._obstacles = []
+        self.obs_pos = np.zeros((0, 2))
+        self.obs_radius = np.zeros(0)
+        # Per-boid controllers ('python' backend), built on demand
+        self._controllers = None
+        # Tiles + process pool ('parallel' backend)
+        self._tiles = None
+        if backend == 'parallel':
+            self._tiles = TileStepper(self, workers)
+        self._pool = Vector2Pool()
+        # Seconds spent in each phase of `step`, if not None
+        self.timings = None
+
+    def __len__(self):
+        return len(self.pos)
+
+    @property
+    def positions(self):
+        """ Positions as a `Vector2Array` sharing memory with `pos` """
+        return Vector2Array(self.pos)
+
+    @property
+    def velocities(self):
+        """ Velocities as a `Vector2Array` sharing memory with `vel` """
+        return Vector2Array(self.vel)
+
+    def add_obstacle(self, posn, radius):
+        """ Add a circular obstacle """
+        self._obstacles.append((v2d(*posn), radius))
+        self.obs_pos = np.vstack((self.obs_pos, [posn]))
+        self.obs_radius = np.append(self.obs_radius, radius)
+
+    def populate(self, num_boids):
+        """ Spawn `num_boids` boids in the four boxes around the obstacle """
+        randint = self.rng.randint
+        # Bounds for spawning boids, from the center of the world
+        box_x = (obstacle_radius + spawn_padding,
+            int(self.width / 2 - spawn_padding))
+        box_y = (obstacle_radius + spawn_padding,
+            int(self.height / 2 - spawn_padding))
+        pos = np.empty((num_boids, 2))
+        vel = np.empty((num_boids, 2))
+        for i in range(num_boids):
+            box_id = randint(0, 99) % 4
+            pos[i] = (
+                randint(*box_x) * box_offsets[box_id][0] + self.width / 2,
+                randint(*box_y) * box_offsets[box_id][1] + self.height / 2
+            )
+        # Type is a hash of ID
+        species = np.arange(num_boids) % 3
+        for i in range(num_boids):
+            vel[i] = randint(-10, 10), randint(-10, 10)
+        vel *= ((2 + species) * 2)[:, None]
+        self.set_state(pos, vel, species)
+
+    def set_state(self, pos, vel, species):
+        """ Replace the whole population """
+        self.pos = np.array(pos, dtype=np.float64).reshape(-1, 2)
+        self.vel = np.array(vel, dtype=np.float64).reshape(-1, 2)
+        self.acc = np.zeros_like(self.pos)
+        self.species = np.array(species, dtype=np.int64)
+        self.heading = self._heading(self.vel)
+        self._controllers = None
+
+    def step(self, dt):
+        """ Advance every boid by `dt` seconds """
+        if self.backend == 'python':
+            self._step_python(dt)
+        elif self.backend == 'parallel':
+            self._step_parallel(dt)
+        else:
+            self._step_numpy(dt)
+        self.steps += 1
+
+    def _step_parallel(self, dt):
+        """ Step with forces computed by the tile workers """
+        t = perf_counter()
+        self.acc, converts = self._tiles.forces()
+        self.convert(*converts)
+        t = self._lap('force', t)
+        self.integrate(dt)
+        self._lap('integrate', t)
+
+    def _step_numpy(self, dt):
+        """ Step every boid at once """
+        t = perf_counter()
+        self._hash.build(self.pos)
+        t = self._lap('grid', t)
+        self.acc, converts = self.batched_forces()
+        t = perf_counter()
+        self.convert(*converts)
+        t = self._lap('force', t)
+        self.integrate(dt)
+        self._lap('integrate', t)
+
+    def save(self, path):
+        """ Save a snapshot of the world to `path` (.npz) """
+        np.savez(path, pos=self.pos, vel=self.vel, acc=self.acc,
+            species=self.species, steps=self.steps,
+            size=(self.width, self.height),
+            obs_pos=self.obs_pos, obs_radius=self.obs_radius)
+
+    @classmethod
+    def load(cls, path, backend='numpy', workers=None, seed=None):
+        """ Create a world from a snapshot saved by `save` """
+        with np.load(path) as data:
+            width, height = data['size'].tolist()
+            world = cls(width, height, backend, workers, seed)
+            for posn, radius in zip(data['obs_pos'].tolist(),
+                    data['obs_radius'].tolist()):
+                world.add_obstacle(posn, radius)
+            world.set_state(data['pos'], data['vel'], data['species'])
+            world.acc[...] = data['acc']
+            world.steps = int(data['steps'])
+        return world
+
+    def close(self):
+        """ Stop any worker processes and free shared memory """
+        if self._tiles is not None:
+            self._tiles.close()
+
+    def _lap(self, phase, since):
+        """ Charge the time since `since` to `phase`, returns the time now """
+        now = perf_counter()
+        if self.timings is not None:
+            self.timings[phase] = self.timings.get(phase, 0.0) + now - since
+        return now
+
+    def neighbors(self, src=None):
+        """ Find every pair of boids within sensing range
+
+        Returns (i, j, dist, unit) where `unit` is the direction from
+        boid j to boid i, measured the short way around the torus.
+        Only boids in `src` (default all) are used for i.  The spatial
+        hash must be built from the current positions.
+        """
+        return self._in_range(*self._hash.pairs(src))
+
+    def _in_range(self, i, j):
+        """ Keep the candidate pairs (i, j) within sensing range """
+        # One coordinate at a time, (N,) arrays are cheaper than (N, 2)
+        diff = []
+        for axis, size in enumerate((self.width, self.height)):
+            d = self.pos[i, axis] - self.pos[j, axis]
+            d -= size * np.round(d / size)
+            diff.append(d)
+        dx, dy = diff
+        # Reject on squared distance, only pairs in range pay for sqrt
+        dist_sq = dx * dx + dy * dy
+        keep = np.flatnonzero((dist_sq > 0) &
+            (dist_sq < self._sensing_range ** 2))
+        i, j = i[keep], j[keep]
+        dist = np.sqrt(dist_sq[keep])
+        unit = np.empty((len(keep), 2))
+        np.divide(dx[keep], dist, out=unit[:, 0])
+        np.divide(dy[keep], dist, out=unit[:, 1])
+        return i, j, dist, unit
+
+    def wrap(self, diff):
+        """ Shortest equivalent of each vector in `diff` on the torus """
+        size = np.array([self.width, self.height], dtype=np.float64)
+        return diff - size * np.round(diff / size)
+
+    def batched_forces(self, src=None):
+        """ Get acceleration of every boid from all its neighbors
+
+        Like `forces` over `neighbors(src)`, but the pairs are made and
+        summed for a run of boids at a time (see `SpatialHash.chunks`).
+        Only the accelerations of boids in `src` (default all) are
+        meaningful.  The spatial hash must be built from the current
+        positions.
+        """
+        t = perf_counter()
+        sums, ci, cj = None, [], []
+        # There is always at least one (maybe empty) run
+        for run in self._hash.chunks(self._max_pairs, src):
+            i, j, dist, unit = self.neighbors(run)
+            t = self._lap('gather', t)
+            part, (pi, pj) = self._pair_sums(i, j, dist, unit)
+            if sums is None:
+                sums = part
+            else:
+                for key in sums:
+                    sums[key] += part[key]
+            ci.append(pi)
+            cj.append(pj)
+            t = self._lap('force', t)
+        acc = self._total(sums)
+        self._lap('force', t)
+        return acc, (np.concatenate(ci), np.concatenate(cj))
+
+    def forces(self, i, j, dist, unit):
+        """ Get acceleration of every boid from its neighbor pairs
+
+        Returns the accelerations and the (ci, cj) pairs of boids that
+        convert another, which are left for `convert` to apply.
+        """
+        sums, converts = self._pair_sums(i, j, dist, unit)
+        return self._total(sums), converts
+
+    def _pair_sums(self, i, j, dist, unit):
+        """ Sum the pushes, flockmate positions and velocities of pairs
+
+        Returns the sums (see `_total`) and the conversions.
+        """
+        n = len(self.pos)
+        species = self.species
+        # Separation is scaled up for boids that are too close
+        scale = np.where(dist < self._min_dist, self._min_dist / np.maximum(dist, 1e-12), 1.0)
+
+        # Every push is summed in one pass, binned by boid and relation
+        relation = self._relations[species[i], species[j]]
+        key = i * _RELATIONS + relation
+        bins = n * _RELATIONS
+        count = np.bincount(key, minlength=bins).reshape(n, _RELATIONS)
+        push = np.empty((n, _RELATIONS, 2))
+        for axis in (0, 1):
+            push[:, :, axis] = np.bincount(key, weights=unit[:, axis] * scale,
+                minlength=bins).reshape(n, _RELATIONS)
+
+        # Flockmate positions as seen from each boid
+        same = np.flatnonzero(relation == _SAME)
+        near = self.pos[i[same]] - unit[same] * dist[same][:, None]
+        sums = {
+            'flee': push[:, _FLEE],
+            'flee_n': count[:, _FLEE],
+            'chase': push[:, _CHASE],
+            'chase_n': count[:, _CHASE],
+            'sep': push[:, _SAME],
+            'coh': _sum_rows(i[same], near, n),
+            'aln': _sum_rows(i[same], self.vel[j[same]], n),
+            'flock_n': count[:, _SAME],
+        }
+
+        # Boids that run into prey or predators "convert" them
+        close = np.flatnonzero((relation < _SAME) &
+            (dist < self._convert_dist))
+        vhat = self.velocities.normalized().xy
+        ahead = np.einsum('ij,ij->i', unit[close], vhat[i[close]])
+        convert = close[ahead < self._convert_dot]
+        return sums, (i[convert], j[convert])
+
+    def _total(self, sums):
+        """ Acceleration of every boid from its summed neighbor terms """
+        _flee = self._force(sums['flee'], sums['flee_n'])
+        _chase = self._force(sums['chase'], sums['chase_n'])
+        _flock = self._flock(sums['sep'], sums['coh'], sums['aln'],
+            sums['flock_n'])
+        _obs = self._avoid_obstacles()
+        # F = ma, mass = 1
+        return _chase - _flee + _flock + _obs
+
+    def convert(self, ci, cj):
+        """ Boids `ci` convert boids `cj` to their species """
+        if not len(ci):
+            return
+        # Lowest boid ID wins when several convert the same target
+        order = np.argsort(ci, kind='stable')
+        cj, first = np.unique(cj[order], return_index=True)
+        self.species[cj] = self.species[ci[order][first]]
+
+    def _force(self, _a, count):
+        """ Averaged, capped push away from targets (summed in `_a`) """
+        has = count > 0
+        _a[has] *= self._speed_cap / count[has][:, None]
+        return Vector2Array(_a).limit(self._max_f).xy
+
+    def _flock(self, sep, coh, aln, count):
+        """ Separation, cohesion and alignment of each flock, from the
+        summed pushes, flockmate positions and velocities """
+        has = count > 0
+
+        # Average separation vector
+        sep = Vector2Array(sep).normalize().xy * self._speed_cap - self.vel
+        limit(Vector2Array(sep), self._max_f)
+        # Average velocity of the "flock"
+        aln = Vector2Array(aln).normalize().xy * self._speed_cap - self.vel
+        limit(Vector2Array(aln), self._max_f)
+        # Coherence force (flocking attractor)
+        coh[has] /= count[has][:, None]
+        coh = self._steer(coh, True)
+
+        total = sep * 1.5 + coh + aln
+        total[~has] = 0
+        return total
+
+    def _steer(self, dest, damp=False):
+        """ Steer towards destinations """
+        diff = dest - self.pos
+        dist = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+        speed = np.full(len(diff), self._speed_cap)
+        if damp:
+            # Damp coherence when it approaches min dist
+            speed[dist < self._min_dist] *= 0.1
+        diff = Vector2Array(diff).normalize().xy * speed[:, None] - self.vel
+        limit(Vector2Array(diff), self._max_f)
+        diff[dist == 0] = 0
+        return diff
+
+    def _avoid_obstacles(self):
+        """ Get acceleration due to avoiding obstacles """
+        _a = np.zeros_like(self.pos)
+        count = np.zeros(len(self.pos))
+        if not len(self.obs_pos):
+            return _a
+        speed = self.velocities.magnitude()
+        # Look ahead proportional to velocity
+        look_ahead = self._min_dist * 2 * speed / self._speed_cap
+        ahead = self.pos + self.velocities.normalized().xy * look_ahead[:, None]
+        for obs_posn, obs_radius in zip(self.obs_pos, self.obs_radius):
+            diff = self.pos - obs_posn
+            dist = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+            in_range = (dist > 0) & (dist < self._sensing_range)
+            # Force is applied from obstacle in direction to future position
+            diff = ahead - obs_posn
+            gap = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+            # Magnitude of force is maximum force (if significant)
+            hit = in_range & (gap <= obs_radius * 1.2) & (gap > 0)
+            _a[hit] += self._max_f * diff[hit] / gap[hit][:, None]
+            count += hit
+        has = count > 0
+        _a[has] *= self._speed_cap / count[has][:, None]
+        return _a
+
+    def integrate(self, dt):
+        """ Move every boid using its acceleration """
+        # Update velocity
+        self.vel += self.acc * dt
+        limit(self.velocities, self._speed_cap)
+
+        # Update position, wrap, we are on a donut
+        pos = self.pos
+        pos += self.vel * dt
+        size = np.array([self.width, self.height], dtype=np.float64)
+        pos += np.where(pos < 0, size, 0)
+        pos -= np.where(pos > size, size, 0)
+        self.heading = self._heading(self.vel)
+
+    @staticmethod
+    def _heading(vel):
+        """ Sprite rotation (degrees clockwise from up) for velocities """
+        return -(Vector2Array(vel).rot(True) - 90)
+
+    def _step_python(self, dt):
+        """ Step one `BoidController` at a time """
+        if self._controllers is None:
+            self._controllers = [
+                BoidController(self, k, int(self.species[k]),
+                    self.pos[k].tolist(), self.vel[k].tolist())
+                for k in range(len(self.pos))
+            ]
+        t = perf_counter()
+        self._hash.build(self.pos)
+        t = self._lap('grid', t)
+        for controller in self._controllers:
+            _boids = controller.gather()
+            t = self._lap('gather', t)
+            controller.think(_boids)
+            t = self._lap('force', t)
+            controller.move(dt)
+            t = self._lap('integrate', t)
+        for k, c in enumerate(self._controllers):
+            self.pos[k] = c._posn.x, c._posn.y
+            self.vel[k] = c._v.x, c._v.y
+            self.acc[k] = c._a.x, c._a.y
+            self.species[k] = c._type
+        self.heading = self._heading(self.vel)
+        self._lap('integrate', t)
+
+class Snapshots(object):
+    """ Save a snapshot of a world every `every` steps
+
+    Files are named after the step they were taken at, so a run can be
+    resumed (or replayed) from any of them with `BoidWorld.load`.
+    """
+    def __init__(self, directory, every):
+        self.directory = directory
+        self.every = every
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, steps):
+        """ Snapshot file for the given step """
+        return os.path.join(self.directory, 'boids_%08d.npz' % steps)
+
+    def update(self, world):
+        """ Save `world` if a snapshot is due """
+        if self.every > 0 and world.steps % self.every == 0:
+            world.save(self.path(world.steps))
+
+class TileStepper(object):
+    """ Compute `BoidWorld` forces for tiles of the arena in parallel
+
+    The population lives in shared memory.  Each task owns the boids in
+    one tile and sees the boids within sensing range of it (its halo), so
+    it can compute its boids' forces alone.  Tasks write accelerations for
+    the boids they own, so the merge does not depend on which worker ran
+    which tile, and conversions are resolved the same way as serially.
+    """
+    # Tiles per worker, more tiles balance the load better
+    _tiles_per_worker = 2
+    def __init__(self, world, workers=None):
+        self._world = world
+        self.workers = workers or os.cpu_count() or 1
+        # Split the arena into a grid of roughly square tiles
+        count = self.workers * self._tiles_per_worker
+        self._nx = int(math.ceil(math.sqrt(count)))
+        self._ny = int(math.ceil(count / self._nx))
+        self._pool = None
+        self._shm = None
+        self._finalizer = None
+
+    def _share(self):
+        """ Move the world's arrays into shared memory (if they changed) """
+        world = self._world
+        if self._shm is not None and self._shm[1][0] is world.pos \
+                and self._shm[1][1] is world.vel \
+                and self._shm[1][2] is world.species:
+            return
+        n = len(world.pos)
+        blocks, arrays = [], []
+        for data in (world.pos, world.vel, world.species, np.zeros((n, 2))):
+            block = SharedMemory(create=True, size=max(1, data.nbytes))
+            array = np.ndarray(data.shape, data.dtype, buffer=block.buf)
+            array[...] = data
+            blocks.append(block)
+            arrays.append(array)
+        self._release()
+        world.pos, world.vel, world.species, world.acc = arrays
+        self._shm = (blocks, arrays)
+        self._finalizer = weakref.finalize(self, _free_blocks, blocks)
+
+    def forces(self):
+        """ Get accelerations and conversions for every boid """
+        self._share()
+        if self._pool is None:
+            self._pool = Pool(self.workers)
+        world = self._world
+        blocks, _ = self._shm
+        names = tuple(block.name for block in blocks)
+        tile_w = world.width / self._nx
+        tile_h = world.height / self._ny
+        tasks = [
+            (names, len(world.pos), world.width, world.height,
+             world.obs_pos, world.obs_radius,
+             (tx * tile_w, ty * tile_h, (tx + 1) * tile_w, (ty + 1) * tile_h),
+             (tx == self._nx - 1, ty == self._ny - 1))
+            for tx in range(self._nx) for ty in range(self._ny)
+        ]
+        results = self._pool.map(_tile_forces, tasks)
+        ci = np.concatenate([r[0] for r in results])
+        cj = np.concatenate([r[1] for r in results])
+        return world.acc, (ci, cj)
+
+    def _release(self):
+        """ Free the current shared memory blocks """
+        if self._finalizer is not None:
+            # Keep the data, the world may still hold these arrays
+            world = self._world
+            world.pos, world.vel, world.species, world.acc = \
+                [array.copy() for array in self._shm[1]]
+            self._finalizer()
+        self._shm = None
+        self._finalizer = None
+
+    def close(self):
+        """ Stop the workers and free shared memory """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self._release()
+
+def _free_blocks(blocks):
+    """ Close and unlink shared memory blocks """
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+# Shared memory blocks attached in a worker process, by name
+_attached = {}
+
+def _attach(names, n):
+    """ Get the shared arrays (pos, vel, species, acc) in a worker """
+    if _attached.get('names') != names:
+        for block in _attached.get('blocks', ()):
+            block.close()
+        blocks = [SharedMemory(name=name) for name in names]
+        shapes = ((n, 2), (n, 2), (n,), (n, 2))
+        dtypes = (np.float64, np.float64, np.int64, np.float64)
+        _attached['names'] = names
+        _attached['blocks'] = blocks
+        _attached['arrays'] = [
+            np.ndarray(shape, dtype, buffer=block.buf)
+            for shape, dtype, block in zip(shapes, dtypes, blocks)
+        ]
+    return _attached['arrays']
+
+def _tile_forces(task):
+    """ Worker: forces for the boids in one tile, from the tile + halo """
+    names, n, width, height, obs_pos, obs_radius, bounds, last = task
+    pos, vel, species, acc = _attach(names, n)
+    x0, y0, x1, y1 = bounds
+
+    world = BoidWorld(width, height)
+    for posn, radius in zip(obs_pos.tolist(), obs_radius.tolist()):
+        world.add_obstacle(posn, radius)
+
+    # Boids owned by this tile (the last tiles also own the far edge)
+    x, y = pos[:, 0], pos[:, 1]
+    owned = (x >= x0) & ((x < x1) | last[0]) & (y >= y0) & ((y < y1) | last[1])
+    # Halo, boids that can be in sensing range of the tile
+    reach = world._sensing_range
+    size = np.array([width, height], dtype=np.float64)
+    center = np.array([(x0 + x1) / 2, (y0 + y1) / 2])
+    half = np.array([(x1 - x0) / 2, (y1 - y0) / 2])
+    gap = np.abs(world.wrap(pos - center)) - half
+    local = np.nonzero(owned | np.all(gap <= reach, axis=1))[0]
+
+    world.set_state(pos[local], vel[local], species[local])
+    world._hash.build(world.pos)
+    src = np.nonzero(owned[local])[0]
+    # Pairs are made a run of owned boids at a time, like the numpy backend
+    _acc, (ci, cj) = world.batched_forces(src)
+    acc[local[src]] = _acc[src]
+    return local[ci], local[cj]
+
+def _sum_rows(index, values, n):
+    """ Sum rows of `values` into `n` bins given by `index` """
+    out = np.empty((n, 2))
+    out[:, 0] = np.bincount(index, weights=values[:, 0], minlength=n)
+    out[:, 1] = np.bincount(index, weights=values[:, 1], minlength=n)
+    return out
+
+def _expand(starts, counts):
+    """ Concatenated ranges starts[k] .. starts[k] + counts[k] """
+    first = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return first + np.arange(len(first))
+
+def _reach(cells, count):
+    """ Offsets of the cells within `cells` of a cell, wrapping at `count` """
+    reach = int(math.ceil(cells))
+    if 2 * reach + 1 >= count:
+        # Every row/column is in reach (each listed once)
+        return tuple(range(count))
+    return tuple(range(-reach, reach + 1))
+
+def _gap(offset, count):
+    """ Whole cells between a cell and the one `offset` away (wrapping) """
+    offset = abs(offset) % count
+    return max(0, min(offset, count - offset) - 1)
@@ -41,6 +41,11 @@ import operator as op
 import math
 import cocos.euclid as eu
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # interfaces, abstract base clases ######################################
 
 
@@ -166,6 +171,7 @@ class CollisionManager(object):
         - clean() \: forgets all objects and empties internal data structures
         - add(obj) \: remember obj as a known object
         - remove_tricky(obj) \: forgets obj
+        - update(obj) \: refresh obj after its cshape changed
 
     When objects are made known to a collision manager, internal data structures
     are updated based on the obj.cshape value at the 'add' moment.
@@ -208,6 +214,13 @@ class CollisionManager(object):
 
     Example actors for this case are player, enemies, soldiers.
 
+    If the moving actors stay known between frames, the 'updating collision
+    info' block can instead be::
+
+        collision_manager.update_many(moving_actors)
+
+    which in CollisionManagerGrid only moves the actors that changed cells.
+
     All of the known objects don't change Cshapes
 
         - At level start you add all objects
@@ -236,6 +249,20 @@ class CollisionManager(object):
         """
         pass
 
+    def update(self, obj):
+        """
+        Makes the collision manager use the current obj.cshape value for obj,
+        adding obj if it is not a known object.
+        It is the cheap way to follow objects that moved since they were added.
+        """
+        pass
+
+    def update_many(self, objs):
+        """
+        Calls update for each obj in objs
+        """
+        pass
+
     def they_collide(self, obj1, obj2):
         """
         Returns a boolean, True if obj1 overlaps objs2
@@ -547,6 +574,102 @@ def aa_rect_distance_aa_rect(aa_rect, other):
         d = 0.0
     return d
 
+
+# Batch (numpy) helpers ##################################################
+
+
+def shape_arrays(objs):
+    """
+    Packs the cshapes of objs into numpy arrays for batch queries.
+
+    Circles are stored with zero half extents and rectangles with zero radius,
+    so both kinds of shape fit in the same arrays.
+
+    Returns a tuple (cx, cy, rx, ry, r, is_rect) of arrays with one entry per
+    obj, in the order of objs.
+    """
+    if np is None:
+        raise ImportError("Batch collision queries need numpy")
+    n = len(objs)
+    cx = np.empty(n)
+    cy = np.empty(n)
+    rx = np.zeros(n)
+    ry = np.zeros(n)
+    r = np.zeros(n)
+    is_rect = np.zeros(n, dtype=bool)
+    for k, obj in enumerate(objs):
+        shape = obj.cshape
+        cx[k], cy[k] = shape.center[0], shape.center[1]
+        if isinstance(shape, CircleShape):
+            r[k] = shape.r
+        elif isinstance(shape, AARectShape):
+            rx[k] = shape.rx
+            ry[k] = shape.ry
+            is_rect[k] = True
+        else:
+            raise NotImplementedError(
+                "Batch queries on {0} are not implemented".format(shape.__class__.__name__))
+    return cx, cy, rx, ry, r, is_rect
+
+
+def signed_distances(a, b, i, j):
+    """
+    Distances between shapes a[i] and b[j], as given by cshape.distance but
+    without clamping to zero: the value is negative iff the shapes overlap.
+
+    a and b are tuples as returned by shape_arrays, i and j index arrays of the
+    same length.
+    """
+    acx, acy, arx, ary, ar, a_rect = a
+    bcx, bcy, brx, bry, br, b_rect = b
+    # gap along each axis between the rectangular cores
+    gx = np.abs(bcx[j] - acx[i]) - (arx[i] + brx[j])
+    gy = np.abs(bcy[j] - acy[i]) - (ary[i] + bry[j])
+    ex = np.maximum(gx, 0.0)
+    ey = np.maximum(gy, 0.0)
+    # euclidean for circle - circle and rect - circle
+    d = np.sqrt(ex ** 2 + ey ** 2) - ar[i] - br[j]
+    # max-min distance for rect - rect
+    both_rect = a_rect[i] & b_rect[j]
+    d[both_rect] = np.maximum(gx, gy)[both_rect]
+    return d
+
+
+def _expand_ranges(lo, hi):
+    # (owner, k) for every k in range(lo[owner], hi[owner])
+    counts = np.maximum(hi - lo, 0)
+    owner = np.repeat(np.arange(len(lo)), counts)
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    return owner, starts + np.arange(counts.sum())
+
+
+def _sweep_pairs(a, b, near_distance, same=False):
+    # Candidate pairs (i, j) whose aabbs, inflated by near_distance, overlap.
+    # Sweeps along x over b sorted by min x; with same=True a is b and only
+    # pairs i < j are returned.
+    acx, acy, arx, ary, ar, _ = a
+    bcx, bcy, brx, bry, br, _ = b
+    a_ext = np.maximum(arx, ar)
+    b_ext = np.maximum(brx, br)
+    b_minx = bcx - b_ext
+    order = np.argsort(b_minx, kind='stable')
+    sorted_minx = b_minx[order]
+    hi = np.searchsorted(sorted_minx, acx + a_ext + near_distance, 'right')
+    if same:
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        lo = rank + 1
+    else:
+        widest = 2 * b_ext.max() if len(b_ext) else 0.0
+        lo = np.searchsorted(sorted_minx, acx - a_ext - near_distance - widest, 'left')
+    i, k = _expand_ranges(lo, hi)
+    j = order[k]
+    # reject on the other axes
+    keep = ((np.abs(bcx[j] - acx[i]) <= a_ext[i] + b_ext[j] + near_distance) &
+            (np.abs(bcy[j] - acy[i]) <=
+             np.maximum(ary, ar)[i] + np.maximum(bry, br)[j] + near_distance))
+    return i[keep], j[keep]
+
 # CollisionManager implementations #######################################
 
 
@@ -572,6 +695,13 @@ class CollisionManagerBruteForce(object):
     def clear(self):
         self.objs.clear()
 
+    def update(self, obj):
+        # nothing depends on cshape
+        self.objs.add(obj)
+
+    def update_many(self, objs):
+        self.objs.update(objs)
+
     def they_collide(self, obj1, obj2):
         return obj1.cshape.overlaps(obj2.cshape)
 
@@ -668,6 +798,10 @@ class CollisionManagerGrid(object):
     overlapping <some object> (or nearby ones) needs to be examined for the
     condition.
 
+    Each known object remembers the cells it was stored in, so update only
+    touches the buckets an object enters or leaves, and clear only the buckets
+    used since the previous clear.
+
     Look at CollisionManager for other class and methods documentation.
     """
 
@@ -707,22 +841,71 @@ class CollisionManagerGrid(object):
         numbuckets = cols * rows
         # buckets maps cell identifier -> objs that potentially overlaps the cell
         self.buckets = [set() for k in range(numbuckets)]
+        # spans maps known obj -> cell span (ix_lo, ix_sup, iy_lo, iy_sup)
+        # it was stored with
+        self._spans = {}
+        # cell identifiers of the buckets that may be non empty
+        self._dirty = set()
 
     def add(self, obj):
         # add to any bucket it overlaps
         # for the collision logic algorithm is fine if a number of buckets
         # that don't overlap are included; this allows to use a faster
         # 'buckets_for_objects' at the cost of potentially some extra buckets
-        for cell_idx in self._iter_cells_for_aabb(obj.cshape.minmax()):
-            self.buckets[cell_idx].add(obj)
+        if obj in self._spans:
+            self.update(obj)
+            return
+        span = self._span_for_aabb(obj.cshape.minmax())
+        self._spans[obj] = span
+        self._add_to_cells(obj, self._iter_cells_for_span(span))
 
     def remove_tricky(self, obj):
-        for cell_idx in self._iter_cells_for_aabb(obj.cshape.minmax()):
+        # the span stored at add time is used, so a changed cshape don't leaks
+        span = self._spans.pop(obj)
+        for cell_idx in self._iter_cells_for_span(span):
             self.buckets[cell_idx].remove(obj)
 
+    def update(self, obj):
+        """
+        Makes the collision manager see the current obj.cshape value.
+
+        obj is moved only between the buckets that differ from the ones it was
+        stored in, and nothing is done if its cells did not change; this is
+        much cheaper than remove + add, or clear + add for all, when objects
+        move a little each frame.
+        If obj is not a known object it is added.
+        """
+        new_span = self._span_for_aabb(obj.cshape.minmax())
+        old_span = self._spans.get(obj)
+        if old_span is None:
+            self._spans[obj] = new_span
+            self._add_to_cells(obj, self._iter_cells_for_span(new_span))
+            return
+        if new_span == old_span:
+            return
+        self._spans[obj] = new_span
+        old_cells = set(self._iter_cells_for_span(old_span))
+        new_cells = set(self._iter_cells_for_span(new_span))
+        buckets = self.buckets
+        for cell_idx in old_cells - new_cells:
+            buckets[cell_idx].remove(obj)
+        self._add_to_cells(obj, new_cells - old_cells)
+
+    def update_many(self, objs):
+        """
+        Calls update for each obj in objs
+        """
+        update = self.update
+        for obj in objs:
+            update(obj)
+
     def clear(self):
-        for bucket in self.buckets:
-            bucket.clear()
+        # only the buckets used since the last clear can be non empty
+        buckets = self.buckets
+        for cell_idx in self._dirty:
+            buckets[cell_idx].clear()
+        self._dirty.clear()
+        self._spans.clear()
 
     def they_collide(self, obj1, obj2):
         return obj1.cshape.overlaps(obj2.cshape)
@@ -779,7 +962,7 @@ class CollisionManagerGrid(object):
             for other in self.buckets[cell_id]:
                 if other not in collides and (f_distance(other.cshape) < near_distance):
                     collides.add(other)
-        collides.remove(obj)
+        collides.discard(obj)
         return collides
 
     def objs_near_wdistance(self, obj, near_distance):
@@ -811,7 +994,9 @@ class CollisionManagerGrid(object):
         # implemented using the fact: 'a collides b' iff (there is a bucket B
         # with a in B, b in B and 'a collides b')
         known_collisions = set()
-        for bucket in self.buckets:
+        buckets = self.buckets
+        for cell_idx in list(self._dirty):
+            bucket = buckets[cell_idx]
             for i, obj in enumerate(bucket):
                 f_overlaps = obj.cshape.overlaps
                 for j, other in enumerate(bucket):
@@ -827,16 +1012,14 @@ class CollisionManagerGrid(object):
                             yield (obj, other)
 
     def knows(self, obj):
-        for bucket in self.buckets:
-            if obj in bucket:
-                return True
-        return False
+        # objects entirely outside the world are in no bucket, so no query
+        # can find them
+        span = self._spans.get(obj)
+        return span is not None and self._span_has_cells(span)
 
     def known_objs(self):
-        objs = set()
-        for bucket in self.buckets:
-            objs |= bucket
-        return objs
+        has_cells = self._span_has_cells
+        return set(obj for obj, span in self._spans.items() if has_cells(span))
 
     def objs_touching_point(self, x, y):
         touching = set()
@@ -856,8 +1039,78 @@ class CollisionManagerGrid(object):
                     into.add(obj)
         return into
 
-    def _iter_cells_for_aabb(self, aabb):
-        # iterate all buckets overlapping the rectangle minmax
+    def all_pairs_near(self, near_distance):
+        """
+        Batch form of objs_near for every known object at once.
+
+        Returns a tuple (objs, i, j) where objs is a list with the known objects
+        and i, j are numpy index arrays into it, with i[k] < j[k], such that
+        objs[j[k]] in objs_near(objs[i[k]], near_distance) for every k; each
+        near pair appears once.
+
+        Shapes are packed in numpy arrays and the candidates come from a single
+        sweep along x, so it is much faster than calling objs_near in a loop.
+        Needs numpy.
+        """
+        objs = list(self.known_objs())
+        shapes = shape_arrays(objs)
+        i, j = _sweep_pairs(shapes, shapes, near_distance, same=True)
+        near = signed_distances(shapes, shapes, i, j) < near_distance
+        if near_distance <= 0.0:
+            near[:] = False
+        i, j = i[near], j[near]
+        return objs, np.minimum(i, j), np.maximum(i, j)
+
+    def all_pairs_colliding(self):
+        """
+        Batch form of iter_all_collisions.
+
+        Returns a tuple (objs, i, j) as all_pairs_near, with a pair for each
+        two known objects that overlap.
+        Needs numpy.
+        """
+        objs = list(self.known_objs())
+        shapes = shape_arrays(objs)
+        i, j = _sweep_pairs(shapes, shapes, 0.0, same=True)
+        hit = signed_distances(shapes, shapes, i, j) < 0.0
+        i, j = i[hit], j[hit]
+        return objs, np.minimum(i, j), np.maximum(i, j)
+
+    def query_many(self, objs, near_distance):
+        """
+        Batch form of objs_near for many objects.
+
+        objs is a sequence of collidables, they are not required to be known
+        objects.
+
+        Returns a tuple (known, q, k) where known is a list with the known
+        objects and q, k are numpy index arrays such that known[k[n]] is in
+        objs_near(objs[q[n]], near_distance) for every n.
+        Needs numpy.
+        """
+        known = list(self.known_objs())
+        queries = shape_arrays(objs)
+        shapes = shape_arrays(known)
+        q, k = _sweep_pairs(queries, shapes, near_distance)
+        near = signed_distances(queries, shapes, q, k) < near_distance
+        if near_distance <= 0.0:
+            near[:] = False
+        # an object is never near itself
+        index = dict((id(obj), n) for n, obj in enumerate(known))
+        own = np.array([index.get(id(obj), -1) for obj in objs], dtype=np.intp)
+        near &= own[q] != k
+        return known, q[near], k[near]
+
+    def _add_to_cells(self, obj, cells):
+        buckets = self.buckets
+        dirty = self._dirty
+        for cell_idx in cells:
+            buckets[cell_idx].add(obj)
+            dirty.add(cell_idx)
+
+    def _span_for_aabb(self, aabb):
+        # cell span (ix_lo, ix_sup, iy_lo, iy_sup) of the buckets overlapping
+        # the rectangle minmax
         minx, maxx, miny, maxy = aabb
         ix_lo = int(math.floor((minx - self.xmin) / self.cell_width))
         ix_sup = int(math.ceil((maxx - self.xmin) / self.cell_width))
@@ -873,9 +1126,328 @@ class CollisionManagerGrid(object):
             iy_lo = 0
         if iy_sup > self.rows:
             iy_sup = self.rows
+        return ix_lo, ix_sup, iy_lo, iy_sup
+
+    def _span_has_cells(self, span):
+        ix_lo, ix_sup, iy_lo, iy_sup = span
+        return ix_lo < ix_sup and iy_lo < iy_sup
 
+    def _iter_cells_for_span(self, span):
+        ix_lo, ix_sup, iy_lo, iy_sup = span
         for iy in range(iy_lo, iy_sup):
             contrib_y = iy * self.cols
             for ix in range(ix_lo, ix_sup):
                 cell_id = ix + contrib_y
                 yield cell_id
+
+    def _iter_cells_for_aabb(self, aabb):
+        # iterate all buckets overlapping the rectangle minmax
+        return self._iter_cells_for_span(self._span_for_aabb(aabb))
+
+
+def _aabb_union(a, b):
+    return (a[0] if a[0] < b[0] else b[0], a[1] if a[1] > b[1] else b[1],
+            a[2] if a[2] < b[2] else b[2], a[3] if a[3] > b[3] else b[3])
+
+
+def _aabb_perimeter(a):
+    return 2.0 * ((a[1] - a[0]) + (a[3] - a[2]))
+
+
+def _aabb_contains(outer, inner):
+    return (outer[0] <= inner[0] and inner[1] <= outer[1] and
+            outer[2] <= inner[2] and inner[3] <= outer[3])
+
+
+class _TreeNode(object):
+    # a leaf has height 0 and holds obj; an internal node has two children
+    # and an aabb enclosing both
+    __slots__ = ('aabb', 'parent', 'left', 'right', 'height', 'obj')
+
+    def __init__(self, aabb, obj=None):
+        self.aabb = aabb
+        self.parent = None
+        self.left = None
+        self.right = None
+        self.height = 0
+        self.obj = obj
+
+
+class CollisionManagerAABBTree(object):
+    """
+    Implements the CollisionManager interface with a dynamic bounding volume
+    tree, as popularized by Box2D.
+
+    Each known object is a leaf holding its aabb, enlarged by margin, and each
+    internal node holds the aabb enclosing its two children. Questions walk
+    down only the branches whose aabb overlaps the question aabb.
+    The tree is kept balanced with rotations, so add, remove_tricky and update
+    are O(log n).
+
+    Unlike CollisionManagerGrid there is no world rectangle and no cell size to
+    tune: memory is O(number of known objects), and objects of very different
+    sizes or spread over a huge, sparse world don't degrade it.
+
+    Because of the margin, update is free while an object moves less than
+    margin away from where it was (re)inserted.
+
+    Look at CollisionManager for other class and methods documentation.
+    """
+
+    def __init__(self, margin=2.0):
+        """
+        :Parameters:
+            `margin` : float
+                how much the stored aabbs are enlarged on each side, in world
+                units; bigger values make update cheaper for moving objects
+                but answers must examine more candidates.
+        """
+        self.margin = margin
+        self._root = None
+        # leaves maps known obj -> its leaf node
+        self._leaves = {}
+
+    def add(self, obj):
+        if obj in self._leaves:
+            self.update(obj)
+            return
+        leaf = _TreeNode(self._fat_aabb(obj.cshape.minmax()), obj)
+        self._leaves[obj] = leaf
+        self._insert_leaf(leaf)
+
+    def remove_tricky(self, obj):
+        self._remove_leaf(self._leaves.pop(obj))
+
+    def update(self, obj):
+        leaf = self._leaves.get(obj)
+        if leaf is None:
+            self.add(obj)
+            return
+        aabb = obj.cshape.minmax()
+        if _aabb_contains(leaf.aabb, aabb):
+            return
+        self._remove_leaf(leaf)
+        leaf.aabb = self._fat_aabb(aabb)
+        self._insert_leaf(leaf)
+
+    def update_many(self, objs):
+        update = self.update
+        for obj in objs:
+            update(obj)
+
+    def clear(self):
+        self._root = None
+        self._leaves.clear()
+
+    def they_collide(self, obj1, obj2):
+        return obj1.cshape.overlaps(obj2.cshape)
+
+    def objs_colliding(self, obj):
+        f_overlaps = obj.cshape.overlaps
+        return set(other for other in self._iter_objs_in_aabb(obj.cshape.minmax())
+                   if other is not obj and f_overlaps(other.cshape))
+
+    def iter_colliding(self, obj):
+        f_overlaps = obj.cshape.overlaps
+        for other in self._iter_objs_in_aabb(obj.cshape.minmax()):
+            if other is not obj and f_overlaps(other.cshape):
+                yield other
+
+    def any_near(self, obj, near_distance):
+        f_distance = obj.cshape.distance
+        for other in self._iter_objs_in_aabb(obj.cshape.minmax(), near_distance):
+            if other is not obj and f_distance(other.cshape) < near_distance:
+                return other
+        return None
+
+    def objs_near(self, obj, near_distance):
+        f_distance = obj.cshape.distance
+        return set(other for other in
+                   self._iter_objs_in_aabb(obj.cshape.minmax(), near_distance)
+                   if other is not obj and f_distance(other.cshape) < near_distance)
+
+    def objs_near_wdistance(self, obj, near_distance):
+        f_distance = obj.cshape.distance
+        res = []
+        for other in self._iter_objs_in_aabb(obj.cshape.minmax(), near_distance):
+            if other is obj:
+                continue
+            d = f_distance(other.cshape)
+            if d <= near_distance:
+                res.append((other, d))
+        return res
+
+    def ranked_objs_near(self, obj, near_distance):
+        tmp = self.objs_near_wdistance(obj, near_distance)
+        tmp.sort(key=op.itemgetter(1))
+        return tmp
+
+    def iter_all_collisions(self):
+        # each leaf queries the tree; a pair is reported by the first of
+        # its objects to be visited
+        visited = set()
+        for obj in list(self._leaves):
+            visited.add(obj)
+            f_overlaps = obj.cshape.overlaps
+            for other in self._iter_objs_in_aabb(obj.cshape.minmax()):
+                if other not in visited and f_overlaps(other.cshape):
+                    yield (obj, other)
+
+    def knows(self, obj):
+        return obj in self._leaves
+
+    def known_objs(self):
+        return set(self._leaves)
+
+    def objs_touching_point(self, x, y):
+        return set(obj for obj in self._iter_objs_in_aabb((x, x, y, y))
+                   if obj.cshape.touches_point(x, y))
+
+    def objs_into_box(self, minx, maxx, miny, maxy):
+        packed_box = (minx, maxx, miny, maxy)
+        return set(obj for obj in self._iter_objs_in_aabb(packed_box)
+                   if obj.cshape.fits_in_box(packed_box))
+
+    def _fat_aabb(self, aabb):
+        m = self.margin
+        return (aabb[0] - m, aabb[1] + m, aabb[2] - m, aabb[3] + m)
+
+    def _iter_objs_in_aabb(self, aabb, inflate=0.0):
+        # objs whose stored aabb overlaps aabb inflated by 'inflate'
+        if self._root is None:
+            return
+        minx, maxx, miny, maxy = aabb
+        minx -= inflate
+        maxx += inflate
+        miny -= inflate
+        maxy += inflate
+        stack = [self._root]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            node = pop()
+            b = node.aabb
+            if b[0] > maxx or b[1] < minx or b[2] > maxy or b[3] < miny:
+                continue
+            if node.height == 0:
+                yield node.obj
+            else:
+                push(node.left)
+                push(node.right)
+
+    def _insert_leaf(self, leaf):
+        if self._root is None:
+            self._root = leaf
+            leaf.parent = None
+            return
+
+        # find the best sibling for leaf, by the surface area heuristic
+        # (perimeter in 2D), descending while it is cheaper to push leaf down
+        box = leaf.aabb
+        node = self._root
+        while node.height > 0:
+            perimeter = _aabb_perimeter(node.aabb)
+            combined = _aabb_perimeter(_aabb_union(node.aabb, box))
+            # cost of making a new parent for node and leaf
+            cost = 2.0 * combined
+            # minimum cost of pushing leaf further down
+            inheritance = 2.0 * (combined - perimeter)
+            costs = []
+            for child in (node.left, node.right):
+                enlarged = _aabb_perimeter(_aabb_union(child.aabb, box))
+                if child.height > 0:
+                    enlarged -= _aabb_perimeter(child.aabb)
+                costs.append(enlarged + inheritance)
+            if cost < costs[0] and cost < costs[1]:
+                break
+            node = node.left if costs[0] < costs[1] else node.right
+
+        # new parent for sibling and leaf
+        sibling = node
+        old_parent = sibling.parent
+        new_parent = _TreeNode(_aabb_union(box, sibling.aabb))
+        new_parent.parent = old_parent
+        new_parent.height = sibling.height + 1
+        new_parent.left = sibling
+        new_parent.right = leaf
+        sibling.parent = new_parent
+        leaf.parent = new_parent
+        if old_parent is None:
+            self._root = new_parent
+        elif old_parent.left is sibling:
+            old_parent.left = new_parent
+        else:
+            old_parent.right = new_parent
+
+        self._refit(leaf.parent)
+
+    def _remove_leaf(self, leaf):
+        if leaf is self._root:
+            self._root = None
+            return
+        parent = leaf.parent
+        grand_parent = parent.parent
+        sibling = parent.right if parent.left is leaf else parent.left
+        leaf.parent = None
+        if grand_parent is None:
+            self._root = sibling
+            sibling.parent = None
+            return
+        if grand_parent.left is parent:
+            grand_parent.left = sibling
+        else:
+            grand_parent.right = sibling
+        sibling.parent = grand_parent
+        self._refit(grand_parent)
+
+    def _refit(self, node):
+        # walk up to the root rebalancing and fixing heights and aabbs
+        while node is not None:
+            node = self._balance(node)
+            left, right = node.left, node.right
+            node.height = 1 + max(left.height, right.height)
+            node.aabb = _aabb_union(left.aabb, right.aabb)
+            node = node.parent
+
+    def _balance(self, a):
+        # if a is unbalanced rotates its taller child up; returns the node
+        # that now takes the place of a
+        if a.height < 2:
+            return a
+        b, c = a.left, a.right
+        balance = c.height - b.height
+        if -1 <= balance <= 1:
+            return a
+
+        # rotate the taller child up
+        if balance > 1:
+            up, keep = c, b
+        else:
+            up, keep = b, c
+        f, g = up.left, up.right
+        up.left = a
+        up.parent = a.parent
+        a.parent = up
+        if up.parent is None:
+            self._root = up
+        elif up.parent.left is a:
+            up.parent.left = up
+        else:
+            up.parent.right = up
+
+        # the taller grandchild stays with up, the other goes to a
+        if f.height > g.height:
+            stay, move = f, g
+        else:
+            stay, move = g, f
+        up.right = stay
+        if balance > 1:
+            a.right = move
+        else:
+            a.left = move
+        move.parent = a
+        a.aabb = _aabb_union(keep.aabb, move.aabb)
+        a.height = 1 + max(keep.height, move.height)
+        up.aabb = _aabb_union(a.aabb, stay.aabb)
+        up.height = 1 + max(a.height, stay.height)
+        return up
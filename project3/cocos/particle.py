@@ -83,6 +83,9 @@ class ExceptionNoEmptyParticle(Exception):
 rand = lambda: random.random() * 2 - 1
 """Function generating a random float beween -1.0 and 1.0."""
 
+rand_array = lambda shape: numpy.random.uniform(-1.0, 1.0, shape)
+"""Function generating an array of random floats beween -1.0 and 1.0."""
+
 
 # PointerToNumpy by Gary Herron
 # from pyglet's user list
@@ -238,7 +241,8 @@ class ParticleSystem(CocosNode):
         """
         super(ParticleSystem, self).__init__()
 
-        # particles
+        # particles; live particles are kept compacted at the front of the
+        # buffers, the slots from particle_count on are free
         # position x 2
         self.particle_pos = numpy.zeros((self.total_particles, 2), numpy.float32)
         # direction x 2
@@ -263,6 +267,15 @@ class ParticleSystem(CocosNode):
         # start position
         self.start_pos = numpy.zeros((self.total_particles, 2), numpy.float32)
 
+        # scratch buffers for update_particles
+        self._norm = numpy.zeros((self.total_particles, 1), numpy.float32)
+        self._unit = numpy.zeros((self.total_particles, 2), numpy.float32)
+        self._accel = numpy.zeros((self.total_particles, 2), numpy.float32)
+        self._tmp = numpy.zeros(self.total_particles, numpy.float32)
+        self._color_step = numpy.zeros((self.total_particles, 4), numpy.float32)
+        self._alive = numpy.zeros(self.total_particles, bool)
+        self._origin = numpy.zeros(2, numpy.float32)
+
         #: How many particles can be emitted per second
         self.emit_counter = 0
 
@@ -433,7 +446,7 @@ class ParticleSystem(CocosNode):
         self.sprite_shader.usetTex('sprite_texture', 0,
                                    gl.GL_TEXTURE_2D, self.texture.id)
 
-        gl.glDrawArrays(gl.GL_POINTS, 0, self.total_particles)
+        gl.glDrawArrays(gl.GL_POINTS, 0, self.particle_count)
 
         self.sprite_shader.uninstall()
         # un -blend
@@ -467,9 +480,6 @@ class ParticleSystem(CocosNode):
         Arguments:
             delta (float): time in seconds since last frame.
         """
-        # update particle count
-        self.particle_count = numpy.sum(self.particle_life >= 0)
-
         if self.active:
             rate = 1.0 / self.emission_rate
             self.emit_counter += delta
@@ -477,9 +487,10 @@ class ParticleSystem(CocosNode):
             #            if random.random() < 0.01:
             #                delta += 0.5
 
-            while self.particle_count < self.total_particles and self.emit_counter > rate:
-                self.add_particle()
-                self.emit_counter -= rate
+            # emit all the particles due this frame at once
+            if self.emit_counter > rate:
+                count = int(math.ceil(self.emit_counter / rate)) - 1
+                self.emit_counter -= self.emit(count) * rate
 
             self.elapsed += delta
 
@@ -502,7 +513,27 @@ class ParticleSystem(CocosNode):
         It is acceptable to ``try: ... except...: pass``
         """
         self.init_particle()
-        self.particle_count += 1
+
+    def emit(self, count):
+        """Emits up to count new particles at once.
+
+        The new particles take the free slots right after the live ones, and
+        are initialized all together.
+
+        Arguments:
+            count (int): how many particles to emit.
+
+        Returns:
+            int: how many particles were emitted; less than count if the
+            system has not room for all of them.
+        """
+        count = min(count, self.total_particles - self.particle_count)
+        if count <= 0:
+            return 0
+        start = self.particle_count
+        self.particle_count += count
+        self._init_particles(start, self.particle_count)
+        return count
 
     def stop_system(self):
         """Stop the particle system."""
@@ -518,126 +549,142 @@ class ParticleSystem(CocosNode):
     def update_particles(self, delta):
         """Updates particles position.
 
+        Only the live particles, at the front of the buffers, are updated, and
+        intermediate results go to preallocated scratch buffers.
+
         Arguments:
             delta (float): time in seconds since last frame.
         """
+        n = self.particle_count
+        pos = self.particle_pos[:n]
+        dir = self.particle_dir[:n]
+        norm = self._norm[:n]
+        unit = self._unit[:n]
+        accel = self._accel[:n]
+        tmp = self._tmp[:n]
+
         # radial: posx + posy
-        norm = numpy.sqrt(self.particle_pos[:, 0] ** 2 + self.particle_pos[:, 1] ** 2)
+        numpy.hypot(pos[:, 0], pos[:, 1], out=norm[:, 0])
         # XXX prevent div by 0
-        norm = numpy.select([norm == 0], [0.0000001], default=norm)
-        posx = self.particle_pos[:, 0] / norm
-        posy = self.particle_pos[:, 1] / norm
-
-        radial = numpy.array([posx, posy])
-        tangential = numpy.array([-posy, posx])
-
-        # update dir
-        radial = numpy.swapaxes(radial, 0, 1)
-        radial *= self.particle_rad
-        tangential = numpy.swapaxes(tangential, 0, 1)
-        tangential *= self.particle_tan
-
-        self.particle_dir += (tangential + radial + self.particle_grav) * delta
+        numpy.maximum(norm, 0.0000001, out=norm)
+        numpy.divide(pos, norm, out=unit)
+
+        # update dir: radial + tangential + gravity
+        numpy.multiply(unit, self.particle_rad[:n], out=accel)
+        tan = self.particle_tan[:n, 0]
+        numpy.multiply(unit[:, 1], tan, out=tmp)
+        accel[:, 0] -= tmp
+        numpy.multiply(unit[:, 0], tan, out=tmp)
+        accel[:, 1] += tmp
+        accel += self.particle_grav[:n]
+        accel *= delta
+        dir += accel
 
         # update pos with updated dir
-        self.particle_pos += self.particle_dir * delta
+        numpy.multiply(dir, delta, out=accel)
+        pos += accel
 
         # life
-        self.particle_life -= delta
+        self.particle_life[:n] -= delta
 
         # position: free or grouped
         if self.position_type == self.POSITION_FREE:
-            tuple = numpy.array([self.x, self.y])
-            tmp = tuple - self.start_pos
-            self.particle_pos -= tmp
+            origin = self._origin
+            origin[0] = self.x
+            origin[1] = self.y
+            numpy.subtract(self.start_pos[:n], origin, out=accel)
+            pos += accel
 
         # color
-        self.particle_color += self.particle_delta_color * delta
+        color_step = self._color_step[:n]
+        numpy.multiply(self.particle_delta_color[:n], delta, out=color_step)
+        self.particle_color[:n] += color_step
 
-        # if life < 0, set alpha in 0
-        self.particle_color[:, 3] = numpy.select([self.particle_life[:, 0] < 0], [0],
-                                                 default=self.particle_color[:, 3])
-
-        # print self.particles[0]
-        # print self.pas[0,0:4]
+        self._free_dead_particles()
 
     def init_particle(self):
         """Set initial particles state."""
-        # position
-        # p=self.particles[idx]
-
-        a = self.particle_life < 0
-        idxs = a.nonzero()
-
-        idx = -1
-
-        if len(idxs[0]) > 0:
-            idx = idxs[0][0]
-        else:
+        if not self.emit(1):
             raise ExceptionNoEmptyParticle()
 
+    def _init_particles(self, start, stop):
+        """Set initial state for the particles in slots [start, stop)."""
+        idx = slice(start, stop)
+        count = stop - start
+
         # position
-        self.particle_pos[idx][0] = self.pos_var.x * rand()
-        self.particle_pos[idx][1] = self.pos_var.y * rand()
+        self.particle_pos[idx, 0] = self.pos_var.x * rand_array(count)
+        self.particle_pos[idx, 1] = self.pos_var.y * rand_array(count)
 
         # start position
-        self.start_pos[idx][0] = self.x
-        self.start_pos[idx][1] = self.y
+        self.start_pos[idx] = self.x, self.y
 
-        a = math.radians(self.angle + self.angle_var * rand())
-        v = Point2(math.cos(a), math.sin(a))
-        s = self.speed + self.speed_var * rand()
-
-        dir = v * s
+        a = numpy.radians(self.angle + self.angle_var * rand_array(count))
+        s = self.speed + self.speed_var * rand_array(count)
 
         # direction
-        self.particle_dir[idx][0] = dir.x
-        self.particle_dir[idx][1] = dir.y
+        self.particle_dir[idx, 0] = numpy.cos(a) * s
+        self.particle_dir[idx, 1] = numpy.sin(a) * s
 
         # radial accel
-        self.particle_rad[idx] = self.radial_accel + self.radial_accel_var * rand()
+        self.particle_rad[idx, 0] = self.radial_accel + self.radial_accel_var * rand_array(count)
 
         # tangential accel
-        self.particle_tan[idx] = self.tangential_accel + self.tangential_accel_var * rand()
+        self.particle_tan[idx, 0] = self.tangential_accel + self.tangential_accel_var * rand_array(count)
 
         # life
-        life = self.particle_life[idx] = self.life + self.life_var * rand()
+        life = self.life + self.life_var * rand_array(count)
+        self.particle_life[idx, 0] = life
 
         # Color
         # start
-        sr = self.start_color.r + self.start_color_var.r * rand()
-        sg = self.start_color.g + self.start_color_var.g * rand()
-        sb = self.start_color.b + self.start_color_var.b * rand()
-        sa = self.start_color.a + self.start_color_var.a * rand()
-
-        self.particle_color[idx][0] = sr
-        self.particle_color[idx][1] = sg
-        self.particle_color[idx][2] = sb
-        self.particle_color[idx][3] = sa
+        start = (numpy.array(self.start_color.to_array()) +
+                 numpy.array(self.start_color_var.to_array()) * rand_array((count, 4)))
+        self.particle_color[idx] = start
 
         # end
-        er = self.end_color.r + self.end_color_var.r * rand()
-        eg = self.end_color.g + self.end_color_var.g * rand()
-        eb = self.end_color.b + self.end_color_var.b * rand()
-        ea = self.end_color.a + self.end_color_var.a * rand()
-
-        delta_color_r = (er - sr) / life
-        delta_color_g = (eg - sg) / life
-        delta_color_b = (eb - sb) / life
-        delta_color_a = (ea - sa) / life
-
-        self.particle_delta_color[idx][0] = delta_color_r
-        self.particle_delta_color[idx][1] = delta_color_g
-        self.particle_delta_color[idx][2] = delta_color_b
-        self.particle_delta_color[idx][3] = delta_color_a
+        end = (numpy.array(self.end_color.to_array()) +
+               numpy.array(self.end_color_var.to_array()) * rand_array((count, 4)))
+        self.particle_delta_color[idx] = (end - start) / life[:, numpy.newaxis]
 
         # size
-        self.particle_size[idx] = self.size + self.size_var * rand()
+        self.particle_size[idx, 0] = self.size + self.size_var * rand_array(count)
         self._scale_particle_size()
 
         # gravity
-        self.particle_grav[idx][0] = self.gravity.x
-        self.particle_grav[idx][1] = self.gravity.y
+        self.particle_grav[idx] = self.gravity.x, self.gravity.y
+
+    def _free_dead_particles(self):
+        """Frees the slots of the particles that died.
+
+        The dead particles among the ones that stay live are overwritten by
+        the live particles past the new particle_count, so the live particles
+        stay compacted at the front of the buffers.
+        """
+        n = self.particle_count
+        alive = self._alive[:n]
+        numpy.greater_equal(self.particle_life[:n, 0], 0, out=alive)
+        count = numpy.count_nonzero(alive)
+        if count == n:
+            return
+        holes = numpy.flatnonzero(~alive[:count])
+        movers = count + numpy.flatnonzero(alive[count:])
+        for a in self._particle_arrays():
+            a[holes] = a[movers]
+        # free slots are dead and invisible
+        self.particle_life[count:n] = -1.0
+        self.particle_color[count:n, 3] = 0.0
+        self.particle_count = count
+
+    def _particle_arrays(self):
+        """The buffers holding per particle state."""
+        arrays = [self.particle_pos, self.particle_dir, self.particle_rad,
+                  self.particle_tan, self.particle_grav, self.particle_color,
+                  self.particle_delta_color, self.particle_life,
+                  self.particle_size, self.start_pos]
+        if self.particle_size_scaled is not self.particle_size:
+            arrays.append(self.particle_size_scaled)
+        return arrays
 
     # Below only fallback functionality.
     # It uses quads instehad of point sprites, doing a transformation
@@ -690,7 +737,7 @@ class ParticleSystem(CocosNode):
         else:
             gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
 
-        gl.glDrawArrays(gl.GL_QUADS, 0, len(self.vertexs) * 4)
+        gl.glDrawArrays(gl.GL_QUADS, 0, self.particle_count * 4)
 
         # un -blend
         gl.glPopAttrib()
@@ -46,10 +46,11 @@ __version__ = '$Id: resource.py 1078 2007-08-01 03:43:38Z r1chardj0n3s $'
 
 import os
 from math import ceil, sqrt, floor
-import struct
 import weakref
 from xml.etree import ElementTree
 
+import numpy
+
 import pyglet
 from pyglet import gl
 import pyglet.text.formats.html as p_html
@@ -344,6 +345,10 @@ def load_tmx(filename):
                         value = int(value)
                     tile.properties[name] = value
 
+    # tilesets by firstgid, so the tileset of a gid is found with searchsorted
+    tilesets_by_gid = sorted(tilesets, key=lambda ts: ts.firstgid)
+    firstgids = numpy.array([ts.firstgid for ts in tilesets_by_gid], dtype=numpy.int64)
+
     # now load all the layers
     for layer in map.findall('layer'):
         data = layer.find('data')
@@ -354,12 +359,12 @@ def load_tmx(filename):
         compression = data.attrib.get('compression')
         if encoding is None:
             # tiles data as xml
-            data = [int(tile.attrib.get('gid')) for tile in data.findall('tile')]
+            gids = numpy.array([int(tile.attrib.get('gid')) for tile in data.findall('tile')],
+                               dtype=numpy.int32)
         else:
             data = data.text.strip()
             if encoding == 'csv':
-                data.replace('\n', '')
-                data = [int(s) for s in data.split(',')]
+                gids = numpy.fromstring(data, dtype=numpy.int32, sep=',')
             elif encoding == 'base64':
                 data = decode_base64(data)
                 if compression == 'zlib':
@@ -370,27 +375,18 @@ def load_tmx(filename):
                     pass
                 else:
                     raise ResourceError('Unknown compression method: %r' % compression)
-                data = struct.unpack(str('<%di' % (len(data) // 4)), data)
+                gids = numpy.frombuffer(data, dtype='<i4').astype(numpy.int32)
             else:
                 raise TmxUnsupportedVariant("Unsupported tiles layer format " +
                                             "use 'csv', 'xml' or one of " +
                                             "the 'base64'")
 
-        assert len(data) == width * height
+        assert len(gids) == width * height
 
-        cells = [[None] * height for x in range(width)]
-        for n, gid in enumerate(data):
-            if gid < 1:
-                tile = None
-            else:
-                # UGH
-                for ts in tilesets:
-                    if gid in ts:
-                        tile = ts[gid]
-                        break
-            i = n % width
-            j = height - (n // width + 1)
-            cells[i][j] = cell_cls(i, j, tile_width, tile_height, {}, tile)
+        # rows come top first, cells are column-major with y increasing up
+        gids = numpy.ascontiguousarray(gids.reshape(height, width)[::-1].T)
+        tiles = tiles_for_gids(numpy.unique(gids), tilesets_by_gid, firstgids)
+        cells = TileGridCells(gids, tiles, cell_cls, tile_width, tile_height)
 
         id = layer.attrib['name']
 
@@ -407,6 +403,22 @@ def load_tmx(filename):
     return resource
 
 
+def tiles_for_gids(gids, tilesets, firstgids):
+    """Returns a dict mapping each gid in gids to its Tile.
+
+    tilesets must be sorted by firstgid, and firstgids hold their firstgid.
+    gids below 1, or not in their tileset, map to None (no tile).
+    """
+    owners = numpy.searchsorted(firstgids, gids, side='right') - 1
+    tiles = {}
+    for gid, k in zip(gids.tolist(), owners.tolist()):
+        tile = None
+        if gid >= 1 and k >= 0:
+            tile = tilesets[k].get(gid)
+        tiles[gid] = tile
+    return tiles
+
+
 #
 # XML PROPERTY PARSING
 #
@@ -733,10 +745,25 @@ class MapLayer(cocos.layer.ScrollableLayer):
 
     The debug flag turns on textual display of data about each visible cell
     including its cell index, origin pixel and any properties set on the cell.
+
+    When the view moves only the cells entering or leaving it are processed,
+    and the sprites of the cells that left are kept in a pool for reuse.
     """
 
+    #: if set to an int n the cells are drawn from prebuilt vertex lists, one
+    #: per block of n x n cells, instead of one sprite per cell; good for big
+    #: layers that don't change. Changing a cell color or opacity rebuilds its
+    #: block. Call set_dirty after changing it.
+    chunk_size = None
+
     def __init__(self, properties):
         self._sprites = {}
+        # hidden sprites ready for reuse
+        self._sprite_pool = []
+        # (ci, cj) -> vertex lists of the block of cells, when using chunk_size
+        self._chunks = {}
+        # cell index bounds (i0, i1, j0, j1) drawn for the current view
+        self._drawn_bounds = None
         self.properties = properties
         super(MapLayer, self).__init__()
 
@@ -756,7 +783,15 @@ class MapLayer(cocos.layer.ScrollableLayer):
 
     def set_dirty(self):
         # re-calculate the sprites to draw for the view
+        for s in self._sprites.values():
+            s.delete()
         self._sprites.clear()
+        for s in self._sprite_pool:
+            s.delete()
+        del self._sprite_pool[:]
+        for key in list(self._chunks):
+            self._delete_chunk(key)
+        self._drawn_bounds = None
         self._update_sprite_set()
 
     def set_view(self, x, y, w, h, viewport_x=0, viewport_y=0):
@@ -795,7 +830,7 @@ class MapLayer(cocos.layer.ScrollableLayer):
 
     def set_debug(self, debug):
         self.debug = debug
-        self._update_sprite_set()
+        self.set_dirty()
 
     def set_cell_opacity(self, i, j, opacity):
         cell = self.get_cell(i, j)
@@ -809,6 +844,7 @@ class MapLayer(cocos.layer.ScrollableLayer):
         key = cell.origin[:2]
         if key in self._sprites:
             self._sprites[key].opacity = opacity
+        self._rebuild_chunk_of(i, j)
 
     def set_cell_color(self, i, j, color):
         cell = self.get_cell(i, j)
@@ -824,29 +860,32 @@ class MapLayer(cocos.layer.ScrollableLayer):
         key = cell.origin[:2]
         if key in self._sprites:
             self._sprites[key].color = color
+        self._rebuild_chunk_of(i, j)
 
     def _update_sprite_set(self):
-        # update the sprites set
-        keep = set()
-        for cell in self.get_visible_cells():
-            cx, cy = key = cell.origin[:2]
-            keep.add(key)
+        # update the sprites set for the cells that entered or left the view
+        x, y = self.view_x, self.view_y
+        bounds = self.get_region_bounds(x, y, x + self.view_w, y + self.view_h)
+        drawn = self._drawn_bounds
+        if bounds == drawn:
+            return
+        self._drawn_bounds = bounds
+        if self.chunk_size and not self.debug:
+            self._update_chunks(bounds)
+            return
+
+        for i, j in _iter_bounds_difference(drawn, bounds):
+            key = self.get_cell(i, j).origin[:2]
+            if key in self._sprites:
+                self._release_sprite(key)
+        for i, j in _iter_bounds_difference(bounds, drawn):
+            cell = self.get_cell(i, j)
             if cell.tile is None:
                 continue
-            if key in self._sprites:
-                s = self._sprites[key]
-            else:
-                s = pyglet.sprite.Sprite(cell.tile.image,
-                                         x=cx, y=cy, batch=self.batch)
-                if 'color4' in cell.properties:
-                    r, g, b, a = cell.properties['color4']
-                    s.color = (r, g, b)
-                    s.opacity = a
-                self._sprites[key] = s
+            s = self._sprites[cell.origin[:2]] = self._take_sprite(cell)
 
             if self.debug:
-                if getattr(s, '_label', None):
-                    continue
+                cx, cy = cell.origin[:2]
                 label = [
                     'cell=%d,%d' % (cell.i, cell.j),
                     'origin=%d,%d px' % (cx, cy),
@@ -863,10 +902,86 @@ class MapLayer(cocos.layer.ScrollableLayer):
                     batch=self.batch)
             else:
                 s._label = None
-        for k in list(self._sprites):
-            if k not in keep and k in self._sprites:
-                self._sprites[k]._label = None
-                del self._sprites[k]
+
+    def _take_sprite(self, cell):
+        # a sprite showing cell, from the pool if possible
+        cx, cy = cell.origin[:2]
+        if self._sprite_pool:
+            s = self._sprite_pool.pop()
+            s.image = cell.tile.image
+            s.set_position(cx, cy)
+            s.color = (255, 255, 255)
+            s.opacity = 255
+            s.visible = True
+        else:
+            s = pyglet.sprite.Sprite(cell.tile.image,
+                                     x=cx, y=cy, batch=self.batch)
+        if 'color4' in cell.properties:
+            r, g, b, a = cell.properties['color4']
+            s.color = (r, g, b)
+            s.opacity = a
+        return s
+
+    def _release_sprite(self, key):
+        s = self._sprites.pop(key)
+        s._label = None
+        s.visible = False
+        self._sprite_pool.append(s)
+
+    def _update_chunks(self, bounds):
+        # build the blocks of cells entering the view, delete the ones leaving
+        n = self.chunk_size
+        i0, i1, j0, j1 = bounds
+        visible = set((ci, cj)
+                      for ci in range(i0 // n, (i1 + n - 1) // n)
+                      for cj in range(j0 // n, (j1 + n - 1) // n))
+        for key in list(self._chunks):
+            if key not in visible:
+                self._delete_chunk(key)
+        for key in visible:
+            if key not in self._chunks:
+                self._chunks[key] = self._build_chunk(*key)
+
+    def _build_chunk(self, ci, cj):
+        # vertex lists drawing the block of cells (ci, cj), one per texture
+        n = self.chunk_size
+        quads = {}
+        for i in range(ci * n, min((ci + 1) * n, len(self.cells))):
+            for j in range(cj * n, min((cj + 1) * n, len(self.cells[0]))):
+                cell = self.get_cell(i, j)
+                if cell is None or cell.tile is None:
+                    continue
+                image = cell.tile.image
+                texture = image.get_texture()
+                x, y = cell.origin[:2]
+                x2, y2 = x + image.width, y + image.height
+                color = cell.properties.get('color4', (255, 255, 255, 255))
+                vertices, tex_coords, colors = quads.setdefault(texture, ([], [], []))
+                vertices.extend((x, y, x2, y, x2, y2, x, y2))
+                tex_coords.extend(texture.tex_coords)
+                colors.extend(tuple(color) * 4)
+        vertex_lists = []
+        for texture, (vertices, tex_coords, colors) in quads.items():
+            group = pyglet.sprite.SpriteGroup(texture, gl.GL_SRC_ALPHA,
+                                              gl.GL_ONE_MINUS_SRC_ALPHA)
+            vertex_lists.append(self.batch.add(
+                len(vertices) // 2, gl.GL_QUADS, group,
+                ('v2f/static', vertices), ('t3f/static', tex_coords),
+                ('c4B/static', colors)))
+        return vertex_lists
+
+    def _delete_chunk(self, key):
+        for vertex_list in self._chunks.pop(key):
+            vertex_list.delete()
+
+    def _rebuild_chunk_of(self, i, j):
+        # after a change in cell (i, j)
+        if not self.chunk_size:
+            return
+        key = (i // self.chunk_size, j // self.chunk_size)
+        if key in self._chunks:
+            self._delete_chunk(key)
+            self._chunks[key] = self._build_chunk(*key)
 
     def find_cells(self, **requirements):
         """Find all cells that match the properties specified.
@@ -877,6 +992,8 @@ class MapLayer(cocos.layer.ScrollableLayer):
 
         Return a list of Cell instances.
         """
+        if isinstance(self.cells, TileGridCells):
+            return self.cells.find_cells(**requirements)
         r = []
         for col in self.cells:
             for cell in col:
@@ -888,6 +1005,136 @@ class MapLayer(cocos.layer.ScrollableLayer):
         return r
 
 
+def _iter_bounds_difference(bounds, other):
+    """Yields the (i, j) within the cell index bounds (i0, i1, j0, j1) that
+    are not within other; other can be None (yields all).
+    """
+    if bounds is None:
+        return
+    i0, i1, j0, j1 = bounds
+    if other is None:
+        other = (0, 0, 0, 0)
+    oi0, oi1, oj0, oj1 = other
+    for i in range(i0, i1):
+        if oi0 <= i < oi1 and oj0 < oj1:
+            spans = ((j0, min(j1, oj0)), (max(j0, oj1), j1))
+        else:
+            spans = ((j0, j1),)
+        for lo, hi in spans:
+            for j in range(lo, hi):
+                yield i, j
+
+
+class TileGridCells(object):
+    """Cells of a map layer stored as an array of tile gids.
+
+    It can be used as the cells of a map: cells[i][j], len(cells) and
+    iterating over columns work as with a list of lists of cells, but a Cell
+    is only created the first time it is accessed, and then reused.
+
+    Attributes::
+
+        gids            -- int array [i, j] of tile gids, 0 is no tile
+        tiles           -- dict mapping each gid in gids to its Tile or None
+    """
+
+    def __init__(self, gids, tiles, cell_cls, tw, th):
+        self.gids = gids
+        self.tiles = tiles
+        self.cell_cls = cell_cls
+        self.tw, self.th = tw, th
+        self._cells = {}
+        # tile property name -> {value: gids with that value}
+        self._property_index = {}
+        self._columns = [_TileGridColumn(self, i) for i in range(gids.shape[0])]
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __getitem__(self, i):
+        return self._columns[i]
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def get_cell(self, i, j):
+        """Return the Cell at (i, j), creating it if needed."""
+        key = (i, j)
+        cell = self._cells.get(key)
+        if cell is None:
+            tile = self.tiles[int(self.gids[i, j])]
+            cell = self._cells[key] = self.cell_cls(i, j, self.tw, self.th, {}, tile)
+        return cell
+
+    def set_cell(self, i, j, cell):
+        self._cells[(i, j)] = cell
+
+    def find_cells(self, **requirements):
+        """Find all cells that match the properties specified, as
+        MapLayer.find_cells.
+
+        Tile properties are matched through per property indexes of the
+        tiles, so only the cells already created are checked one by one.
+        """
+        if requirements:
+            gids = None
+            for name, value in requirements.items():
+                matching = set(self._tile_property_index(name).get(value, ()))
+                gids = matching if gids is None else gids & matching
+            mask = numpy.isin(self.gids, list(gids))
+        else:
+            mask = numpy.ones(self.gids.shape, dtype=bool)
+
+        # created cells may have their own properties or tile
+        for (i, j), cell in self._cells.items():
+            for k in requirements:
+                if cell.get(k) != requirements[k]:
+                    mask[i, j] = False
+                    break
+            else:
+                mask[i, j] = True
+
+        return [self.get_cell(i, j)
+                for i, j in zip(*(index.tolist() for index in mask.nonzero()))]
+
+    def _tile_property_index(self, name):
+        index = self._property_index.get(name)
+        if index is None:
+            index = self._property_index[name] = {}
+            for gid, tile in self.tiles.items():
+                value = None if tile is None else tile.properties.get(name)
+                index.setdefault(value, []).append(gid)
+        return index
+
+
+class _TileGridColumn(object):
+    # column i of a TileGridCells, behaves as a list of cells
+    __slots__ = ('grid', 'i')
+
+    def __init__(self, grid, i):
+        self.grid = grid
+        self.i = i
+
+    def __len__(self):
+        return self.grid.gids.shape[1]
+
+    def __getitem__(self, j):
+        height = self.grid.gids.shape[1]
+        if j < 0:
+            j += height
+        if not 0 <= j < height:
+            raise IndexError('cell index out of range')
+        return self.grid.get_cell(self.i, j)
+
+    def __setitem__(self, j, cell):
+        self.grid.set_cell(self.i, j, cell)
+
+    def __iter__(self):
+        get_cell = self.grid.get_cell
+        for j in range(len(self)):
+            yield get_cell(self.i, j)
+
+
 class RegularTesselationMap(object):
     """A regularly tesselated map that allows access to its cells by index
     (i, j).
@@ -967,15 +1214,22 @@ class RectMap(RegularTesselationMap):
             boundaries intersects some cells: the ones that the open segment
             intersects
         """
+        i0, i1, j0, j1 = self.get_region_bounds(left, bottom, right, top)
+        return [self.cells[i][j]
+                for i in range(i0, i1)
+                for j in range(j0, j1)]
+
+    def get_region_bounds(self, left, bottom, right, top):
+        """Return the cell index bounds (i0, i1, j0, j1) of the cells
+        get_in_region returns: i0 <= i < i1, j0 <= j < j1.
+        """
         ox = self.origin_x
         oy = self.origin_y
         left = max(0, (left - ox) // self.tw)
         bottom = max(0, (bottom - oy) // self.th)
         right = min(len(self.cells), ceil(float(right - ox) / self.tw))
         top = min(len(self.cells[0]), ceil(float(top - oy) / self.th))
-        return [self.cells[i][j]
-                for i in range(int(left), int(right))
-                for j in range(int(bottom), int(top))]
+        return int(left), int(right), int(bottom), int(top)
 
     def get_key_at_pixel(self, x, y):
         """returns the grid coordinates for the hex that covers the point (x, y)"""
@@ -1225,6 +1479,15 @@ class HexMap(RegularTesselationMap):
         """Return cells (in [column][row]) that are within the pixel bounds
         specified by the bottom-left (left, bottom) and top-right (right, top) corners.
         """
+        i0, i1, j0, j1 = self.get_region_bounds(left, bottom, right, top)
+        return [self.cells[i][j]
+                for i in range(i0, i1)
+                for j in range(j0, j1)]
+
+    def get_region_bounds(self, left, bottom, right, top):
+        """Return the cell index bounds (i0, i1, j0, j1) of the cells
+        get_in_region returns: i0 <= i < i1, j0 <= j < j1.
+        """
         ox = self.origin_x
         oy = self.origin_y
         col_width = self.tw // 2 + self.tw // 4
@@ -1232,9 +1495,7 @@ class HexMap(RegularTesselationMap):
         bottom = max(0, (bottom - oy) // self.th - 1)
         right = min(len(self.cells), right // col_width + 1)
         top = min(len(self.cells[0]), top // self.th + 1)
-        return [self.cells[i][j]
-                for i in range(int(left), int(right))
-                for j in range(int(bottom), int(top))]
+        return int(left), int(right), int(bottom), int(top)
 
     # XXX add get_from_screen
 
@@ -141,6 +141,9 @@ of the system clock.
 __docformat__ = 'restructuredtext'
 __version__ = '$Id$'
 
+import bisect
+import heapq
+import itertools
 import time
 import ctypes
 
@@ -192,6 +195,9 @@ class _ScheduledIntervalItem(object):
         self.args = args
         self.kwargs = kwargs
 
+# Running maximum of next_ts before any item of a tick
+_NEVER = float('-inf')
+
 def _dummy_schedule_func(*args, **kwargs):
     '''Dummy function that does nothing, placed onto zombie scheduled items
     to ensure they have no side effect if already queued inside tick() method.
@@ -218,9 +224,35 @@ class Clock(_ClockBase):
     # List of functions to call every tick.
     _schedule_items = None
 
-    # List of schedule interval items kept in sort order.
+    # Heap of (next_ts, seq, item) for the schedule interval items.  Entries
+    # of unscheduled items are not searched for: the item's next_ts is set to
+    # None and the entry is dropped when it reaches the top of the heap.
+    #
+    # seq breaks ties the way the old sorted list did: newly scheduled items
+    # go after those already due at the same time, rescheduled items go
+    # before them (in the order they were called).
     _schedule_interval_items = None
 
+    # Dict of func to the list of its schedule interval items.
+    _schedule_interval_funcs = None
+
+    # List of the schedule interval items whose func is unhashable, searched
+    # by equality on unschedule.
+    _schedule_interval_unhashable = None
+
+    # Sorted next_ts of the schedule interval items in the heap for soft
+    # scheduling, or None if it must be rebuilt.
+    _soft_next_ts = None
+
+    # While interval items are being called: the items taken out of the
+    # heap, with the items scheduled among them by the callbacks, in the
+    # order a sorted list of all items would hold them.  The item being
+    # called is at `_tick_cursor`.  Before it `_tick_keys` holds the
+    # running maximum of next_ts, after it the next_ts (both ascending).
+    _tick_items = None
+    _tick_keys = None
+    _tick_cursor = 0
+
     # If True, a sleep(0) is inserted on every tick.   
     _force_sleep = False
 
@@ -250,6 +282,13 @@ class Clock(_ClockBase):
 
         self._schedule_items = []
         self._schedule_interval_items = []
+        self._schedule_interval_funcs = {}
+        self._schedule_interval_unhashable = []
+        # Count of entries of unscheduled items still in the heap (may be an
+        # overestimate), and the tie breakers for new and rescheduled items.
+        self._schedule_dead = 0
+        self._schedule_seq = itertools.count()
+        self._reschedule_seq = 0
 
     def update_time(self):
         '''Get the elapsed time since the last call to `update_time`.
@@ -299,14 +338,64 @@ class Clock(_ClockBase):
             result = True
             item.func(dt, *item.args, **item.kwargs)
 
+        # Take out the interval items that are due before calling any of
+        # them, so items scheduled by the callbacks wait for the next tick.
+        heap = self._schedule_interval_items
+        due = []
+        while heap and heap[0][0] <= ts:
+            item = heapq.heappop(heap)[2]
+            if item.next_ts is None:
+                self._schedule_dead -= 1
+            else:
+                due.append(item)
+        if not due:
+            return result
+
+        self._soft_next_ts = None
+        outer = self._tick_items, self._tick_keys, self._tick_cursor
+        self._tick_items = items = list(due)
+        self._tick_keys = [item.next_ts for item in due]
+        self._tick_cursor = 0
+        try:
+            self._call_interval_items(due, ts)
+        finally:
+            self._tick_items, self._tick_keys, self._tick_cursor = outer
+            # Put the items back, before everything already in the heap
+            # with the same next_ts.
+            items = [item for item in items if item.next_ts is not None]
+            self._reschedule_seq -= len(items)
+            seq = self._reschedule_seq
+            for item in items:
+                self._push_interval_item(item, seq)
+                seq += 1
+
+        return True
+
+    def _call_interval_items(self, due, ts):
+        '''Call the `due` interval items at time `ts` and reschedule them
+        (they are put back in the heap by the caller).'''
+        items = self._tick_items
+        keys = self._tick_keys
+        c = 0
         # Call all scheduled interval functions and reschedule for future.
-        need_resort = False
-        # Dupe list just in case one of the items unchedules itself
-        for item in list(self._schedule_interval_items):
-            if item.next_ts > ts:
-                break
-            result = True
+        for item in due:
+            # Move past the items before this one
+            top = keys[c - 1] if c else _NEVER
+            while items[c] is not item:
+                next_ts = items[c].next_ts
+                if next_ts is not None and next_ts > top:
+                    top = next_ts
+                keys[c] = top
+                c += 1
+            self._tick_cursor = c
+            if item.next_ts is None:
+                # Unscheduled by an earlier function
+                continue
             item.func(ts - item.last_ts, *item.args, **item.kwargs)
+            c = self._tick_cursor
+            if item.next_ts is None:
+                # Unscheduled itself
+                continue
             if item.interval:
                 # Try to keep timing regular, even if overslept this time;
                 # but don't schedule in the past (which could lead to
@@ -325,20 +414,36 @@ class Clock(_ClockBase):
                         # future.  Unfortunately means the next reported dt is
                         # incorrect (looks like interval but actually isn't).
                         item.last_ts = item.next_ts - item.interval
-                need_resort = True
             else:
+                # Finished one-shot
                 item.next_ts = None
+                self._forget_interval_item(item)
 
-        # Remove finished one-shots.
-        self._schedule_interval_items = \
-            [item for item in self._schedule_interval_items \
-             if item.next_ts is not None]
-
-        if need_resort:
-            # TODO bubble up changed items might be faster
-            self._schedule_interval_items.sort(key=lambda a: a.next_ts)
+    def _tick_find(self, candidate, match):
+        '''Return the index of the first item of the tick whose next_ts
+        matches, or None.
 
-        return result
+        `candidate` is True for the next_ts that may match and all larger
+        ones; it is used to skip ahead in the ascending keys.
+        '''
+        items = self._tick_items
+        keys = self._tick_keys
+        c = self._tick_cursor
+        for lo, hi in ((0, c), (c, c + 1), (c + 1, len(items))):
+            if hi - lo > 1:
+                first, last = lo, hi
+                while first < last:
+                    mid = (first + last) // 2
+                    if candidate(keys[mid]):
+                        last = mid
+                    else:
+                        first = mid + 1
+                lo = first
+            for i in range(lo, hi):
+                ts = items[i].next_ts
+                if ts is not None and match(ts):
+                    return i
+        return None
 
     def tick(self, poll=False):
         '''Signify that one frame has passed.
@@ -434,17 +539,27 @@ class Clock(_ClockBase):
                 return 0.
             else:
                 wake_time = self.next_ts
-                if self._schedule_interval_items:
-                    wake_time = min(wake_time,
-                                    self._schedule_interval_items[0].next_ts)
+                next_ts = self._get_next_interval_ts()
+                if next_ts is not None:
+                    wake_time = min(wake_time, next_ts)
                 return max(wake_time - self.time(), 0.)
 
-        if self._schedule_interval_items:
-            return max(self._schedule_interval_items[0].next_ts - self.time(),
-                       0)
+        next_ts = self._get_next_interval_ts()
+        if next_ts is not None:
+            return max(next_ts - self.time(), 0)
             
         return None
 
+    def _get_next_interval_ts(self):
+        # Time of the next schedule interval item, or None if there are none
+        heap = self._schedule_interval_items
+        while heap and heap[0][2].next_ts is None:
+            heapq.heappop(heap)
+            self._schedule_dead -= 1
+        if heap:
+            return heap[0][0]
+        return None
+
     def set_fps_limit(self, fps_limit):
         '''Set the framerate limit.
 
@@ -511,14 +626,44 @@ class Clock(_ClockBase):
     def _schedule_item(self, func, last_ts, next_ts, interval, *args, **kwargs):
         item = _ScheduledIntervalItem(
             func, interval, last_ts, next_ts, args, kwargs)
-
-        # Insert in sort order
-        for i, other in enumerate(self._schedule_interval_items):
-            if other.next_ts is not None and other.next_ts > next_ts:
-                self._schedule_interval_items.insert(i, item)
-                break
-        else:
-            self._schedule_interval_items.append(item)
+        try:
+            self._schedule_interval_funcs.setdefault(func, []).append(item)
+        except TypeError:
+            # Unhashable callable (e.g. defines __eq__ but not __hash__)
+            self._schedule_interval_unhashable.append(item)
+        if self._tick_items is not None:
+            # Scheduled by a callback: goes before the first item of the
+            # tick due later, if there is one.
+            i = self._tick_find(lambda ts: ts > next_ts,
+                                lambda ts: ts > next_ts)
+            if i is not None:
+                self._tick_items.insert(i, item)
+                if i <= self._tick_cursor:
+                    key = next_ts
+                    if i:
+                        key = max(key, self._tick_keys[i - 1])
+                    self._tick_keys.insert(i, key)
+                    self._tick_cursor += 1
+                else:
+                    self._tick_keys.insert(i, next_ts)
+                return
+        self._push_interval_item(item, next(self._schedule_seq))
+
+    def _push_interval_item(self, item, seq):
+        heapq.heappush(self._schedule_interval_items,
+                       (item.next_ts, seq, item))
+        if self._soft_next_ts is not None:
+            bisect.insort(self._soft_next_ts, item.next_ts)
+
+    def _forget_interval_item(self, item):
+        try:
+            items = self._schedule_interval_funcs[item.func]
+        except TypeError:
+            self._schedule_interval_unhashable.remove(item)
+            return
+        items.remove(item)
+        if not items:
+            del self._schedule_interval_funcs[item.func]
 
     def schedule_interval(self, func, interval, *args, **kwargs):
         '''Schedule a function to be called every `interval` seconds.
@@ -593,18 +738,28 @@ class Clock(_ClockBase):
         self._schedule_item(func, last_ts, next_ts, interval, *args, **kwargs)
 
     def _get_soft_next_ts(self, last_ts, interval):
+        times = self._soft_next_ts
+        if times is None:
+            times = self._soft_next_ts = sorted(
+                entry[0] for entry in self._schedule_interval_items
+                if entry[2].next_ts is not None)
+
         def taken(ts, e):
             '''Return True if the given time has already got an item
             scheduled nearby.
             '''
-            for item in self._schedule_interval_items:
-                if item.next_ts is None:
-                    pass
-                elif abs(item.next_ts - ts) <= e:
-                    return True
-                elif item.next_ts > ts + e:
-                    return False
-            return False
+            # The first item that is nearby or later decides, looking at
+            # the items of the tick (if any) before the heap.
+            if self._tick_items is not None:
+                i = self._tick_find(
+                    lambda t: t >= ts or ts - t <= e,
+                    lambda t: abs(t - ts) <= e or t > ts + e)
+                if i is not None:
+                    return abs(self._tick_items[i].next_ts - ts) <= e
+            # Only the neighbours of ts can be nearest; compare them the
+            # same way as a scan would, so rounding agrees at the edges.
+            i = bisect.bisect_left(times, ts)
+            return any(abs(t - ts) <= e for t in times[max(i - 1, 0):i + 1])
 
         # Binary division over interval:
         #
@@ -679,18 +834,39 @@ class Clock(_ClockBase):
             if item.func == func:
                 item.func = _dummy_schedule_func
 
-        for item in self._schedule_interval_items:
-            if item.func == func:
-                item.func = _dummy_schedule_func
-    
-        # Now remove matching items from both schedule lists.
+        # Now remove matching items from the every frame schedule list.
         self._schedule_items = \
             [item for item in self._schedule_items \
                   if item.func is not _dummy_schedule_func]
 
-        self._schedule_interval_items = \
-            [item for item in self._schedule_interval_items \
-                  if item.func is not _dummy_schedule_func]
+        # The interval items are left in the heap, marked as unscheduled.
+        try:
+            items = self._schedule_interval_funcs.pop(func, ())
+        except TypeError:
+            items = ()
+        if self._schedule_interval_unhashable:
+            # Unhashable callables can only be found by equality
+            kept = []
+            items = list(items)
+            for item in self._schedule_interval_unhashable:
+                if item.func == func:
+                    items.append(item)
+                else:
+                    kept.append(item)
+            self._schedule_interval_unhashable = kept
+        for item in items:
+            item.func = _dummy_schedule_func
+            item.next_ts = None
+        if items:
+            self._soft_next_ts = None
+            self._schedule_dead += len(items)
+            heap = self._schedule_interval_items
+            if self._schedule_dead > len(heap) // 2:
+                # Mostly unscheduled entries, rebuild the heap without them
+                heap[:] = [entry for entry in heap
+                           if entry[2].next_ts is not None]
+                heapq.heapify(heap)
+                self._schedule_dead = 0
 
 # Default clock.
 _default = Clock()
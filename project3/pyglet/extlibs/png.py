@@ -39,6 +39,7 @@
 # ----------------
 # * Removed shebang
 # * Added Pyglet license
+# * Added numpy decoding (Reader.read_array, Reader.asDirectArray)
 
 # png.py - PNG encoder/decoder in pure Python
 #
@@ -210,6 +211,13 @@ try:
     import cpngfilters as pngfilters
 except ImportError:
     pass
+try:
+    # Optional, used by `Reader.read_array` to decode whole scanlines
+    # at a time.
+    import numpy
+    from numpy.lib.stride_tricks import as_strided
+except ImportError:
+    numpy = None
 
 
 __all__ = ['Image', 'Reader', 'Writer', 'write_chunks', 'from_array']
@@ -1910,6 +1918,24 @@ class Reader:
             not self.colormap and len(data) != self.planes):
             raise FormatError("sBIT chunk has incorrect length.")
 
+    def iteridat(self, lenient=False):
+        """Iterator that yields all the ``IDAT`` chunks as strings."""
+        while True:
+            try:
+                type, data = self.chunk(lenient=lenient)
+            except ValueError as e:
+                raise ChunkError(e.args[0])
+            if type == 'IEND':
+                # http://www.w3.org/TR/PNG/#11IEND
+                break
+            if type != 'IDAT':
+                continue
+            # type == 'IDAT'
+            # http://www.w3.org/TR/PNG/#11IDAT
+            if self.colormap and not self.plte:
+                warnings.warn("PLTE chunk is required before IDAT chunk")
+            yield data
+
     def read(self, lenient=False):
         """
         Read the PNG file and decode it.  Returns (`width`, `height`,
@@ -1923,24 +1949,6 @@ class Reader:
         checksum failures will raise warnings rather than exceptions.
         """
 
-        def iteridat():
-            """Iterator that yields all the ``IDAT`` chunks as strings."""
-            while True:
-                try:
-                    type, data = self.chunk(lenient=lenient)
-                except ValueError as e:
-                    raise ChunkError(e.args[0])
-                if type == 'IEND':
-                    # http://www.w3.org/TR/PNG/#11IEND
-                    break
-                if type != 'IDAT':
-                    continue
-                # type == 'IDAT'
-                # http://www.w3.org/TR/PNG/#11IDAT
-                if self.colormap and not self.plte:
-                    warnings.warn("PLTE chunk is required before IDAT chunk")
-                yield data
-
         def iterdecomp(idat):
             """Iterator that yields decompressed strings.  `idat` should
             be an iterator that yields the ``IDAT`` chunk data.
@@ -1959,7 +1967,7 @@ class Reader:
             yield array('B', d.flush())
 
         self.preamble(lenient=lenient)
-        raw = iterdecomp(iteridat())
+        raw = iterdecomp(self.iteridat(lenient))
 
         if self.interlace:
             raw = array('B', itertools.chain(*raw))
@@ -1983,6 +1991,89 @@ class Reader:
         return self.width, self.height, pixels, meta
 
 
+    def read_array(self, lenient=False):
+        """
+        Read the PNG file and decode it using ``numpy``.  Returns
+        (`width`, `height`, `pixels`, `metadata`) like :meth:`read`.
+
+        `pixels` is a single ``numpy`` array of shape ``(height,
+        width * planes)``: flat pixel rows of ``uint8`` values, or
+        ``uint16`` values when the bitdepth is 16.
+
+        Scanlines are unfiltered whole rows at a time; see
+        :func:`undo_filters_array`.  Raises :class:`Error` if ``numpy``
+        is not available.
+        """
+
+        if numpy is None:
+            raise Error('read_array requires numpy')
+        self.preamble(lenient=lenient)
+        d = zlib.decompressobj()
+        raw = [d.decompress(data) for data in self.iteridat(lenient)]
+        raw.append(d.flush())
+        raw = numpy.frombuffer(strtobytes('').join(raw), numpy.uint8)
+
+        if not self.interlace:
+            pixels = self._unfilter_array(raw, self.width, self.height)
+        else:
+            pixels = numpy.zeros((self.height, self.width * self.planes),
+                                 numpy.uint16 if self.bitdepth > 8
+                                 else numpy.uint8)
+            boxed = pixels.reshape(self.height, self.width, self.planes)
+            offset = 0
+            for xstart, ystart, xstep, ystep in _adam7:
+                if xstart >= self.width or ystart >= self.height:
+                    continue
+                # Pixels per row and rows of the reduced pass image
+                ppr = int(math.ceil((self.width-xstart)/float(xstep)))
+                rows = int(math.ceil((self.height-ystart)/float(ystep)))
+                size = rows * (int(math.ceil(self.psize * ppr)) + 1)
+                reduced = self._unfilter_array(
+                    raw[offset:offset+size], ppr, rows)
+                offset += size
+                boxed[ystart::ystep, xstart::xstep] = \
+                    reduced.reshape(rows, ppr, self.planes)
+            if offset != len(raw):
+                raise FormatError(
+                  'Wrong size for decompressed IDAT chunk.')
+
+        meta = dict()
+        for attr in 'greyscale alpha planes bitdepth interlace'.split():
+            meta[attr] = getattr(self, attr)
+        meta['size'] = (self.width, self.height)
+        for attr in 'gamma transparent background'.split():
+            a = getattr(self, attr, None)
+            if a is not None:
+                meta[attr] = a
+        if self.plte:
+            meta['palette'] = self.palette()
+        return self.width, self.height, pixels, meta
+
+    def _unfilter_array(self, raw, width, height):
+        """Undo the filters of `height` scanlines of `width` pixels
+        taken from the ``numpy`` array `raw`, and return them as flat
+        pixel rows (see :meth:`read_array`).
+        """
+
+        row_bytes = int(math.ceil(self.psize * width))
+        if len(raw) != height * (row_bytes + 1):
+            raise FormatError(
+              'Wrong size for decompressed IDAT chunk.')
+        lines = raw.reshape(height, row_bytes + 1)
+        data = undo_filters_array(lines[:,0], lines[:,1:],
+                                  max(1, int(self.psize)))
+
+        if self.bitdepth == 8:
+            return data
+        if self.bitdepth == 16:
+            return data.view('>u2').astype(numpy.uint16)
+        # Samples per byte
+        spb = 8//self.bitdepth
+        mask = 2**self.bitdepth - 1
+        shifts = numpy.arange(spb-1, -1, -1, dtype=numpy.uint8) * self.bitdepth
+        values = (data[:,:,numpy.newaxis] >> shifts) & mask
+        return values.reshape(height, -1)[:,:width]
+
     def read_flat(self):
         """
         Read a PNG file and decode it into flat row flat pixel format.
@@ -2109,17 +2200,7 @@ class Reader:
                     yield array(typecode,
                       itertools.chain(*list(map(operator.add, row, opa))))
             pixels = itertrns(pixels)
-        targetbitdepth = None
-        if self.sbit:
-            sbit = struct.unpack('%dB' % len(self.sbit), self.sbit)
-            targetbitdepth = max(sbit)
-            if targetbitdepth > meta['bitdepth']:
-                raise Error('sBIT chunk %r exceeds bitdepth %d' %
-                    (sbit,self.bitdepth))
-            if min(sbit) <= 0:
-                raise Error('sBIT chunk %r has a 0-entry' % sbit)
-            if targetbitdepth == meta['bitdepth']:
-                targetbitdepth = None
+        targetbitdepth = self._sbit_bitdepth(meta)
         if targetbitdepth:
             shift = meta['bitdepth'] - targetbitdepth
             meta['bitdepth'] = targetbitdepth
@@ -2129,6 +2210,59 @@ class Reader:
             pixels = itershift(pixels)
         return x,y,pixels,meta
 
+    def _sbit_bitdepth(self, meta):
+        """The bitdepth the ``sBIT`` chunk reduces the pixels of bitdepth
+        ``meta['bitdepth']`` to, or None.
+        """
+
+        if not self.sbit:
+            return None
+        sbit = struct.unpack('%dB' % len(self.sbit), self.sbit)
+        targetbitdepth = max(sbit)
+        if targetbitdepth > meta['bitdepth']:
+            raise Error('sBIT chunk %r exceeds bitdepth %d' %
+                (sbit,self.bitdepth))
+        if min(sbit) <= 0:
+            raise Error('sBIT chunk %r has a 0-entry' % sbit)
+        if targetbitdepth == meta['bitdepth']:
+            return None
+        return targetbitdepth
+
+    def asDirectArray(self):
+        """Returns the image data as a direct representation, like
+        :meth:`asDirect`, but decoded with ``numpy``.
+
+        Returns (*width*, *height*, *pixels*, *meta*) where *pixels* is
+        a single ``numpy`` array of shape ``(height, width * planes)``,
+        as returned by :meth:`read_array`.
+        """
+
+        self.preamble()
+        x,y,pixels,meta = self.read_array()
+
+        if self.colormap:
+            meta['colormap'] = False
+            meta['alpha'] = bool(self.trns)
+            meta['bitdepth'] = 8
+            meta['planes'] = 3 + bool(self.trns)
+            plte = numpy.array(self.palette(), numpy.uint8)
+            pixels = plte[pixels].reshape(y, -1)
+        elif self.trns:
+            maxval = 2**meta['bitdepth']-1
+            planes = meta['planes']
+            meta['alpha'] = True
+            meta['planes'] += 1
+            boxed = pixels.reshape(y, x, planes)
+            opaque = (boxed != numpy.array(self.transparent)).any(axis=2)
+            alpha = (opaque * maxval).astype(pixels.dtype)
+            pixels = numpy.concatenate(
+                (boxed, alpha[:,:,numpy.newaxis]), axis=2).reshape(y, -1)
+        targetbitdepth = self._sbit_bitdepth(meta)
+        if targetbitdepth:
+            pixels = pixels >> (meta['bitdepth'] - targetbitdepth)
+            meta['bitdepth'] = targetbitdepth
+        return x,y,pixels,meta
+
     def asFloat(self, maxval=1.0):
         """Return image pixels as per :meth:`asDirect` method, but scale
         all pixel values to be floating point values between 0.0 and
@@ -2269,6 +2403,124 @@ class Reader:
         meta['greyscale'] = False
         return width,height,convert(),meta
 
+def undo_filters_array(filter_types, scanlines, fu):
+    """Undo the filters of a run of scanlines with ``numpy``.
+
+    `filter_types` is an array of the filter type of each scanline,
+    `scanlines` a 2D ``uint8`` array of the scanline bytes (without
+    the filter type byte), and `fu` the filter unit (bytes per pixel,
+    at least 1).  The first scanline has no previous line.  Returns a
+    new ``uint8`` array with the reconstructed bytes.
+
+    Runs of sub, up and no filter are undone one whole scanline at a
+    time.  Average and Paeth depend on the reconstructed byte to the
+    left, so they are undone a byte at a time like :meth:`Reader.undo_filter`
+    does, unless a band of scanlines has enough of them to reconstruct
+    the pixels one anti-diagonal at a time instead.  Bands are as
+    tall as the image is wide (at least 256 scanlines), which bounds
+    the memory used for tall images.
+    """
+
+    if len(filter_types) and filter_types.max() > 4:
+        raise FormatError('Invalid PNG Filter Type.'
+          '  See http://www.w3.org/TR/2003/REC-PNG-20031110/#9Filters .')
+
+    rows, row_bytes = scanlines.shape
+    width = row_bytes // fu
+    band = max(width, 256)
+    result = numpy.empty(scanlines.shape, numpy.uint8)
+    previous = numpy.zeros(row_bytes, numpy.uint8)
+    for top in range(0, rows, band):
+        types = filter_types[top:top+band]
+        # Each diagonal costs about as much as undoing this many bytes
+        # of average and Paeth scanlines a byte at a time.
+        if (numpy.count_nonzero(types >= 3) * row_bytes >
+                80 * (width + len(types))):
+            result[top:top+band] = _undo_filters_diagonal(
+                types, scanlines[top:top+band], fu, previous)
+        else:
+            _undo_filters_rows(types, scanlines[top:top+band], fu,
+                               previous, result[top:top+band])
+        previous = result[min(top + band, rows) - 1]
+    return result
+
+def _undo_filters_rows(filter_types, scanlines, fu, previous, result):
+    """Undo the filters of the scanlines one scanline at a time into
+    `result`; `previous` is the scanline before the first.  Average and
+    Paeth are undone a byte at a time with :class:`pngfilters`.
+    """
+
+    for filter_type, scanline, line in zip(filter_types, scanlines, result):
+        if filter_type == 0:
+            line[:] = scanline
+        elif filter_type == 1:
+            numpy.cumsum(scanline.reshape(-1, fu), axis=0,
+                         dtype=numpy.uint8, out=line.reshape(-1, fu))
+        elif filter_type == 2:
+            numpy.add(scanline, previous, out=line)
+        else:
+            undo = (pngfilters.undo_filter_average,
+                    pngfilters.undo_filter_paeth)[filter_type - 3]
+            recon = array('B', scanline.tobytes())
+            undo(fu, recon, array('B', previous.tobytes()), recon)
+            line[:] = numpy.frombuffer(recon, numpy.uint8)
+        previous = line
+
+def _undo_filters_diagonal(filter_types, scanlines, fu, previous):
+    """Undo the filters of the scanlines one anti-diagonal of pixels at
+    a time; see :func:`undo_filters_array`.  `previous` is the
+    reconstructed scanline before the first.
+    """
+
+    rows, row_bytes = scanlines.shape
+    width = row_bytes // fu
+    # Skewed layout: pixel (x, y) is at [x+y+2, y+1], so each diagonal
+    # is one contiguous run and a pixel's left, up and up-left
+    # neighbours are on the previous two diagonals.  Row 0 holds the
+    # previous scanline; the rest of it and the first two diagonals
+    # stay zero, standing for the missing neighbours at the edges.
+    diagonals = width + rows + 2
+    recon = numpy.zeros((diagonals, rows + 1, fu), numpy.int16)
+    raw = numpy.zeros_like(recon)
+    item = recon.itemsize
+    def skewed(a):
+        return as_strided(a.reshape(-1)[(2 * (rows + 1) + 1) * fu:],
+                          shape=(rows, width, fu),
+                          strides=((rows + 2) * fu * item,
+                                   (rows + 1) * fu * item, item))
+    skewed(raw)[:] = scanlines.reshape(rows, width, fu)
+    recon[1:width+1, 0] = previous.reshape(width, fu)
+
+    # The sub, up and average predictors are (a*wa + b*wb) >> shift
+    # for the left byte a and the byte b above; Paeth is picked apart.
+    types = filter_types.reshape(-1, 1).astype(numpy.int16)
+    wa = ((types == 1) | (types == 3)).astype(numpy.int16)
+    wb = ((types == 2) | (types == 3)).astype(numpy.int16)
+    shift = (types == 3).astype(numpy.int16)
+    paeth = types == 4
+    any_paeth = paeth.any()
+    for d in range(2, width + rows + 1):
+        # Rows with a pixel on this diagonal
+        lo = max(0, d - 1 - width)
+        hi = min(rows, d - 1)
+        a = recon[d-1, lo+1:hi+1]
+        b = recon[d-1, lo:hi]
+        predictor = (a * wa[lo:hi] + b * wb[lo:hi]) >> shift[lo:hi]
+        if any_paeth:
+            c = recon[d-2, lo:hi]
+            pa = numpy.abs(b - c)
+            pb = numpy.abs(a - c)
+            pc = numpy.abs(a + b - 2 * c)
+            predictor = numpy.where(
+                paeth[lo:hi],
+                numpy.where((pa <= pb) & (pa <= pc), a,
+                            numpy.where(pb <= pc, b, c)),
+                predictor)
+        numpy.bitwise_and(raw[d, lo+1:hi+1] + predictor, 0xff,
+                          out=recon[d, lo+1:hi+1])
+
+    return skewed(recon).reshape(rows, row_bytes).astype(numpy.uint8)
+
 def check_bitdepth_colortype(bitdepth, colortype):
     """Check that `bitdepth` and `colortype` are both valid,
     and specified in a valid combination. Returns if valid,
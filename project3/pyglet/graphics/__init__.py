@@ -429,6 +429,18 @@ class Batch(object):
         domain = batch._get_domain(False, mode, group, formats)
         vertex_list.migrate(domain)
 
+    def defragment(self):
+        '''Pack the vertex lists of each domain of this batch together and
+        shrink the buffers to fit them.
+
+        Useful after many vertex lists were deleted; vertex lists that are
+        still allocated are all kept, referenced or not.  See
+        `pyglet.graphics.vertexdomain.VertexDomain.defragment`.
+        '''
+        for domain_map in self.group_map.values():
+            for domain in domain_map.values():
+                domain.defragment()
+
     def _get_domain(self, indexed, mode, group, formats):
         if group is None:
             group = null_group
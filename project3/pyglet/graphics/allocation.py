@@ -41,7 +41,7 @@ by `pyglet.graphics.vertexbuffer`.
  
 The allocator will at times request more space from the buffers. The current
 policy is to double the buffer size when there is not enough room to fulfil an
-allocation.  The buffer is never resized smaller.
+allocation.  The buffer is only resized smaller by `Allocator.defragment`.
 
 The allocator maintains references to free space only; it is the caller's
 responsibility to maintain the allocated regions.
@@ -49,6 +49,9 @@ responsibility to maintain the allocated regions.
 
 __docformat__ = 'restructuredtext'
 __version__ = '$Id: $'
+
+import bisect
+import itertools
  
 # Common cases:
 # -regions will be the same size (instances of same object, e.g. sprites)
@@ -58,7 +61,8 @@ __version__ = '$Id: $'
 # Optimise for:
 # -keeping regions adjacent, reduce the number of entries in glMultiDrawArrays
 # -finding large blocks of allocated regions quickly (for drawing)
-# -finding block of unallocated space is the _uncommon_ case!
+# -allocating and freeing in scenes that constantly create and delete vertex
+#  lists, with many regions
 #
 # Decisions:
 # -don't over-allocate regions to any alignment -- this would require more
@@ -70,8 +74,14 @@ __version__ = '$Id: $'
 # -allocator does not track individual allocated regions.  Trusts caller
 #  to provide accurate (start, size) tuple, which completely describes
 #  a region from the allocator's point of view.
-# -this means that compacting is probably not feasible, or would be hideously
-#  expensive
+# -free blocks are kept in size classes (by bit length of the size), so a
+#  fitting block is found without scanning every block.  Freed blocks are
+#  merged with their free neighbours, found by start and end.
+# -the starts of the free blocks are also kept sorted (in chunks, so a
+#  change never moves more than a chunk), to check regions and list the
+#  allocated regions in order.
+# -compacting needs the caller to provide every allocated region (see
+#  `Allocator.defragment`), the caller then moves the data.
 
 class AllocatorMemoryException(Exception):
     '''The buffer is not large enough to fulfil an allocation.
@@ -85,8 +95,86 @@ class AllocatorMemoryException(Exception):
     def __init__(self, requested_capacity):
         self.requested_capacity = requested_capacity
 
+class _SortedStarts(object):
+    '''Sorted list of ints, split into chunks of at most `_load` * 2 items.
+
+    Lookups bisect the chunk maxima and then one chunk; inserting or
+    removing moves at most the rest of one chunk.
+    '''
+    _load = 256
+
+    def __init__(self):
+        self._chunks = []
+        self._maxes = []
+
+    def _chunk(self, value):
+        # Index of the chunk value is in (or would be inserted into)
+        i = bisect.bisect_left(self._maxes, value)
+        if i == len(self._maxes):
+            i -= 1
+        return i
+
+    def add(self, value):
+        if not self._maxes:
+            self._chunks.append([value])
+            self._maxes.append(value)
+            return
+        i = self._chunk(value)
+        chunk = self._chunks[i]
+        bisect.insort(chunk, value)
+        self._maxes[i] = chunk[-1]
+        if len(chunk) > self._load * 2:
+            half = chunk[self._load:]
+            del chunk[self._load:]
+            self._chunks.insert(i + 1, half)
+            self._maxes[i] = chunk[-1]
+            self._maxes.insert(i + 1, half[-1])
+
+    def remove(self, value):
+        i = self._chunk(value)
+        chunk = self._chunks[i]
+        del chunk[bisect.bisect_left(chunk, value)]
+        if chunk:
+            self._maxes[i] = chunk[-1]
+        else:
+            del self._chunks[i]
+            del self._maxes[i]
+
+    def replace(self, value, new_value):
+        # new_value must sort in the same place as value
+        i = self._chunk(value)
+        chunk = self._chunks[i]
+        j = bisect.bisect_left(chunk, value)
+        chunk[j] = new_value
+        if j == len(chunk) - 1:
+            self._maxes[i] = new_value
+
+    def floor(self, value):
+        # Greatest item <= value, or None
+        i = bisect.bisect_right(self._maxes, value)
+        if i < len(self._maxes):
+            chunk = self._chunks[i]
+            j = bisect.bisect_right(chunk, value)
+            if j:
+                return chunk[j - 1]
+        if i:
+            return self._maxes[i - 1]
+        return None
+
+    def clear(self):
+        del self._chunks[:]
+        del self._maxes[:]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._chunks)
+
 class Allocator(object):
     '''Buffer space allocation implementation.'''
+
+    # Blocks checked in the size class of a request before looking in the
+    # larger classes, which always fit.
+    _bin_scan = 8
+
     def __init__(self, capacity):
         '''Create an allocator for a buffer of the specified capacity.
 
@@ -97,37 +185,126 @@ class Allocator(object):
         '''
         self.capacity = capacity
 
-        # Allocated blocks.  Start index and size in parallel lists.
+        # Free blocks.
         #
         # # = allocated, - = free
         #
         #  0  3 5        15   20  24                    40
         # |###--##########-----####----------------------|
         #
-        # starts = [0, 5, 20]
-        # sizes = [3, 10, 4]
+        # free = {3: 2, 15: 5, 24: 16}
+        # free_ends = {5: 3, 20: 15, 40: 24}
+        # free_starts = [3, 15, 24]
+        # bins = {2: {3: None}, 3: {15: None}, 5: {24: None}}
         #
-        # To calculate free blocks:
-        # for i in range(0, len(starts)):
-        #   free_start[i] = starts[i] + sizes[i]
-        #   free_size[i] =  starts[i+1] - free_start[i]
-        # free_size[i+1] = self.capacity - free_start[-1]
-
-        self.starts = []
-        self.sizes = []
+        # Allocated regions are the space between the free blocks.
+
+        self._free = {}
+        self._free_ends = {}
+        self._free_starts = _SortedStarts()
+        self._bins = {}
+        self._allocated = 0
+
+        # Cached result of get_allocated_regions
+        self._regions = None
+
+        if capacity:
+            self._add_free(0, capacity)
+
+    def _add_free(self, start, size):
+        self._free[start] = size
+        self._free_ends[start + size] = start
+        self._free_starts.add(start)
+        self._bins.setdefault(size.bit_length(), {})[start] = None
+
+    def _remove_free(self, start):
+        size = self._free.pop(start)
+        del self._free_ends[start + size]
+        self._free_starts.remove(start)
+        bin = self._bins[size.bit_length()]
+        del bin[start]
+        if not bin:
+            del self._bins[size.bit_length()]
+        return size
+
+    def _find_free(self, size):
+        # Start of a free block of at least size, or None
+        free = self._free
+        cls = size.bit_length()
+        bin = self._bins.get(cls)
+        if bin:
+            for i, start in enumerate(bin):
+                if free[start] >= size:
+                    return start
+                if i == self._bin_scan:
+                    break
+        for larger in sorted(self._bins):
+            if larger > cls:
+                return next(iter(self._bins[larger]))
+        if bin and len(bin) > self._bin_scan:
+            for start in bin:
+                if free[start] >= size:
+                    return start
+        return None
+
+    def _take(self, start, size):
+        # Allocate the first size of the free block at start
+        free_size = self._free.pop(start)
+        bin = self._bins[free_size.bit_length()]
+        del bin[start]
+        if not bin:
+            del self._bins[free_size.bit_length()]
+        end = start + free_size
+        if free_size > size:
+            # Keep the rest of the block, in the same place in free_starts
+            rest_start = start + size
+            rest_size = free_size - size
+            self._free[rest_start] = rest_size
+            self._free_ends[end] = rest_start
+            self._free_starts.replace(start, rest_start)
+            self._bins.setdefault(rest_size.bit_length(), {})[rest_start] = None
+        else:
+            del self._free_ends[end]
+            self._free_starts.remove(start)
+        self._allocated += size
+        self._regions = None
+
+    def _check_allocated(self, start, size):
+        # Assert no free block overlaps the region
+        assert 0 <= start and start + size <= self.capacity, \
+            'Region not allocated'
+        free_start = self._free_starts.floor(start + size - 1)
+        if free_start is not None:
+            assert free_start + self._free[free_start] <= start, \
+                'Region not allocated'
 
     def set_capacity(self, size):
         '''Resize the maximum buffer size.
         
-        The capaity cannot be reduced.
+        The capacity can only be reduced by cutting off free space at the end
+        of the buffer (for example after `defragment`).
 
         :Parameters:
             `size` : int
                 New maximum size of the buffer.
 
         '''
-        assert size > self.capacity
+        assert size != self.capacity
+        tail = self._free_ends.get(self.capacity)
+        if size < self.capacity:
+            assert tail is not None and tail <= size, \
+                'Allocated space beyond the new capacity'
+            self._remove_free(tail)
+            if tail < size:
+                self._add_free(tail, size - tail)
+        else:
+            if tail is not None:
+                self._remove_free(tail)
+            else:
+                tail = self.capacity
+            self._add_free(tail, size - tail)
         self.capacity = size
+        self._regions = None
 
     def alloc(self, size):
         '''Allocate memory in the buffer.
@@ -150,43 +327,17 @@ class Allocator(object):
         # return start
         # or raise AllocatorMemoryException
 
-        if not self.starts:
-            if size <= self.capacity:
-                self.starts.append(0)
-                self.sizes.append(size)
-                return 0
-            else:
-                raise AllocatorMemoryException(size)
-
-        # Allocate in a free space
-        free_start = self.starts[0] + self.sizes[0]
-        for i, (alloc_start, alloc_size) in \
-                enumerate(zip(self.starts[1:], self.sizes[1:])):
-            # Danger!  
-            # i is actually index - 1 because of slicing above...
-            # starts[i]   points to the block before this free space
-            # starts[i+1] points to the block after this free space, and is
-            #             always valid.
-            free_size = alloc_start - free_start
-            if free_size == size:
-                # Merge previous block with this one (removing this free space)
-                self.sizes[i] += free_size + alloc_size
-                del self.starts[i+1]
-                del self.sizes[i+1]
-                return free_start
-            elif free_size > size:
-                # Increase size of previous block to intrude into this free
-                # space.
-                self.sizes[i] += size
-                return free_start
-            free_start = alloc_start + alloc_size
-        
-        # Allocate at end of capacity
-        free_size = self.capacity - free_start
-        if free_size >= size:
-            self.sizes[-1] += size
-            return free_start
-        
+        start = self._find_free(size)
+        if start is not None:
+            self._take(start, size)
+            return start
+
+        # Grow from the end of capacity
+        tail = self._free_ends.get(self.capacity)
+        if tail is None:
+            free_size = 0
+        else:
+            free_size = self.capacity - tail
         raise AllocatorMemoryException(self.capacity + size - free_size)
 
     def realloc(self, start, size, new_size):
@@ -223,54 +374,23 @@ class Allocator(object):
         if new_size < size:
             self.dealloc(start + new_size, size - new_size)
             return start
-            
-        # Find which block it lives in
-        for i, (alloc_start, alloc_size) in \
-                enumerate(zip(*(self.starts, self.sizes))):
-            p = start - alloc_start
-            if p >= 0 and size <= alloc_size - p:
-                break
-        if not (p >= 0 and size <= alloc_size - p):
-            print(list(zip(self.starts, self.sizes)))
-            print(start, size, new_size)
-            print(p, alloc_start, alloc_size)
-        assert p >= 0 and size <= alloc_size - p, 'Region not allocated'
-
-        if size == alloc_size - p:
-            # Region is at end of block.  Find how much free space is after
-            # it.
-            is_final_block = i == len(self.starts) - 1
-            if not is_final_block:
-                free_size = self.starts[i + 1] - (start + size)
-            else:
-                free_size = self.capacity - (start + size)
-
-            # TODO If region is an entire block being an island in free space, 
-            # can possibly extend in both directions.
-
-            if free_size == new_size - size and not is_final_block:
-                # Merge block with next (region is expanded in place to
-                # exactly fill the free space)
-                self.sizes[i] += free_size + self.sizes[i + 1]
-                del self.starts[i + 1]
-                del self.sizes[i + 1]
-                return start
-            elif free_size > new_size - size:
-                # Expand region in place
-                self.sizes[i] += new_size - size
-                return start
-
-        # The block must be repositioned.  Dealloc then alloc.
-        
-        # But don't do this!  If alloc fails, we've already silently dealloc'd
-        # the original block.
-        #   self.dealloc(start, size)
-        #   return self.alloc(new_size)
-
-        # It must be alloc'd first.  We're not missing an optimisation 
-        # here, because if freeing the block would've allowed for the block to 
-        # be placed in the resulting free space, one of the above in-place
-        # checks would've found it.
+
+        self._check_allocated(start, size)
+        if new_size == size:
+            return start
+
+        # Expand in place into the free block right after the region
+        end = start + size
+        free_size = self._free.get(end, 0)
+        if free_size >= new_size - size:
+            self._take(end, new_size - size)
+            return start
+
+        # The block must be repositioned.  It must be alloc'd first, so that
+        # a failed alloc does not silently dealloc the original block.  We're
+        # not missing an optimisation here, because if freeing the block
+        # would've allowed for the block to be placed in the resulting free
+        # space, the in-place check above would've found it.
         result = self.alloc(new_size)
         self.dealloc(start, size)
         return result
@@ -290,50 +410,56 @@ class Allocator(object):
         if size == 0:
             return
 
-        assert self.starts
-        
-        # Find which block needs to be split
-        for i, (alloc_start, alloc_size) in \
-                enumerate(zip(*(self.starts, self.sizes))):
-            p = start - alloc_start
-            if p >= 0 and size <= alloc_size - p:
-                break
-        
-        # Assert we left via the break
-        assert p >= 0 and size <= alloc_size - p, 'Region not allocated'
-
-        if p == 0 and size == alloc_size:
-            # Remove entire block
-            del self.starts[i]
-            del self.sizes[i]
-        elif p == 0:
-            # Truncate beginning of block
-            self.starts[i] += size
-            self.sizes[i] -= size
-        elif size == alloc_size - p:
-            # Truncate end of block
-            self.sizes[i] -= size
-        else:
-            # Reduce size of left side, insert block at right side
-            #   $ = dealloc'd block, # = alloc'd region from same block
-            #
-            #   <------8------>
-            #   <-5-><-6-><-7->
-            #   1    2    3    4
-            #   #####$$$$$#####
-            #
-            #   1 = alloc_start
-            #   2 = start
-            #   3 = start + size
-            #   4 = alloc_start + alloc_size
-            #   5 = start - alloc_start = p
-            #   6 = size
-            #   7 = {8} - ({5} + {6}) = alloc_size - (p + size)
-            #   8 = alloc_size
-            #
-            self.sizes[i] = p
-            self.starts.insert(i + 1, start + size)
-            self.sizes.insert(i + 1, alloc_size - (p + size))
+        self._check_allocated(start, size)
+        self._allocated -= size
+        self._regions = None
+
+        # Merge with the free blocks on either side
+        end = start + size
+        if end in self._free:
+            end += self._remove_free(end)
+        if start in self._free_ends:
+            start = self._free_ends[start]
+            self._remove_free(start)
+        self._add_free(start, end - start)
+
+    def defragment(self, regions):
+        '''Pack allocated regions together at the start of the buffer.
+
+        `regions` must list every region that is still in use; any other
+        allocated space is freed.  Regions keep their order in the buffer,
+        so a caller moving the data down in order of the old starting index
+        never overwrites data not yet moved.
+
+        Afterwards the capacity can be reduced with `set_capacity` down to the
+        total size of the regions.
+
+        :Parameters:
+            `regions` : list of (int, int)
+                Start and size of each region in use.
+
+        :rtype: list of int
+        :return: New starting index of each region, in the order given.
+        '''
+        order = sorted(range(len(regions)), key=lambda i: regions[i][0])
+        new_starts = [0] * len(regions)
+        end = 0
+        for i in order:
+            start, size = regions[i]
+            self._check_allocated(start, size)
+            assert start >= end, 'Regions overlap'
+            new_starts[i] = end
+            end += size
+
+        self._free.clear()
+        self._free_ends.clear()
+        self._free_starts.clear()
+        self._bins.clear()
+        self._allocated = end
+        self._regions = None
+        if end < self.capacity:
+            self._add_free(end, self.capacity - end)
+        return new_starts
 
     def get_allocated_regions(self):
         '''Get a list of (aggregate) allocated regions.
@@ -345,7 +471,20 @@ class Allocator(object):
         :rtype: (list, list)
         '''
         # return (starts, sizes); len(starts) == len(sizes)
-        return (self.starts, self.sizes)
+        if self._regions is None:
+            starts = []
+            sizes = []
+            alloc_start = 0
+            for free_start in self._free_starts:
+                if free_start > alloc_start:
+                    starts.append(alloc_start)
+                    sizes.append(free_start - alloc_start)
+                alloc_start = free_start + self._free[free_start]
+            if alloc_start < self.capacity:
+                starts.append(alloc_start)
+                sizes.append(self.capacity - alloc_start)
+            self._regions = (starts, sizes)
+        return self._regions
 
     def get_fragmented_free_size(self):
         '''Returns the amount of space unused, not including the final
@@ -353,29 +492,18 @@ class Allocator(object):
 
         :rtype: int
         '''
-        if not self.starts:
-            return 0
-
-        # Variation of search for free block.
-        total_free = 0
-        free_start = self.starts[0] + self.sizes[0]
-        for i, (alloc_start, alloc_size) in \
-                enumerate(zip(self.starts[1:], self.sizes[1:])):
-            total_free += alloc_start - free_start
-            free_start = alloc_start + alloc_size
-
-        return total_free
+        free_size = self.get_free_size()
+        tail = self._free_ends.get(self.capacity)
+        if tail is not None:
+            free_size -= self.capacity - tail
+        return free_size
 
     def get_free_size(self):
         '''Return the amount of space unused.
         
         :rtype: int
         '''
-        if not self.starts:
-            return self.capacity
-
-        free_end = self.capacity - (self.starts[-1] + self.sizes[-1])
-        return self.get_fragmented_free_size() + free_end
+        return self.capacity - self._allocated
 
     def get_usage(self):
         '''Return fraction of capacity currently allocated.
@@ -394,11 +522,34 @@ class Allocator(object):
             return 0.
         return self.get_fragmented_free_size() / float(self.get_free_size())
 
+    def get_stats(self):
+        '''Return statistics on the use and fragmentation of the buffer.
+
+        The result is a dict with the keys ``capacity``, ``allocated``,
+        ``free`` and ``fragmented_free`` (sizes, see
+        `get_fragmented_free_size`), ``free_blocks`` (number of free blocks),
+        ``largest_free`` (size of the largest free block), ``regions``
+        (number of aggregate allocated regions, see `get_allocated_regions`)
+        and ``fragmentation`` (see `get_fragmentation`).
+
+        :rtype: dict
+        '''
+        return {
+            'capacity': self.capacity,
+            'allocated': self._allocated,
+            'free': self.get_free_size(),
+            'fragmented_free': self.get_fragmented_free_size(),
+            'free_blocks': len(self._free),
+            'largest_free': max(self._free.values()) if self._free else 0,
+            'regions': len(self.get_allocated_regions()[0]),
+            'fragmentation': self.get_fragmentation(),
+        }
+
     def _is_empty(self):
-        return not self.starts
+        return not self._allocated
 
     def __str__(self):
-        return 'allocs=' + repr(list(zip(self.starts, self.sizes)))
+        return 'allocs=' + repr(list(zip(*self.get_allocated_regions())))
 
     def __repr__(self):
         return '<%s %s>' % (self.__class__.__name__, str(self))
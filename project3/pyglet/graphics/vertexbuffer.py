@@ -42,6 +42,10 @@ Buffers can optionally be created "mappable" (incorporating the
 `AbstractMappable` mix-in).  In this case the buffer provides a ``get_region``
 method which provides the most efficient path for updating partial data within
 the buffer.
+
+If numpy is installed, buffer regions can also be accessed as numpy arrays
+sharing the buffer memory (see `AbstractBufferRegion.get_ndarray`), and
+interleaved regions are read and written with numpy.
 '''
 
 __docformat__ = 'restructuredtext'
@@ -53,6 +57,12 @@ import sys
 import pyglet
 from pyglet.gl import *
 
+try:
+    import numpy
+    from numpy.lib.stride_tricks import as_strided
+except ImportError:
+    numpy = None
+
 _enable_vbo = pyglet.options['graphics_vbo']
 
 # Enable workaround permanently if any VBO is created on a context that has
@@ -455,6 +465,16 @@ class AbstractBufferRegion(object):
         '''
         pass
 
+    def get_ndarray(self):
+        '''Get a numpy array sharing memory with the array of this region.
+
+        Changes to the numpy array are changes to the buffer; call
+        `invalidate` after making them.  Requires numpy.
+
+        :rtype: numpy.ndarray
+        '''
+        return numpy.ctypeslib.as_array(self.array)
+
 class VertexBufferObjectRegion(AbstractBufferRegion):
     '''A mapped region of a VBO.'''
     def __init__(self, buffer, start, end, array):
@@ -512,18 +532,42 @@ class IndirectArrayRegion(AbstractBufferRegion):
         self.count = component_count
         self.stride = component_stride
         self.array = self
+        self._ndarray = None
 
     def __repr__(self):
         return 'IndirectArrayRegion(size=%d, count=%d, stride=%d)' % (
             self.size, self.count, self.stride)
 
-    def __getitem__(self, index):
+    def get_ndarray(self):
+        '''Get a numpy array sharing memory with the interleaved data.
+
+        The array has one row per vertex and one column per component, and
+        is strided over the buffer (no data is copied).  Changes to it are
+        changes to the buffer; call `invalidate` after making them.  Requires
+        numpy.
+
+        :rtype: numpy.ndarray
+        '''
+        if self._ndarray is None:
+            data = numpy.ctypeslib.as_array(self.region.array)
+            itemsize = data.itemsize
+            self._ndarray = as_strided(data,
+                shape=(self.size // self.count, self.count),
+                strides=(self.stride * itemsize, itemsize))
+        return self._ndarray
+
+    def _get_ndarray_index(self, start, stop, step):
+        # Index into get_ndarray() of the elements start:stop:step, for a
+        # step of 1 the rows holding them and the offset of start in them
         count = self.count
-        if not isinstance(index, slice):
-            elem = index // count
-            j = index % count
-            return self.region.array[elem * self.stride + j]
+        if step == 1:
+            stop = max(start, stop)
+            return slice(start // count, -(-stop // count)), start % count
+        j = start % count
+        return (slice(start // count, (stop - j + count - 1) // count,
+                      step // count), j)
 
+    def _get_slice(self, index):
         start = index.start or 0
         stop = index.stop
         step = index.step or 1
@@ -534,8 +578,25 @@ class IndirectArrayRegion(AbstractBufferRegion):
         elif stop < 0:
             stop = self.size + stop
 
-        assert step == 1 or step % count == 0, \
+        assert step == 1 or step % self.count == 0, \
             'Step must be multiple of component count'
+        return start, stop, step
+
+    def __getitem__(self, index):
+        count = self.count
+        if not isinstance(index, slice):
+            elem = index // count
+            j = index % count
+            return self.region.array[elem * self.stride + j]
+
+        start, stop, step = self._get_slice(index)
+
+        if numpy is not None:
+            rows, j = self._get_ndarray_index(start, stop, step)
+            if step == 1:
+                data = self.get_ndarray()[rows].ravel()
+                return data[j:j + max(0, stop - start)].tolist()
+            return self.get_ndarray()[rows, j].tolist()
 
         data_start = (start // count) * self.stride + start % count
         data_stop = (stop // count) * self.stride + stop % count
@@ -562,18 +623,21 @@ class IndirectArrayRegion(AbstractBufferRegion):
             self.region.array[elem * self.stride + j] = value
             return
 
-        start = index.start or 0
-        stop = index.stop
-        step = index.step or 1
-        if start < 0:
-            start = self.size + start
-        if stop is None:
-            stop = self.size
-        elif stop < 0:
-            stop = self.size + stop
+        start, stop, step = self._get_slice(index)
 
-        assert step == 1 or step % count == 0, \
-            'Step must be multiple of component count'
+        if numpy is not None:
+            # Strided assignment straight into the buffer
+            rows, j = self._get_ndarray_index(start, stop, step)
+            if step != 1:
+                self.get_ndarray()[rows, j] = value
+            elif j == 0 and stop % count == 0:
+                self.get_ndarray()[rows] = numpy.reshape(value, (-1, count))
+            else:
+                # Not whole vertices, change them in a copy
+                data = self.get_ndarray()[rows].ravel()
+                data[j:j + max(0, stop - start)] = value
+                self.get_ndarray()[rows] = data.reshape(-1, count)
+            return
 
         data_start = (start // count) * self.stride + start % count
         data_stop = (stop // count) * self.stride + stop % count
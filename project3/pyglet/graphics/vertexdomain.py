@@ -65,6 +65,11 @@ import re
 from pyglet.gl import *
 from pyglet.graphics import allocation, vertexattribute, vertexbuffer
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 _usage_format_re = re.compile(r'''
     (?P<attribute>[^/]*)
     (/ (?P<usage> static|dynamic|stream|none))?
@@ -88,6 +93,27 @@ def _nearest_pow2(v):
     v |= v >> 16
     return v + 1
 
+def _set_array(array, data):
+    # array[:] = data, copying a numpy array into a ctypes array in one go
+    # instead of element by element
+    if (numpy is not None and isinstance(data, numpy.ndarray) and
+            isinstance(array, ctypes.Array)):
+        numpy.ctypeslib.as_array(array)[:] = data.reshape(-1)
+    else:
+        array[:] = data
+
+def _move_buffer_data(buffer, element_size, start, count, new_start):
+    # Move count elements of buffer from start to new_start (may overlap)
+    low = min(start, new_start)
+    span = (max(start, new_start) + count - low) * element_size
+    region = buffer.get_region(low * element_size, span,
+                               ctypes.POINTER(ctypes.c_byte * span))
+    address = ctypes.addressof(region.array)
+    ctypes.memmove(address + (new_start - low) * element_size,
+                   address + (start - low) * element_size,
+                   count * element_size)
+    region.invalidate()
+
 def create_attribute_usage(format):
     '''Create an attribute and usage pair from a format string.  The
     format string is as documented in `pyglet.graphics.vertexattribute`, with
@@ -158,6 +184,11 @@ class VertexDomain(object):
     def __init__(self, attribute_usages):
         self.allocator = allocation.Allocator(self._initial_count)
 
+        # Vertex lists in this domain, to move them in defragment.  Strong
+        # references: a list dropped without delete() is still drawn, so
+        # its region must be kept (and moved) too.
+        self._vertex_lists = set()
+
         # If there are any MultiTexCoord attributes, then a TexCoord attribute
         # must be converted.
         have_multi_texcoord = False
@@ -274,7 +305,9 @@ class VertexDomain(object):
         :rtype: `VertexList`
         '''
         start = self._safe_alloc(count)
-        return VertexList(self, start, count)
+        vertex_list = VertexList(self, start, count)
+        self._vertex_lists.add(vertex_list)
+        return vertex_list
 
     def draw(self, mode, vertex_list=None):
         '''Draw vertices in the domain.
@@ -323,8 +356,45 @@ class VertexDomain(object):
             buffer.unbind()
         glPopClientAttrib()
 
+    def defragment(self):
+        '''Move the vertex lists of this domain next to each other at the
+        start of the buffers, and shrink the buffers to fit them.
+
+        Vertex lists keep their order, so they are usually drawn with fewer
+        calls afterwards.  Only the space of deleted vertex lists is
+        reclaimed; lists that are no longer referenced but were never
+        deleted are still drawn and are moved like the others.  Attribute
+        arrays obtained from the vertex lists before this call must not be
+        used after it.
+        '''
+        vertex_lists = sorted(self._vertex_lists, key=lambda v: v.start)
+        new_starts = self.allocator.defragment(
+            [(v.start, v.count) for v in vertex_lists])
+        for vertex_list, new_start in zip(vertex_lists, new_starts):
+            if new_start != vertex_list.start:
+                for buffer, _ in self.buffer_attributes:
+                    _move_buffer_data(buffer, buffer.element_size,
+                        vertex_list.start, vertex_list.count, new_start)
+                vertex_list._set_start(new_start)
+
+        used = self.allocator.capacity - self.allocator.get_free_size()
+        capacity = max(_nearest_pow2(used), self._initial_count)
+        if capacity < self.allocator.capacity:
+            for buffer, _ in self.buffer_attributes:
+                buffer.resize(capacity * buffer.element_size)
+            self.allocator.set_capacity(capacity)
+        self._version += 1
+
+    def get_stats(self):
+        '''Return statistics on the use and fragmentation of the vertex
+        buffers; see `allocation.Allocator.get_stats`.
+
+        :rtype: dict
+        '''
+        return self.allocator.get_stats()
+
     def _is_empty(self):
-        return not self.allocator.starts
+        return self.allocator._is_empty()
 
     def __repr__(self):
         return '<%s@%x %s>' % (self.__class__.__name__, id(self),
@@ -394,9 +464,35 @@ class VertexList(object):
         self._tex_coords_cache_version = None
         self._vertices_cache_version = None
 
+    def _set_start(self, start):
+        # Vertices were moved to start by the domain
+        self.start = start
+
+    def get_ndarray(self, name):
+        '''Get a numpy array sharing memory with an attribute's data.
+
+        Changes to the array are changes to the vertex buffer, with no copy.
+        Interleaved attributes give a strided array with one row per vertex,
+        the others a flat array.  The array is valid until the domain's
+        buffers are resized or defragmented (or this list is resized or
+        migrated); get it again each frame.  Requires numpy.
+
+        :Parameters:
+            `name` : str
+                Attribute name: ``'vertices'``, ``'colors'``, ``'tex_coords'``,
+                ``'normals'``, ``'secondary_colors'``, ``'fog_coords'`` or
+                ``'edge_flags'``.
+
+        :rtype: numpy.ndarray
+        '''
+        # Refresh the cached region (and mark it changed)
+        getattr(self, name)
+        return getattr(self, '_%s_cache' % name).get_ndarray()
+
     def delete(self):
         '''Delete this group.'''
         self.domain.allocator.dealloc(self.start, self.count)
+        self.domain._vertex_lists.discard(self)
 
     def migrate(self, domain):
         '''Move this group from its current domain and add to the specified
@@ -422,8 +518,10 @@ class VertexList(object):
             new.invalidate()
 
         self.domain.allocator.dealloc(self.start, self.count)
+        self.domain._vertex_lists.discard(self)
         self.domain = domain
         self.start = new_start
+        domain._vertex_lists.add(self)
 
         self._colors_cache_version = None
         self._fog_coords_cache_version = None
@@ -437,7 +535,7 @@ class VertexList(object):
         attribute = self.domain.attributes[i]
         # TODO without region
         region = attribute.get_region(attribute.buffer, self.start, self.count)
-        region.array[:] = data
+        _set_array(region.array, data)
         region.invalidate()
 
     # ---
@@ -455,7 +553,7 @@ class VertexList(object):
         return region.array
 
     def _set_colors(self, data):
-        self._get_colors()[:] = data
+        _set_array(self._get_colors(), data)
 
     _colors_cache = None
     _colors_cache_version = None
@@ -477,7 +575,7 @@ class VertexList(object):
         return region.array
 
     def _set_fog_coords(self, data):
-        self._get_fog_coords()[:] = data
+        _set_array(self._get_fog_coords(), data)
 
     _fog_coords_cache = None
     _fog_coords_cache_version = None
@@ -499,7 +597,7 @@ class VertexList(object):
         return region.array
 
     def _set_edge_flags(self, data):
-        self._get_edge_flags()[:] = data
+        _set_array(self._get_edge_flags(), data)
 
     _edge_flags_cache = None
     _edge_flags_cache_version = None
@@ -521,7 +619,7 @@ class VertexList(object):
         return region.array
 
     def _set_normals(self, data):
-        self._get_normals()[:] = data
+        _set_array(self._get_normals(), data)
 
     _normals_cache = None
     _normals_cache_version = None
@@ -543,7 +641,7 @@ class VertexList(object):
         return region.array
 
     def _set_secondary_colors(self, data):
-        self._get_secondary_colors()[:] = data
+        _set_array(self._get_secondary_colors(), data)
 
     _secondary_colors_cache = None
     _secondary_colors_cache_version = None
@@ -572,7 +670,7 @@ class VertexList(object):
 
     def _set_tex_coords(self, data):
         if self._get_tex_coords() != None:
-            self._get_tex_coords()[:] = data
+            _set_array(self._get_tex_coords(), data)
 
     tex_coords = property(_get_tex_coords, _set_tex_coords,
                           doc='''Array of texture coordinate data.''')
@@ -605,7 +703,7 @@ class VertexList(object):
                 if a > len(data):
                     break
                 elif data[a] != None:
-                    self._tex_coords_cache[a].array[:] = data[a]
+                    _set_array(self._tex_coords_cache[a].array, data[a])
 
     multi_tex_coords = property(_get_multi_tex_coords, _set_multi_tex_coords,
                                 doc='''Multi-array texture coordinate data.''')
@@ -628,7 +726,7 @@ class VertexList(object):
         return region.array
 
     def _set_vertices(self, data):
-        self._get_vertices()[:] = data
+        _set_array(self._get_vertices(), data)
 
     vertices = property(_get_vertices, _set_vertices,
                         doc='''Array of vertex coordinate data.''')
@@ -687,7 +785,10 @@ class IndexedVertexDomain(VertexDomain):
         '''
         start = self._safe_alloc(count)
         index_start = self._safe_index_alloc(index_count)
-        return IndexedVertexList(self, start, count, index_start, index_count)
+        vertex_list = IndexedVertexList(
+            self, start, count, index_start, index_count)
+        self._vertex_lists.add(vertex_list)
+        return vertex_list
 
     def get_index_region(self, start, count):
         '''Get a region of the index buffer.
@@ -705,6 +806,41 @@ class IndexedVertexDomain(VertexDomain):
         ptr_type = ctypes.POINTER(self.index_c_type * count)
         return self.index_buffer.get_region(byte_start, byte_count, ptr_type)
 
+    def defragment(self):
+        '''Move the vertex lists of this domain next to each other at the
+        start of the buffers, and shrink the buffers to fit them.
+
+        Both the vertices and the indices are moved; see
+        `VertexDomain.defragment`.
+        '''
+        super(IndexedVertexDomain, self).defragment()
+
+        vertex_lists = sorted(self._vertex_lists, key=lambda v: v.index_start)
+        new_starts = self.index_allocator.defragment(
+            [(v.index_start, v.index_count) for v in vertex_lists])
+        for vertex_list, new_start in zip(vertex_lists, new_starts):
+            if new_start != vertex_list.index_start:
+                _move_buffer_data(self.index_buffer, self.index_element_size,
+                    vertex_list.index_start, vertex_list.index_count,
+                    new_start)
+                vertex_list.index_start = new_start
+
+        used = (self.index_allocator.capacity -
+                self.index_allocator.get_free_size())
+        capacity = max(_nearest_pow2(used), self._initial_index_count)
+        if capacity < self.index_allocator.capacity:
+            self.index_buffer.resize(capacity * self.index_element_size)
+            self.index_allocator.set_capacity(capacity)
+        self._version += 1
+
+    def get_index_stats(self):
+        '''Return statistics on the use and fragmentation of the index
+        buffer; see `allocation.Allocator.get_stats`.
+
+        :rtype: dict
+        '''
+        return self.index_allocator.get_stats()
+
     def draw(self, mode, vertex_list=None):
         '''Draw vertices in the domain.
 
@@ -806,6 +942,15 @@ class IndexedVertexList(VertexList):
         self.index_count = index_count
         self._indices_cache_version = None
 
+    def _set_start(self, start):
+        # Vertices were moved to start by the domain, change the indices
+        region = self.domain.get_index_region(
+            self.index_start, self.index_count)
+        diff = start - self.start
+        region.array[:] = [i + diff for i in region.array]
+        region.invalidate()
+        self.start = start
+
     def delete(self):
         '''Delete this group.'''
         super(IndexedVertexList, self).delete()
@@ -815,7 +960,7 @@ class IndexedVertexList(VertexList):
         # TODO without region
         region = self.domain.get_index_region(
             self.index_start, self.index_count)
-        region.array[:] = data
+        _set_array(region.array, data)
         region.invalidate()
 
     # ---
@@ -832,7 +977,7 @@ class IndexedVertexList(VertexList):
         return region.array
 
     def _set_indices(self, data):
-        self._get_indices()[:] = data
+        _set_array(self._get_indices(), data)
 
     _indices_cache = None
     _indices_cache_version = None
@@ -150,6 +150,11 @@ from pyglet.window import *
 from pyglet.image import atlas
 from pyglet.compat import asbytes, bytes_type, BytesIO
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class ImageException(Exception):
     pass
 
@@ -1006,6 +1011,54 @@ class ImageData(AbstractImage):
             return self._current_data
 
         self._ensure_string_data()
+        if numpy is not None and self._can_convert_array(format):
+            return self._convert_array(format, pitch)
+        return self._convert_regex(format, pitch)
+
+    def _can_convert_array(self, format):
+        current_pitch = abs(self._current_pitch)
+        if len(self._current_data) < current_pitch * self.height:
+            return False
+        if format != self._current_format:
+            return (len(self._current_format) <= 4 and
+                current_pitch >= self.width * len(self._current_format))
+        return True
+
+    def _convert_array(self, format, pitch):
+        '''Convert with numpy: index the channels of a (height, width,
+        components) view of the rows, then flip and pad or crop the rows.
+        '''
+        current_pitch = self._current_pitch
+        current_format = self._current_format
+        rows = numpy.frombuffer(self._current_data, numpy.uint8,
+            abs(current_pitch) * self.height).reshape(
+                self.height, abs(current_pitch))
+        if format != current_format:
+            # Channels missing from the current format are filled from
+            # the first one, e.g. RGB to RGBA copies R into A.
+            channels = [max(current_format.find(c), 0) for c in format]
+            packed_pitch = self.width * len(current_format)
+            pixels = rows[:, :packed_pitch].reshape(
+                self.height, self.width, len(current_format))
+            rows = pixels[:, :, channels].reshape(
+                self.height, self.width * len(format))
+            # After conversion, rows will always be tightly packed
+            sign_pitch = current_pitch // abs(current_pitch)
+            current_pitch = sign_pitch * (len(format) * self.width)
+
+        if pitch != current_pitch:
+            if current_pitch * pitch < 0:
+                rows = rows[::-1]
+            if abs(pitch) < rows.shape[1]:
+                rows = rows[:, :abs(pitch)]
+            elif abs(pitch) > rows.shape[1]:
+                padded = numpy.zeros((self.height, abs(pitch)), numpy.uint8)
+                padded[:, :rows.shape[1]] = rows
+                rows = padded
+
+        return rows.tobytes()
+
+    def _convert_regex(self, format, pitch):
         data = self._current_data
         current_pitch = self._current_pitch
         current_format = self._current_format
@@ -1788,6 +1841,40 @@ class TextureRegion(Texture):
 
 Texture.region_class = TextureRegion
 
+class _RotatedRegion(TextureRegion):
+    '''Region of a texture atlas holding an image stored rotated 90 degrees
+    clockwise (see `pyglet.image.atlas.TextureAtlas.add`), presented as if
+    it were the unrotated image.
+
+    Regions and transforms of it are taken from the unrotated image, and
+    `get_image_data` returns the unrotated data.
+    '''
+    def __init__(self, stored):
+        super(_RotatedRegion, self).__init__(stored.x, stored.y, stored.z,
+            stored.height, stored.width, stored.owner)
+        self._stored = stored
+        unrotated = stored.get_transform(rotate=270)
+        self.tex_coords = unrotated.tex_coords
+        self.tex_coords_order = unrotated.tex_coords_order
+
+    def get_image_data(self):
+        stored = self._stored
+        data = stored.get_image_data().get_data('RGBA', stored.width * 4)
+        width = stored.height
+        height = stored.width
+        rows = []
+        # Pixel (x, y) of the image is pixel (y, width-1-x) of the stored one.
+        for y in range(height):
+            rows.extend(data[((width - 1 - x) * height + y) * 4:
+                             ((width - 1 - x) * height + y + 1) * 4]
+                        for x in range(width))
+        return ImageData(width, height, 'RGBA', b''.join(rows))
+
+    def get_region(self, x, y, width, height):
+        stored = self._stored
+        return _RotatedRegion(stored.get_region(
+            y, stored.height - x - width, height, width))
+
 class Texture3D(Texture, UniformTextureSequence):
     '''A texture with more than one image slice.
 
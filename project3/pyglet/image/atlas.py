@@ -50,6 +50,16 @@ Example usage::
     boat_texture = bin.add(boat_image)
 
 The result of `TextureBin.add` is a `TextureRegion` containing the image.
+When all the images are known up front, `TextureBin.pack_all` adds them
+largest first, which packs them more tightly.
+
+Images are placed with the strip-based `Allocator` by default.  Atlases can
+use `MaxRectsAllocator` instead, which wastes less space on images of mixed
+sizes and can rotate images to fit them::
+
+    bin = TextureBin(allocator_class=MaxRectsAllocator)
+    regions = bin.pack_all([car_image, boat_image])
+
 Once added, an image cannot be removed from a bin (or an atlas); nor can a
 list of images be obtained from a given bin or atlas -- it is the
 application's responsibility to keep track of the regions returned by the
@@ -168,10 +178,188 @@ class Allocator(object):
         possible_area = self.strips[-1].y2 * self.width
         return 1.0 - self.used_area / float(possible_area)
 
+class MaxRectsAllocator(object):
+    '''Rectangular area allocation using the MaxRects algorithm.
+
+    The allocator keeps the list of maximal free rectangles (overlapping
+    rectangles that together cover the free area), and places each area in
+    the free rectangle it fits most tightly (best short side fit).  It wastes
+    much less space than `Allocator` when areas of mixed sizes are allocated
+    in any order, at the cost of slower allocation.
+
+    Optionally, areas may be placed rotated by 90 degrees; see
+    `alloc_rotated`.
+    '''
+    def __init__(self, width, height, rotate=False):
+        '''Create a `MaxRectsAllocator` of the given size.
+
+        :Parameters:
+            `width` : int
+                Width of the allocation region.
+            `height` : int
+                Height of the allocation region.
+            `rotate` : bool
+                If True, `alloc_rotated` may rotate areas to fit them.
+
+        '''
+        assert width > 0 and height > 0
+        self.width = width
+        self.height = height
+        self.rotate = rotate
+        # List of (x, y, width, height)
+        self.free_rects = [(0, 0, width, height)]
+        self.used_area = 0
+        # Top edge of the allocated areas
+        self.y2 = 0
+
+    def alloc(self, width, height):
+        '''Get a free area in the allocator of the given size.
+
+        After calling `alloc`, the requested area will no longer be used.
+        If there is not enough room to fit the given area `AllocatorException`
+        is raised.
+
+        :Parameters:
+            `width` : int
+                Width of the area to allocate.
+            `height` : int
+                Height of the area to allocate.
+
+        :rtype: int, int
+        :return: The X and Y coordinates of the bottom-left corner of the
+            allocated region.
+        '''
+        x, y, rotated = self._alloc(width, height, False)
+        return x, y
+
+    def alloc_rotated(self, width, height):
+        '''Get a free area in the allocator of the given size, possibly
+        rotated by 90 degrees.
+
+        Areas are only rotated if the allocator was created with ``rotate``,
+        and if the rotated area fits better (or only the rotated area fits).
+        A rotated area is `height` wide and `width` high.
+
+        :Parameters:
+            `width` : int
+                Width of the area to allocate.
+            `height` : int
+                Height of the area to allocate.
+
+        :rtype: int, int, bool
+        :return: The X and Y coordinates of the bottom-left corner of the
+            allocated region, and whether it is rotated.
+        '''
+        return self._alloc(width, height, self.rotate)
+
+    def _alloc(self, width, height, rotate):
+        assert width > 0 and height > 0
+        best = None
+        best_score = None
+        for fx, fy, fw, fh in self.free_rects:
+            if fw >= width and fh >= height:
+                leftover_x = fw - width
+                leftover_y = fh - height
+                score = (min(leftover_x, leftover_y),
+                         max(leftover_x, leftover_y))
+                if best_score is None or score < best_score:
+                    best = fx, fy, False
+                    best_score = score
+            if rotate and fw >= height and fh >= width:
+                leftover_x = fw - height
+                leftover_y = fh - width
+                score = (min(leftover_x, leftover_y),
+                         max(leftover_x, leftover_y))
+                if best_score is None or score < best_score:
+                    best = fx, fy, True
+                    best_score = score
+
+        if best is None:
+            raise AllocatorException('No more space in %r for box %dx%d' % (
+                    self, width, height))
+
+        x, y, rotated = best
+        if rotated:
+            width, height = height, width
+        self._split(x, y, width, height)
+        self.used_area += width * height
+        self.y2 = max(self.y2, y + height)
+        return x, y, rotated
+
+    def _split(self, x, y, width, height):
+        # Replace each free rectangle overlapping the allocated area by its
+        # (up to four) maximal parts outside of it.
+        x2 = x + width
+        y2 = y + height
+        rects = []
+        for rect in self.free_rects:
+            fx, fy, fw, fh = rect
+            fx2 = fx + fw
+            fy2 = fy + fh
+            if x >= fx2 or x2 <= fx or y >= fy2 or y2 <= fy:
+                rects.append(rect)
+                continue
+            if x > fx:
+                rects.append((fx, fy, x - fx, fh))
+            if x2 < fx2:
+                rects.append((x2, fy, fx2 - x2, fh))
+            if y > fy:
+                rects.append((fx, fy, fw, y - fy))
+            if y2 < fy2:
+                rects.append((fx, y2, fw, fy2 - y2))
+
+        # Drop rectangles contained in another one.  Checking them largest
+        # first, a rectangle can only be contained in one kept earlier.
+        rects.sort(key=lambda rect: rect[2] * rect[3], reverse=True)
+        self.free_rects = []
+        for rect in rects:
+            fx, fy, fw, fh = rect
+            for ox, oy, ow, oh in self.free_rects:
+                if (ox <= fx and oy <= fy and
+                        fx + fw <= ox + ow and fy + fh <= oy + oh):
+                    break
+            else:
+                self.free_rects.append(rect)
+
+    def get_usage(self):
+        '''Get the fraction of area already allocated.
+
+        This method is useful for debugging and profiling only.
+
+        :rtype: float
+        '''
+        return self.used_area / float(self.width * self.height)
+
+    def get_fragmentation(self):
+        '''Get the fraction of area below the highest allocated area that
+        is not allocated.
+
+        This method is useful for debugging and profiling only.
+
+        :rtype: float
+        '''
+        if not self.y2:
+            return 0.
+        possible_area = self.y2 * self.width
+        return 1.0 - self.used_area / float(possible_area)
+
+def _rotate_image(img):
+    '''Return the image data of `img` rotated 90 degrees clockwise.'''
+    width = img.width
+    height = img.height
+    data = img.get_image_data().get_data('RGBA', width * 4)
+    rows = []
+    # Row i (from the bottom) of the rotated image is column width-1-i of
+    # the image, bottom to top.
+    for x in range(width - 1, -1, -1):
+        rows.extend(data[(y * width + x) * 4:(y * width + x + 1) * 4]
+                    for y in range(height))
+    return pyglet.image.ImageData(height, width, 'RGBA', b''.join(rows))
+
 class TextureAtlas(object):
     '''Collection of images within a texture.
     '''
-    def __init__(self, width=256, height=256):
+    def __init__(self, width=256, height=256, allocator_class=Allocator):
         '''Create a texture atlas of the given size.
 
         :Parameters:
@@ -179,11 +367,16 @@ class TextureAtlas(object):
                 Width of the underlying texture.
             `height` : int
                 Height of the underlying texture.
+            `allocator_class` : callable
+                Called with `width` and `height` to create the allocator
+                placing the images, for example `MaxRectsAllocator`.  Use
+                ``functools.partial(MaxRectsAllocator, rotate=True)`` to
+                allow images to be rotated in the texture.
 
         '''
         self.texture = pyglet.image.Texture.create(
             width, height, pyglet.gl.GL_RGBA, rectangle=True)
-        self.allocator = Allocator(width, height)
+        self.allocator = allocator_class(width, height)
 
     def add(self, img):
         '''Add an image to the atlas.
@@ -195,6 +388,11 @@ class TextureAtlas(object):
         `AllocatorException` will be raised if there is no room in the atlas
         for the image.
 
+        If the allocator places the image rotated (see
+        `MaxRectsAllocator.alloc_rotated`), the image is stored rotated and
+        the returned region presents it unrotated: its anchor, regions,
+        transforms and `get_image_data` are those of the unrotated image.
+
         :Parameters:
             `img` : `AbstractImage`
                 The image to add.
@@ -202,8 +400,16 @@ class TextureAtlas(object):
         :rtype: `TextureRegion`
         :return: The region of the atlas containing the newly added image.
         '''
-        
-        x, y = self.allocator.alloc(img.width, img.height)
+
+        if getattr(self.allocator, 'rotate', False):
+            x, y, rotated = self.allocator.alloc_rotated(img.width, img.height)
+        else:
+            x, y = self.allocator.alloc(img.width, img.height)
+            rotated = False
+        if rotated:
+            self.texture.blit_into(_rotate_image(img), x, y, 0)
+            region = self.texture.get_region(x, y, img.height, img.width)
+            return pyglet.image._RotatedRegion(region)
         self.texture.blit_into(img, x, y, 0)
         region = self.texture.get_region(x, y, img.width, img.height)
         return region
@@ -214,7 +420,8 @@ class TextureBin(object):
     `TextureBin` maintains a collection of texture atlases, and creates new
     ones as necessary to accommodate images added to the bin.
     '''
-    def __init__(self, texture_width=256, texture_height=256):
+    def __init__(self, texture_width=256, texture_height=256,
+                 allocator_class=Allocator):
         '''Create a texture bin for holding atlases of the given size.
 
         :Parameters:
@@ -222,11 +429,14 @@ class TextureBin(object):
                 Width of texture atlases to create.
             `texture_height` : int
                 Height of texture atlases to create.
+            `allocator_class` : callable
+                Allocator of the atlases; see `TextureAtlas`.
 
         '''
         self.atlases = []
         self.texture_width = texture_width
         self.texture_height = texture_height
+        self.allocator_class = allocator_class
 
     def add(self, img):
         '''Add an image into this texture bin.
@@ -254,6 +464,31 @@ class TextureBin(object):
                 if img.width < 64 and img.height < 64:
                     self.atlases.remove(atlas)
 
-        atlas = TextureAtlas(self.texture_width, self.texture_height)
+        atlas = TextureAtlas(self.texture_width, self.texture_height,
+                             self.allocator_class)
         self.atlases.append(atlas)
         return atlas.add(img)
+
+    def pack_all(self, images):
+        '''Add several images into this texture bin, largest first.
+
+        Allocators pack images more tightly when large images are placed
+        before small ones, so this uses fewer atlases than adding the
+        images in an arbitrary order.
+
+        :Parameters:
+            `images` : list of `AbstractImage`
+                The images to add.
+
+        :rtype: list of `TextureRegion`
+        :return: The regions containing the images, in the order of
+            `images`.
+        '''
+        order = sorted(range(len(images)),
+            key=lambda i: (max(images[i].width, images[i].height),
+                           images[i].width * images[i].height),
+            reverse=True)
+        regions = [None] * len(images)
+        for i in order:
+            regions[i] = self.add(images[i])
+        return regions
@@ -55,7 +55,10 @@ class PNGImageDecoder(ImageDecoder):
     def decode(self, file, filename):
         try:
             reader = pypng.Reader(file=file)
-            width, height, pixels, metadata = reader.asDirect()
+            if pypng.numpy is not None:
+                width, height, pixels, metadata = reader.asDirectArray()
+            else:
+                width, height, pixels, metadata = reader.asDirect()
         except Exception as e:
             raise ImageDecodeException(
                 'PyPNG cannot read %r: %s' % (filename or file, e))
@@ -72,8 +75,13 @@ class PNGImageDecoder(ImageDecoder):
                 format = 'RGB'
         pitch = len(format) * width
 
-        pixels = array.array('BH'[metadata['bitdepth']>8], itertools.chain(*pixels))
-        return ImageData(width, height, format, pixels.tostring(), -pitch)
+        if pypng.numpy is not None:
+            data = pixels.tobytes()
+        else:
+            pixels = array.array('BH'[metadata['bitdepth']>8],
+                                 itertools.chain(*pixels))
+            data = pypng.tostring(pixels)
+        return ImageData(width, height, format, data, -pitch)
 
 class PNGImageEncoder(ImageEncoder):
     def get_file_extensions(self):
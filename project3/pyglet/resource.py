@@ -81,6 +81,36 @@ platforms.
 The default path is ``['.']``.  If you modify the path, you must call
 `reindex`.
 
+Image cache
+^^^^^^^^^^^
+
+Decoding images is often most of an application's startup time.  A loader
+can keep the decoded pixels of the images it loads in a cache directory (see
+`Loader.set_image_cache` and `ImageCache`), so that later runs map them from
+disk instead of decoding the files again::
+
+    pyglet.resource.set_image_cache(
+        os.path.join(pyglet.resource.get_settings_path('MyGame'), 'images'))
+
+Cached images are checked against the modification time and size of their
+file (or its CRC inside a ZIP archive), so edited files are decoded again.
+
+Loading in the background
+^^^^^^^^^^^^^^^^^^^^^^^^^
+
+`Loader.image_async` and `Loader.preload` read and decode images on worker
+threads and return ``concurrent.futures.Future`` objects.  The decoded images
+are uploaded to textures on the main thread by a function scheduled on the
+pyglet clock, which spends at most `Loader.upload_budget` seconds per frame
+doing so; the futures complete (and their callbacks run) on the main thread
+as well.  A loading screen can follow the progress with the `on_progress`
+callback of `preload`::
+
+    def on_progress(loaded, total, name):
+        label.text = 'Loading %d/%d' % (loaded, total)
+
+    pyglet.resource.preload(names, on_progress).add_done_callback(start_game)
+
 :since: pyglet 1.1
 '''
 
@@ -91,6 +121,15 @@ import os
 import weakref
 import sys
 import zipfile
+import hashlib
+import mmap
+import struct
+import tempfile
+import time
+import collections
+import functools
+from ctypes import c_ubyte
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import pyglet
 from pyglet.compat import BytesIO
@@ -201,6 +240,20 @@ class Location(object):
         '''
         raise NotImplementedError('abstract')
 
+    def get_cache_key(self, filename):
+        '''Identify a version of a file at this location, for `ImageCache`.
+
+        :Parameters:
+            `filename` : str
+                The filename to identify.
+
+        :rtype: tuple
+        :return: A tuple ``(source, stamp, size)``: a str naming the file,
+            and two numbers that change when its contents change; or None
+            if this location cannot tell.
+        '''
+        return None
+
 class FileLocation(Location):
     '''Location on the filesystem.
     '''
@@ -216,6 +269,14 @@ class FileLocation(Location):
     def open(self, filename, mode='rb'):
         return open(os.path.join(self.path, filename), mode)
 
+    def get_cache_key(self, filename):
+        path = os.path.abspath(os.path.join(self.path, filename))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return path, stat.st_mtime, stat.st_size
+
 class ZIPLocation(Location):
     '''Location within a ZIP file.
     '''
@@ -242,6 +303,212 @@ class ZIPLocation(Location):
         text = self.zip.read(path)
         return BytesIO(text)
 
+    def get_cache_key(self, filename):
+        if self.dir:
+            path = self.dir + '/' + filename
+        else:
+            path = filename
+        try:
+            info = self.zip.getinfo(path)
+        except KeyError:
+            return None
+        source = '%s:%s' % (os.path.abspath(self.zip.filename), path)
+        return source, info.CRC, info.file_size
+
+class ImageCache(object):
+    '''Directory of decoded images, kept between runs.
+
+    Each image is stored in its own file, named after its source (see
+    `Location.get_cache_key`): a header followed by the pixel rows, bottom
+    row first, in one of the formats OpenGL accepts directly.  Loading an
+    image maps that file into memory, so the pixels can be uploaded to a
+    texture without decoding or converting them.
+
+    Entries whose file has changed since they were stored are ignored and
+    replaced when the image is stored again.
+
+    :Ivariables:
+        `path` : str
+            The cache directory.
+        `hits` : int
+            Number of images loaded from the cache.
+        `misses` : int
+            Number of images not in the cache, or stale.
+        `stores` : int
+            Number of images stored.
+
+    '''
+    _magic = b'PYIC'
+    _version = 1
+    # magic, version, width, height, format, stamp, size
+    _header = struct.Struct('<4sIII4sdq')
+    _extension = '.img'
+
+    #: Formats stored as they are; others are stored as RGBA.
+    formats = ('L', 'LA', 'RGB', 'RGBA')
+
+    def __init__(self, path):
+        '''Create a cache in the given directory, creating it if needed.
+
+        :Parameters:
+            `path` : str
+                Directory to keep the cached images in.
+
+        '''
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def _get_filename(self, source):
+        digest = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest + self._extension)
+
+    def load(self, location, name):
+        '''Load an image from the cache.
+
+        :Parameters:
+            `location` : `Location`
+                Location of the image file.
+            `name` : str
+                Filename of the image.
+
+        :rtype: `pyglet.image.ImageData`
+        :return: The cached image, or None if it is missing or stale.
+        '''
+        key = location.get_cache_key(name)
+        if key is not None:
+            image = self._read(self._get_filename(key[0]), key[1:])
+            if image is not None:
+                self.hits += 1
+                return image
+        self.misses += 1
+        return None
+
+    def _read(self, filename, stamp):
+        header = self._header
+        try:
+            with open(filename, 'rb') as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (IOError, OSError, ValueError):
+            return None
+        if len(data) < header.size:
+            return None
+        magic, version, width, height, format, file_stamp, file_size = \
+            header.unpack_from(data)
+        format = format.rstrip(b'\0').decode('ascii')
+        pitch = width * len(format)
+        if (magic != self._magic or version != self._version or
+                (file_stamp, file_size) != tuple(stamp) or
+                len(data) != header.size + pitch * height):
+            return None
+        pixels = (c_ubyte * (pitch * height)).from_buffer(data, header.size)
+        return pyglet.image.ImageData(width, height, format, pixels, pitch)
+
+    def store(self, location, name, image):
+        '''Store an image in the cache.
+
+        Images that are not `pyglet.image.ImageData` (for example
+        compressed textures), and images from locations that cannot be
+        identified, are not stored.  Errors writing the cache file are
+        ignored; the image is then not stored.
+
+        :Parameters:
+            `location` : `Location`
+                Location of the image file.
+            `name` : str
+                Filename of the image.
+            `image` : `pyglet.image.AbstractImage`
+                The decoded image.
+
+        :rtype: bool
+        :return: True if the image was stored.
+        '''
+        if not isinstance(image, pyglet.image.ImageData):
+            return False
+        key = location.get_cache_key(name)
+        if key is None:
+            return False
+        source, stamp, size = key
+        format = image.format
+        if format not in self.formats:
+            format = 'RGBA'
+        pixels = image.get_data(format, image.width * len(format))
+        filename = self._get_filename(source)
+        temp = None
+        try:
+            # Unique temporary file, so concurrent stores of the same image
+            # cannot clobber each other's partial writes
+            fd, temp = tempfile.mkstemp(suffix='.tmp', dir=self.path)
+            with os.fdopen(fd, 'wb') as file:
+                file.write(self._header.pack(self._magic, self._version,
+                    image.width, image.height, format.encode('ascii'),
+                    stamp, size))
+                file.write(pixels)
+            os.replace(temp, filename)
+        except (IOError, OSError):
+            if temp is not None:
+                try:
+                    os.remove(temp)
+                except (IOError, OSError):
+                    pass
+            return False
+        self.stores += 1
+        return True
+
+    def invalidate(self, location=None, name=None):
+        '''Remove cached images.
+
+        :Parameters:
+            `location` : `Location`
+                Location of the image file to remove, or None to remove
+                every cached image.
+            `name` : str
+                Filename of the image to remove.
+
+        :rtype: int
+        :return: The number of cached images removed.
+        '''
+        if location is None:
+            filenames = [os.path.join(self.path, filename)
+                         for filename in os.listdir(self.path)
+                         if filename.endswith(self._extension)]
+        else:
+            key = location.get_cache_key(name)
+            if key is None:
+                return 0
+            filenames = [self._get_filename(key[0])]
+        removed = 0
+        for filename in filenames:
+            try:
+                os.remove(filename)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def get_stats(self):
+        '''Return statistics on the use of the cache.
+
+        The result is a dict with the keys ``hits``, ``misses`` and
+        ``stores`` (see the instance variables), ``entries`` (number of
+        cached images on disk) and ``size`` (their total size in bytes).
+
+        :rtype: dict
+        '''
+        filenames = [os.path.join(self.path, filename)
+                     for filename in os.listdir(self.path)
+                     if filename.endswith(self._extension)]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'entries': len(filenames),
+            'size': sum(os.path.getsize(filename) for filename in filenames),
+        }
+
 class URLLocation(Location):
     '''Location on the network.
 
@@ -264,6 +531,8 @@ class URLLocation(Location):
         url = urllib.parse.urljoin(self.base, filename)
         return urllib.request.urlopen(url)
 
+_time = getattr(time, 'perf_counter', time.time)
+
 class Loader(object):
     '''Load program resource files from disk.
 
@@ -279,7 +548,15 @@ class Loader(object):
             application script.
 
     '''
-    def __init__(self, path=None, script_home=None):
+    #: Number of threads reading and decoding images for `image_async` and
+    #: `preload`.
+    async_workers = 2
+
+    #: Seconds per frame spent uploading images loaded by `image_async` and
+    #: `preload` to textures.  At least one image is uploaded each frame.
+    upload_budget = 0.004
+
+    def __init__(self, path=None, script_home=None, image_cache=None):
         '''Create a loader for the given path.
 
         If no path is specified it defaults to ``['.']``; that is, just the
@@ -293,6 +570,9 @@ class Loader(object):
             `script_home` : str
                 Base location of relative files.  Defaults to the result of
                 `get_script_home`.
+            `image_cache` : str
+                Directory to cache decoded images in; see
+                `set_image_cache`.
 
         '''
         if path is None:
@@ -308,6 +588,18 @@ class Loader(object):
         # Map bin size to list of atlases
         self._texture_atlas_bins = {}
 
+        self._image_cache = None
+        if image_cache is not None:
+            self.set_image_cache(image_cache)
+
+        # Asynchronous loading: map name to the future of its identity
+        # image, and decoded images waiting to be uploaded, appended by
+        # the worker threads.
+        self._executor = None
+        self._pending_images = {}
+        self._decoded_images = collections.deque()
+        self._uploading = False
+
     def _require_index(self):
         if self._index is None:
             self.reindex()
@@ -454,13 +746,85 @@ class Loader(object):
         file = self.file(name)
         font.add_file(file)
 
-    def _alloc_image(self, name, atlas=True):
+    def set_image_cache(self, path):
+        '''Keep decoded images in a cache directory.
+
+        Images loaded with `image` or `texture` are looked up in the cache
+        first, and stored in it after being decoded.  See `ImageCache`.
+
+        :Parameters:
+            `path` : str
+                The cache directory, created if needed, or None to stop
+                using a cache.
+
+        '''
+        if path is None:
+            self._image_cache = None
+        else:
+            self._image_cache = ImageCache(path)
+
+    def get_image_cache(self):
+        '''Get the image cache in use.
+
+        :rtype: `ImageCache`
+        :return: The cache, or None if images are not cached.
+        '''
+        return self._image_cache
+
+    def invalidate_image_cache(self, name=None):
+        '''Remove images from the image cache.
+
+        Images already loaded are not affected.
+
+        :Parameters:
+            `name` : str
+                Filename of the image to remove, or None to empty the
+                cache.
+
+        :rtype: int
+        :return: The number of cached images removed.
+        '''
+        if self._image_cache is None:
+            return 0
+        if name is None:
+            return self._image_cache.invalidate()
+        return self._image_cache.invalidate(self.location(name), name)
+
+    def get_image_cache_stats(self):
+        '''Return statistics on the use of the image cache.
+
+        This is useful for debugging and profiling only.
+
+        :rtype: dict
+        :return: See `ImageCache.get_stats`, or None if images are not
+            cached.
+        '''
+        if self._image_cache is None:
+            return None
+        return self._image_cache.get_stats()
+
+    def _load_image(self, name):
+        cache = self._image_cache
+        if cache is not None:
+            location = self.location(name)
+            img = cache.load(location, name)
+            if img is not None:
+                return img
+
         file = self.file(name)
         try:
             img = pyglet.image.load(name, file=file)
         finally:
             file.close()
 
+        if cache is not None:
+            cache.store(location, name, img)
+        return img
+
+    def _alloc_image(self, name, atlas=True):
+        return self._pack_image(self._load_image(name), atlas)
+
+    def _pack_image(self, img, atlas=True):
         if not atlas:
             return img.get_texture(True)
 
@@ -515,7 +879,8 @@ class Loader(object):
                 If True, the image will be loaded into an atlas managed by
                 pyglet. If atlas loading is not appropriate for specific
                 texturing reasons (e.g. border control is required) then set
-                this argument to False.
+                this argument to False.  Only the first load of `name`
+                uses it; later loads share the image it made.
 
         :rtype: `Texture`
         :return: A complete texture if the image is large or not in an atlas,
@@ -533,6 +898,163 @@ class Loader(object):
 
         return identity.get_transform(flip_x, flip_y, rotate)
 
+    def image_async(self, name, flip_x=False, flip_y=False, rotate=0,
+                    atlas=True):
+        '''Load an image in the background.
+
+        The image file is read and decoded on a worker thread, and uploaded
+        to a texture on the main thread (see `upload_budget`), after which
+        the returned future completes.  Otherwise this is the same as
+        `image`; loading the same image again returns a texture shared
+        with earlier loads.
+
+        Must be called from the main thread, and the pyglet clock must be
+        ticking (for example by `pyglet.app.run`) for the image to be
+        uploaded.
+
+        :Parameters:
+            `name` : str
+                Filename of the image source to load.
+            `flip_x` : bool
+                If True, the returned image will be flipped horizontally.
+            `flip_y` : bool
+                If True, the returned image will be flipped vertically.
+            `rotate` : int
+                The returned image will be rotated clockwise by the given
+                number of degrees (a multiple of 90).
+            `atlas` : bool
+                If True, the image will be loaded into an atlas managed by
+                pyglet.  As with `image`, the first request for `name`
+                decides this: an image already loaded, or still loading,
+                is shared whatever `atlas` later requests pass.
+
+        :rtype: ``concurrent.futures.Future``
+        :return: A future of the `Texture` or `TextureRegion` that `image`
+            would return.  Its callbacks run on the main thread.
+        '''
+        self._require_index()
+        identity_future = self._get_identity_future(name, atlas)
+        if not rotate and not flip_x and not flip_y:
+            return identity_future
+
+        future = Future()
+        def transform(identity_future):
+            error = identity_future.exception()
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(identity_future.result().get_transform(
+                    flip_x, flip_y, rotate))
+        identity_future.add_done_callback(transform)
+        return future
+
+    def preload(self, names, on_progress=None, atlas=True):
+        '''Load several images in the background.
+
+        Each image is loaded as by `image_async`.
+
+        :Parameters:
+            `names` : list of str
+                Filenames of the image sources to load.
+            `on_progress` : callable
+                Called on the main thread after each image is loaded, with
+                the number of images loaded so far, the number of images
+                and the filename of the image just loaded.
+            `atlas` : bool
+                If True, the images will be loaded into atlases managed by
+                pyglet (unless already loaded or loading, see
+                `image_async`).
+
+        :rtype: ``concurrent.futures.Future``
+        :return: A future of the list of loaded images, in the order of
+            `names`.  If any image fails to load, the future raises the
+            first error once all the images are done.
+        '''
+        names = list(names)
+        futures = [self.image_async(name, atlas=atlas) for name in names]
+        result = Future()
+        loaded = [0]
+        def done(name, image_future):
+            loaded[0] += 1
+            if on_progress is not None:
+                on_progress(loaded[0], len(names), name)
+            if loaded[0] < len(names):
+                return
+            for future in futures:
+                error = future.exception()
+                if error is not None:
+                    result.set_exception(error)
+                    return
+            result.set_result([future.result() for future in futures])
+
+        if not names:
+            result.set_result([])
+        for name, future in zip(names, futures):
+            future.add_done_callback(functools.partial(done, name))
+        return result
+
+    def _get_identity_future(self, name, atlas):
+        # Like `_cached_images`, keyed by name only: the first request
+        # decides `atlas`.
+        try:
+            return self._pending_images[name]
+        except KeyError:
+            pass
+
+        future = Future()
+        try:
+            identity = self._cached_images[name]
+        except KeyError:
+            pass
+        else:
+            future.set_result(identity)
+            return future
+
+        self._pending_images[name] = future
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.async_workers)
+        self._executor.submit(self._decode_image_async, name, atlas, future)
+        if not self._uploading:
+            pyglet.clock.schedule(self._upload_images_async)
+            self._uploading = True
+        return future
+
+    def _decode_image_async(self, name, atlas, future):
+        # Runs on a worker thread; the upload happens on the main thread.
+        try:
+            img = self._load_image(name)
+        except Exception as error:
+            self._decoded_images.append((name, atlas, future, None, error))
+        else:
+            self._decoded_images.append((name, atlas, future, img, None))
+
+    def _upload_images_async(self, dt):
+        start = _time()
+        while self._decoded_images:
+            name, atlas, future, img, error = \
+                self._decoded_images.popleft()
+            if self._pending_images.get(name) is future:
+                del self._pending_images[name]
+            if error is None:
+                try:
+                    # The image may have been loaded with `image` meanwhile.
+                    identity = self._cached_images.get(name)
+                    if identity is None:
+                        identity = self._cached_images[name] = \
+                            self._pack_image(img, atlas)
+                except Exception as upload_error:
+                    error = upload_error
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(identity)
+            if _time() - start >= self.upload_budget:
+                break
+
+        if not self._pending_images and not self._decoded_images:
+            pyglet.clock.unschedule(self._upload_images_async)
+            self._uploading = False
+
     def animation(self, name, flip_x=False, flip_y=False, rotate=0):
         '''Load an animation with optional transformation.
 
@@ -650,8 +1172,7 @@ class Loader(object):
         if name in self._cached_textures:
             return self._cached_textures[name]
 
-        file = self.file(name)
-        texture = pyglet.image.load(name, file=file).get_texture()
+        texture = self._load_image(name).get_texture()
         self._cached_textures[name] = texture
         return texture
 
@@ -730,6 +1251,8 @@ file = _default_loader.file
 location = _default_loader.location
 add_font = _default_loader.add_font
 image = _default_loader.image
+image_async = _default_loader.image_async
+preload = _default_loader.preload
 animation = _default_loader.animation
 get_cached_image_names = _default_loader.get_cached_image_names
 get_cached_animation_names = _default_loader.get_cached_animation_names
@@ -740,3 +1263,7 @@ html = _default_loader.html
 attributed = _default_loader.attributed
 text = _default_loader.text
 get_cached_texture_names = _default_loader.get_cached_texture_names
+set_image_cache = _default_loader.set_image_cache
+get_image_cache = _default_loader.get_image_cache
+invalidate_image_cache = _default_loader.invalidate_image_cache
+get_image_cache_stats = _default_loader.get_image_cache_stats
@@ -3,12 +3,20 @@ from __future__ import division, print_function, absolute_import, unicode_litera
 import math
 import operator
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 def limit(vector, lim):
     """
     limit a vector to a given magnitude
     this is an 'in place' function, modifies the vector supplied.
+    a Vector2Array has every vector limited at once.
     """
-    if abs(vector) > lim:
+    if isinstance(vector, Vector2Array):
+        vector.limit(lim)
+    elif abs(vector) > lim:
         vector.normalize()
         vector *= lim
 
@@ -178,6 +186,66 @@ class Vector2(object):
     def magnitude_squared(self):
         return self.x ** 2 + self.y ** 2
 
+    # In-place operations.  These skip the type checks of the operators,
+    # write into `self` and return it, so they never allocate.
+
+    def set(self, x, y):
+        self.x = x
+        self.y = y
+        return self
+
+    def copy_from(self, other):
+        self.x = other.x
+        self.y = other.y
+        return self
+
+    def add(self, other):
+        self.x += other.x
+        self.y += other.y
+        return self
+
+    def sub(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        return self
+
+    def scale(self, k):
+        self.x *= k
+        self.y *= k
+        return self
+
+    def add_scaled(self, other, k):
+        """ self += other * k """
+        self.x += other.x * k
+        self.y += other.y * k
+        return self
+
+    def sub_into(self, a, b):
+        """ self = a - b """
+        self.x = a.x - b.x
+        self.y = a.y - b.y
+        return self
+
+    def set_normalized_diff(self, a, b):
+        """
+        self = (a - b) normalized.
+        returns the distance between a and b, not self.
+        """
+        x = a.x - b.x
+        y = a.y - b.y
+        d = math.sqrt(x * x + y * y)
+        if d:
+            x /= d
+            y /= d
+        self.x = x
+        self.y = y
+        return d
+
+    def dist_sq_to(self, other):
+        x = self.x - other.x
+        y = self.y - other.y
+        return x * x + y * y
+
     def normalize(self):
         d = self.magnitude()
         if d:
@@ -209,3 +277,165 @@ class Vector2(object):
         if isdeg:
             rot = math.degrees(rot)
         return rot
+
+
+class Vector2Pool(object):
+    """
+    scratch vectors for inner loops.
+    take() hands out zeroed vectors; reset() makes all of them available
+    again, so vectors taken before a reset must not be used after it.
+    """
+
+    def __init__(self, size=16):
+        self._vectors = [Vector2(0, 0) for _ in range(size)]
+        self._next = 0
+
+    def take(self):
+        if self._next == len(self._vectors):
+            self._vectors.append(Vector2(0, 0))
+        v = self._vectors[self._next]
+        self._next += 1
+        v.x = 0
+        v.y = 0
+        return v
+
+    def reset(self):
+        self._next = 0
+
+
+class _Vector2View(Vector2):
+    """
+    a Vector2 that reads and writes one row of a Vector2Array.
+    """
+    __slots__ = ['_row']
+
+    def __init__(self, row):
+        self._row = row
+
+    @property
+    def x(self):
+        return float(self._row[0])
+
+    @x.setter
+    def x(self, value):
+        self._row[0] = value
+
+    @property
+    def y(self):
+        return float(self._row[1])
+
+    @y.setter
+    def y(self, value):
+        self._row[1] = value
+
+    def __copy__(self):
+        return Vector2(self.x, self.y)
+
+    copy = __copy__
+    __pos__ = __copy__
+
+
+class Vector2Array(object):
+    """
+    N 2D vectors stored in an (N, 2) float64 buffer.
+    operations apply to every vector in one call.  an existing (N, 2)
+    float64 ndarray is wrapped without copying, so changes show through.
+    indexing with an int returns a Vector2 view of that row.
+    """
+    __slots__ = ['xy']
+
+    def __init__(self, data):
+        if np is None:
+            raise ImportError('Vector2Array requires numpy')
+        if isinstance(data, int):
+            data = np.zeros((data, 2))
+        elif not (isinstance(data, np.ndarray) and data.dtype == np.float64
+                  and data.ndim == 2 and data.shape[1] == 2):
+            data = np.array(data, dtype=np.float64).reshape(-1, 2)
+        self.xy = data
+
+    def __copy__(self):
+        return self.__class__(self.xy.copy())
+
+    copy = __copy__
+
+    def __repr__(self):
+        return 'Vector2Array(%d)' % len(self.xy)
+
+    def __len__(self):
+        return len(self.xy)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return _Vector2View(self.xy[key])
+        return Vector2Array(self.xy[key])
+
+    def __setitem__(self, key, value):
+        if isinstance(value, Vector2Array):
+            value = value.xy
+        elif isinstance(value, Vector2):
+            value = (value.x, value.y)
+        self.xy[key] = value
+
+    def __iter__(self):
+        for row in self.xy:
+            yield _Vector2View(row)
+
+    @property
+    def x(self):
+        return self.xy[:, 0]
+
+    @property
+    def y(self):
+        return self.xy[:, 1]
+
+    def magnitude(self):
+        return np.sqrt(self.magnitude_squared())
+
+    __abs__ = magnitude
+
+    def magnitude_squared(self):
+        return np.einsum('ij,ij->i', self.xy, self.xy)
+
+    def normalize(self):
+        d = self.magnitude()
+        self.xy /= np.where(d > 0, d, 1)[:, None]
+        return self
+
+    def normalized(self):
+        return self.copy().normalize()
+
+    def dot(self, other):
+        if isinstance(other, Vector2Array):
+            other = other.xy
+        elif isinstance(other, Vector2):
+            other = (other.x, other.y)
+        return np.dot(self.xy, other) if np.ndim(other) == 1 else \
+            np.einsum('ij,ij->i', self.xy, other)
+
+    def cross(self):
+        return Vector2Array(np.column_stack((self.xy[:, 1], -self.xy[:, 0])))
+
+    def reflect(self, normal):
+        # assume normal is normalized
+        if isinstance(normal, Vector2Array):
+            normal = normal.xy
+        elif isinstance(normal, Vector2):
+            normal = np.array((normal.x, normal.y))
+        d = 2 * self.dot(normal)
+        return Vector2Array(self.xy - d[:, None] * normal)
+
+    def rot(self, isdeg=False):
+        rot = np.arctan2(self.xy[:, 1], self.xy[:, 0])
+        if isdeg:
+            rot = np.degrees(rot)
+        return rot
+
+    def limit(self, lim):
+        """
+        limit every vector to a given magnitude, in place.
+        """
+        d = self.magnitude()
+        over = d > lim
+        self.xy[over] *= (lim / d[over])[:, None]
+        return self
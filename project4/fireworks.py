@@ -15,7 +15,8 @@ from pyglet.gl import *
 from pyglet.window import key
 from pyglet.sprite import SpriteGroup
 import pywavefront as wf
-from numpy import array, matrix, copy
+from numpy import array, matrix, copy, zeros, ones, full, where, tile
+from numpy import argsort, count_nonzero, flatnonzero, float32
 from numpy.random import uniform as rand_array
 import random
 import math
@@ -64,122 +65,181 @@ def update_rot():
     offset_l = (rotation_m * offset.T).T.A
 update_rot()
 
-class Particle:
-    """Particle Controller
+class ParticlePool:
+    """Particle state for every firework
 
-    This class controls particles. It computes updates to the particle's state
-    and updates the Vertex List associated with the particle.
+    All particles live in flat arrays: positions and velocities are (N, 3),
+    everything else is (N,). Firework k owns rows [k * size, (k + 1) * size).
+    Every live particle is updated at once with masked array operations.
+
+    Attributes:
+        x      (N x 3): Particle positions
+        vel    (N x 3): Particle velocities
+        life       (N): Remaining life in [0, 1], 0 is dead
+        drag       (N): Drag coefficient (decaying particles only)
+        fade       (N): Seconds it takes to fade out (decaying particles only)
+        decay      (N): Does the particle decay
+        launch     (N): Does the particle use the launch liveness test
+        scale      (N): Particle size
+        rgb    (N x 3): Particle color
     """
-    def __init__(self, img, batch):
-        # Physics
-        self._x    = array([0.0,   0.0, 0.0])
-        self._vel  = array([0.0,   0.0, 0.0])
-        self._grav = array([0.0, -20.0, 0.0])
-
-        # Simulation
-        self._life  = 0.0
-        self._drag  = 0.95
-        self._decay = False
-
-        # Graphics
-        self._rgb     = (1.0, 1.0, 1.0)
-        self._batch = batch
-        self._texture = img.get_texture()
-        self._group = SpriteGroup(self._texture, GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-        self._create_vertex_list()
-        self.callback = None
-        self.is_alive = Particle._is_alive
-
-    def _create_vertex_list(self):
-        self._vertex_list = self._batch.add(4, GL_QUADS, self._group,
-            'v3f', 'c4f', ('t3f', self._texture.tex_coords))
-        self._update_position()
-        self._update_color()
-
-    def init_particle(self, x0, v0, color, is_alive=None, decay=0.0, scale=0.2):
-        """Initialize particle
-        
+
+    _grav = array([0.0, -20.0, 0.0])
+
+    def __init__(self, count):
+        self.x      = zeros((count, 3))
+        self.vel    = zeros((count, 3))
+        self.life   = zeros(count)
+        self.drag   = full(count, 0.95)
+        self.fade   = ones(count)
+        self.decay  = zeros(count, dtype=bool)
+        self.launch = zeros(count, dtype=bool)
+        self.scale  = full(count, 0.2)
+        self.rgb    = ones((count, 3))
+
+    def __len__(self):
+        return len(self.life)
+
+    def init_particles(self, rows, x0, v0, color, launch=False, decay=0.0, scale=0.2):
+        """Initialize particles
+
         Args:
-            x0 (numpy.array 1x3): Initial particle location
-            v0 (numpy.array 1x3): Initial particle velocity
+            rows         (slice): Particles to initialize
+            x0 (numpy.array kx3): Initial particle locations
+            v0 (numpy.array kx3): Initial particle velocities
             color      (3-tuple): RGB Particle color
-            is_alife  (function): Static function used to determine if particle is still alive
-            decay        (float): Rate at which particle decays
-            scale        (float): Size of particle
+            launch        (bool): Particles stay alive while rising fast (launch test)
+            decay        (float): Rate at which particles decay
+            scale        (float): Size of particles
         """
 
-        self._x = x0
-        self._vel = v0
-        self._decay = decay > 0
-        self._life = 1.0
-        self._rgb = color
-        self._scale = scale
-        if self._decay:
-            self._group.blend_dest = GL_DST_ALPHA
-            self._fade = decay
-            self._drag = 0.06 + 0.06 * random.random()
-        else:
-            self._group.blend_dest = GL_ONE_MINUS_SRC_ALPHA
-        if is_alive is not None:
-            self.is_alive = is_alive
-        else:
-            self.is_alive = Particle._is_alive
-    
-    def reset(self):
-        """Reset particle back to initial position"""
-
-        self._life = 0.0
-        self._x    = array([0.0, 0.0, 0.0])
-        self._vel  = array([0.0, 0.0, 0.0])
-        self._update_position()
-        self._update_color()
-
-    def _update_position(self):
-        """Update vertex positions"""
-
-        if self._life > 0: # Particle is alive
-            scale = self._scale
-            if self._decay:
-                scale *= self._life
-            self._vertex_list.vertices[:] = (self._x / unit + offset_l * scale).flatten()
-        else: # Particle is dead, so it is a point
-            self._vertex_list.vertices[:] = (0, 0, 0) * 4
-        
-
-    def _update_color(self):
-        """Update vertex colors, alpha = life"""
+        self.x[rows]      = x0
+        self.vel[rows]    = v0
+        self.life[rows]   = 1.0
+        self.rgb[rows]    = color
+        self.scale[rows]  = scale
+        self.decay[rows]  = decay > 0
+        self.launch[rows] = launch
+        if decay > 0:
+            self.fade[rows] = decay
+            self.drag[rows] = 0.06 + 0.06 * rand_array(size=self.life[rows].shape)
+
+    def reset(self, rows):
+        """Reset particles back to initial position"""
+
+        self.life[rows]   = 0.0
+        self.x[rows]      = 0.0
+        self.vel[rows]    = 0.0
+        self.launch[rows] = False
+
+    def alive(self):
+        """Liveness of every particle
+
+        Launch particles are alive while below the explosion height and
+        still rising fast, every other particle while it has life left.
+        """
 
-        r, g, b = self._rgb
-        self._vertex_list.colors[:] = [r, g, b, self._life] * 4
+        launch_alive = (self.x[:, 1] < 60) & (self.vel[:, 1] > 30)
+        return where(self.launch, launch_alive, self.life > 0.01)
 
     def update(self, dt):
-        """Update particle state
+        """Update every particle
 
         Args:
             dt (float): Time since last update (in seconds)
         """
 
-        if self.is_alive(self._x, self._vel, self._life):
-            # Update position using velocity
-            self._x += self._vel * dt
-            if self._decay:
-                # Apply drag
-                self._vel *= (1 - self._drag * dt)
-                self._life -= dt / self._fade
-            # Apply Gravity
-            self._vel += self._grav * dt
-        else: # Particle is dead
-            self._life = 0.0
-            self.is_alive = Particle._is_alive
-        # Update vertex list
-        self._update_position()
-        self._update_color()
-    
-    @staticmethod
-    def _is_alive(x, vel, life):
-        return life > 0.01
+        alive = self.alive()
+
+        # Dead particles go back to the default liveness test
+        dead = ~alive
+        self.life[dead] = 0.0
+        self.launch[dead] = False
+
+        # Update position using velocity
+        self.x[alive] += self.vel[alive] * dt
+        # Apply drag to decaying particles
+        decaying = alive & self.decay
+        self.vel[decaying] *= (1 - self.drag[decaying] * dt)[:, None]
+        self.life[decaying] -= dt / self.fade[decaying]
+        # Apply Gravity
+        self.vel[alive] += self._grav * dt
 
 
+class ParticleRenderer:
+    """Particle renderer
+
+    This class draws every particle of a ParticlePool from one shared, preallocated
+    vertex buffer. Each frame the quads of all live particles are built at once
+    (billboard expansion of the pool positions) and copied into the buffer with
+    non-decaying particles first, then the buffer is drawn with one call per blend
+    mode straight from client memory.
+    """
+    def __init__(self, pool, img):
+        count = len(pool)
+        self._pool = pool
+        self._texture = img.get_texture()
+
+        # One group per blend mode, they bind the texture and set the blend function
+        self._solid = SpriteGroup(self._texture, GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        self._glow  = SpriteGroup(self._texture, GL_SRC_ALPHA, GL_DST_ALPHA)
+
+        # Vertex buffer, 4 vertices per particle
+        self.vertices   = zeros((count, 4, 3), dtype=float32)
+        self.colors     = zeros((count, 4, 4), dtype=float32)
+        self.tex_coords = tile(array(self._texture.tex_coords, dtype=float32).reshape(4, 3),
+                               (count, 1, 1))
+
+        # Number of non-decaying and decaying particles in the buffer
+        self._solid_count = 0
+        self._glow_count  = 0
+
+    def update(self):
+        """Fill the vertex buffer from the particle state"""
+
+        pool = self._pool
+        live = flatnonzero(pool.life > 0)
+        # Non-decaying particles first (stable, so firework order is kept)
+        live = live[argsort(pool.decay[live], kind='stable')]
+        n = len(live)
+        self._glow_count  = int(count_nonzero(pool.decay[live]))
+        self._solid_count = n - self._glow_count
+
+        life  = pool.life[live]
+        scale = where(pool.decay[live], pool.scale[live] * life, pool.scale[live])
+        self.vertices[:n] = (pool.x[live] / unit)[:, None, :] + offset_l * scale[:, None, None]
+        self.colors[:n, :, :3] = pool.rgb[live][:, None, :]
+        self.colors[:n, :, 3]  = life[:, None]
+
+    def _draw_range(self, group, first, count):
+        """Draw `count` particles of the buffer starting at `first`"""
+
+        if count == 0:
+            return
+        group.set_state()
+        glDrawArrays(GL_QUADS, 4 * first, 4 * count)
+        group.unset_state()
+
+    def draw(self):
+        """Draw every live particle"""
+
+        glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)                # Read straight from the arrays
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, self.vertices.ctypes.data)
+        glColorPointer(4, GL_FLOAT, 0, self.colors.ctypes.data)
+        glTexCoordPointer(3, GL_FLOAT, 0, self.tex_coords.ctypes.data)
+
+        # Launch particles are depth tested, explosions are not
+        self._draw_range(self._solid, 0, self._solid_count)
+        glDisable(GL_DEPTH_TEST)
+        self._draw_range(self._glow, self._solid_count, self._glow_count)
+        glEnable(GL_DEPTH_TEST)
+
+        glPopClientAttrib()
+
 
 class Firework:
     """Firework controller
@@ -200,9 +260,11 @@ class Firework:
     As each particle fades, it "fizzles".
 
     When all the particles have "fizzled", the firework waits one second before self-destructing
+
+    The particles themselves are rows `rows` of a ParticlePool, which updates them.
     """
 
-    def __init__(self, particles):
+    def __init__(self, pool, rows):
         # Generate
         start = array([
             random.uniform(-half_side, half_side),
@@ -228,12 +290,12 @@ class Firework:
         # Choose firework launch color
         color = random.choice(COLORS)
 
-        self.particles = particles
+        self.pool = pool
+        self.rows = rows
         
         # Initalize firework particle (launch)
-        def is_alive(x, vel, life):
-            return x[1] < 60 and vel[1] > 30
-        self.particles[0].init_particle(start, v0, color, is_alive, scale=0.05)
+        first = slice(rows.start, rows.start + 1)
+        self.pool.init_particles(first, start, v0, color, launch=True, scale=0.05)
 
         # Has the firework exploded
         self.exploded = False
@@ -242,40 +304,29 @@ class Firework:
         self.done = False
         self.timeout = -1
     
-    def firework_fizzle(self):
-        """Handle particles finishing the explosion and fading"""
-
-        # Increment number of particles that have faded
-        self.particles_done += 1
-
-        # When all particles have faded, start timeout
-        if self.num_particles == self.particles_done:
-            self.timeout = 2
-    
     def firework_explode(self):
         """Simulate the firework explosion"""
 
-        x   = self.particles[0]._x
-        vel = self.particles[0]._x
+        x   = self.pool.x[self.rows.start]
+        vel = self.pool.x[self.rows.start]
         # Choose a random explosion color
         color = random.choice(COLORS)
         # Firework explodes into 100 particles
         self.num_particles = random.randint(10, Window._max_particles)
-        self.particles_done = 0
         decay = random.uniform(0.4, 1.2)
-        for i in range(self.num_particles):
-            # Generate random particle speed
-            speed = random.uniform(20, 60) / decay
-            # Start at same x position as firework
-            x0 = copy(x)
-            # Initial velocity is random ve
-            vel0 = rand_array(-0.5, 0.5, 3) * speed + vel * 0.35
-            scale = 4 / self.num_particles
-            self.particles[i].init_particle(x0, vel0, color, decay=decay, scale=scale)
+        # Generate random particle speeds
+        speed = rand_array(20, 60, self.num_particles) / decay
+        # Start at same x position as firework
+        x0 = tile(x, (self.num_particles, 1))
+        # Initial velocity is random ve
+        vel0 = rand_array(-0.5, 0.5, (self.num_particles, 3)) * speed[:, None] + vel * 0.35
+        scale = 4 / self.num_particles
+        self.particles = slice(self.rows.start, self.rows.start + self.num_particles)
+        self.pool.init_particles(self.particles, x0, vel0, color, decay=decay, scale=scale)
         self.exploded = True
 
     def update(self, dt):
-        """Update firework state
+        """Update firework state (particles are updated by the pool)
 
         Args:
             dt (float): Time since last update (in seconds)
@@ -284,14 +335,11 @@ class Firework:
         # Firework is still running
         if not self.done:
             if not self.exploded:
-                self.particles[0].update(dt)
-                if self.particles[0]._life <= 0.0:
+                if self.pool.life[self.rows.start] <= 0.0:
                     self.firework_explode()
-            else:
-                for i in range(self.num_particles):
-                    self.particles[i].update(dt)
-                    if self.particles[i]._life <= 0.0:
-                        self.firework_fizzle()
+            elif self.timeout < 0 and (self.pool.life[self.particles] <= 0.0).all():
+                # All particles have faded, start timeout
+                self.timeout = 2
         
         # Timeout has started
         if self.timeout > 1:
@@ -325,17 +373,13 @@ class Window(pyglet.window.Window):
         self.X0 = array([[0.0], [cam_h], [-cam_r]])          # Camera offset
 
         # Initialize particles
-        self.fireworks = [None] * Window._max_fireworks      # List of particle sets
+        self.pool = ParticlePool(                            # State of every particle
+            Window._max_fireworks * Window._max_particles)
+        self.fireworks = [None] * Window._max_fireworks      # Firework controllers
         self.sprite = pyglet.image.load('Particle.png')      # Particle sprite
+        self.renderer = ParticleRenderer(self.pool, self.sprite) # Draws every particle
 
-        for i in range(Window._max_fireworks):
-            batch = pyglet.graphics.Batch()                  # Batch renderer for particle group
-            particles = [                                    # Allocate list of particles
-                Particle(self.sprite, batch)
-                for i in range(Window._max_particles)
-            ]
-            self.fireworks[i] = [batch, particles, None]
-            self.inactive.add(i)
+        self.inactive.update(range(Window._max_fireworks))
         self._setup_lighting()
 
     def _setup_lighting(self):
@@ -379,10 +423,10 @@ class Window(pyglet.window.Window):
         try:
             i = self.inactive.pop()                     # Choose a currently inactive firework
 
-            _, particles, _ = self.fireworks[i]         # Get the list of particles allocated
-                                                        # for the firework
+            rows = slice(i * Window._max_particles,     # Get the rows of the pool allocated
+                         (i + 1) * Window._max_particles) # for the firework
 
-            self.fireworks[i][2] = Firework(particles)  # Create a new firework
+            self.fireworks[i] = Firework(self.pool, rows)  # Create a new firework
             return True
         except Exception as e:                          # Return false in the case of any errors
             return False
@@ -415,16 +459,7 @@ class Window(pyglet.window.Window):
         glDisable(GL_COLOR_MATERIAL)
 
         # Render particles
-        for i in range(Window._max_fireworks):
-            if i not in self.inactive:
-                batch, _, fw = self.fireworks[i]  # Get firework
-
-                # Firework in explosion state does not use depth test
-                if fw.exploded:
-                    glDisable(GL_DEPTH_TEST)
-                batch.draw()                      # Draw firework
-                if fw.exploded:
-                    glEnable(GL_DEPTH_TEST)
+        self.renderer.draw()
 
     def update(self, dt):
         """Update application state
@@ -437,16 +472,19 @@ class Window(pyglet.window.Window):
         global rotation_m
         self.frame += 1
 
+        # Update all particles at once
+        self.pool.update(dt)
+
         # Update all fireworks
         for i in range(Window._max_fireworks):
             if i not in self.inactive:                    # Check to see if firework is active
-                self.fireworks[i][2].update(dt)
+                fw = self.fireworks[i]
+                fw.update(dt)
 
-                if self.fireworks[i][2].done:             # Firework is done, so reset it
-                    for particle in self.fireworks[i][1]: # Reset all particles
-                        particle.reset()
+                if fw.done:                               # Firework is done, so reset it
+                    self.pool.reset(fw.rows)              # Reset all particles
                     self.inactive.add(i)                  # Add to list of inactive fireworks
-                    self.fireworks[i][2] = None           # Delete firework controller
+                    self.fireworks[i] = None              # Delete firework controller
 
         # Randomly spawn fireworks
         if self.frame % random.randint(40, 61) == 1:
@@ -463,6 +501,9 @@ class Window(pyglet.window.Window):
         # Update camera location (rotate around center point)
         self.camera_loc = ((rotation_m * self.X0).T + center).tolist()[0]
 
+        # Build the particle quads for this frame
+        self.renderer.update()
+
     def on_key_release(self, symbol, modifiers):
         """Handle keyboard input
 